@@ -1,40 +1,283 @@
-# ads1115.py
-from machine import I2C, Pin
-import time
-
-ADDR1 = 0x48  # ADDR → GND
-ADDR2 = 0x49  # ADDR → VCC
-
-REG_CONFIG = 0x01
-REG_CONVERSION = 0x00
-
-BASE_CONFIG = (1 << 15) | (1 << 8) | (7 << 5) | 3
-CONFIG_A0_A1 = BASE_CONFIG | (0 << 12)
-CONFIG_A2_A3 = BASE_CONFIG | (3 << 12)
-
-SCALE_VOLT = 6.144 / 32768.0
-
-i2c = I2C(0, scl=Pin(5), sda=Pin(4), freq=400000)
-
-def write_config(addr, config):
-    buf = bytearray([REG_CONFIG, (config >> 8) & 0xFF, config & 0xFF])
-    i2c.writeto(addr, buf)
-
-def read_voltage(addr):
-    buf = bytearray(2)
-    i2c.readfrom_mem_into(addr, REG_CONVERSION, buf)
-    raw = (buf[0] << 8) | buf[1]
-    if raw & 0x8000:
-        raw -= 65536
-    return raw * SCALE_VOLT
-
-def read_all_channels():
-    write_config(ADDR1, CONFIG_A0_A1); time.sleep_ms(2)
-    v1_01 = read_voltage(ADDR1)
-    write_config(ADDR1, CONFIG_A2_A3); time.sleep_ms(2)
-    v1_23 = read_voltage(ADDR1)
-    write_config(ADDR2, CONFIG_A0_A1); time.sleep_ms(2)
-    v2_01 = read_voltage(ADDR2)
-    write_config(ADDR2, CONFIG_A2_A3); time.sleep_ms(2)
-    v2_23 = read_voltage(ADDR2)
-    return [v1_01, v1_23, v2_01, v2_23]
\ No newline at end of file
+# ads1115.py
+from machine import I2C, Pin
+import ticks
+
+ADDR1 = 0x48  # ADDR → GND
+ADDR2 = 0x49  # ADDR → VCC
+
+REG_CONFIG = 0x01
+REG_CONVERSION = 0x00
+REG_LO_THRESH = 0x02
+REG_HI_THRESH = 0x03
+
+OS_READY = 1 << 15     # в регистре конфигурации: 1 — преобразование завершено
+COMP_QUE_MASK = 3      # 11 — компаратор и ALERT/RDY выключены
+
+BASE_CONFIG = (1 << 15) | (1 << 8) | (7 << 5) | 3
+CONFIG_A0_A1 = BASE_CONFIG | (0 << 12)
+CONFIG_A2_A3 = BASE_CONFIG | (3 << 12)
+
+# Каналы по умолчанию: (адрес, MUX) — две пары на каждой из двух микросхем
+DEFAULT_CHANNELS = ((ADDR1, 0), (ADDR1, 3), (ADDR2, 0), (ADDR2, 3))
+
+def mux_config(mux):
+    """Слово конфигурации однократного преобразования пары mux (0..7)."""
+    return BASE_CONFIG | ((mux & 7) << 12)
+
+SCALE_VOLT = 6.144 / 32768.0
+
+# Частота преобразований по полю DR (биты 7:5)
+DR_SPS = (8, 16, 32, 64, 128, 250, 475, 860)
+
+MAX_AGE_MS = 500  # старше — отсчёт устарел, read_all_channels() возвращает None
+CHIP_TIMEOUTS = 3 # таймаутов подряд — микросхема не задерживает отсчёт, её каналы None
+
+i2c = I2C(0, scl=Pin(5), sda=Pin(4), freq=400000)
+
+# Буферы обмена выделены один раз — в цикле опроса куча не трогается
+_wbuf = bytearray(3)
+_rbuf = bytearray(2)
+
+def write_config(addr, config):
+    buf = _wbuf
+    buf[0] = REG_CONFIG
+    buf[1] = (config >> 8) & 0xFF
+    buf[2] = config & 0xFF
+    i2c.writeto(addr, buf)
+
+def read_voltage(addr):
+    buf = _rbuf
+    i2c.readfrom_mem_into(addr, REG_CONVERSION, buf)
+    raw = (buf[0] << 8) | buf[1]
+    if raw & 0x8000:
+        raw -= 65536
+    return raw * SCALE_VOLT
+
+def conversion_ms(config):
+    """Время одного преобразования (мс) с запасом на разброс генератора АЦП."""
+    return 1000 // DR_SPS[(config >> 5) & 7] + 1
+
+class Acquisition:
+    """
+    Неблокирующий опрос нескольких ADS1115 на общей шине I2C по карте
+    каналов: channels — последовательность (адрес, MUX), номер в ней —
+    номер канала в values. Микросхемы преобразуют параллельно, каждая
+    обходит свои пары; готовность определяется по биту OS регистра
+    конфигурации или по выводу ALERT/RDY (rdy_pins: адрес → Pin).
+    poll() продвигает автоматы и ничего не ждёт; после обхода всех пар
+    публикуется отсчёт values со временем stamp (ticks_ms) и номером seq,
+    layout — карта, которой соответствует опубликованный отсчёт (channels —
+    карта, по которой идут преобразования сейчас).
+    Микросхема, не ответившая CHIP_TIMEOUTS раз подряд, отсчёт не задерживает:
+    её каналы в нём — None (dropouts — такие случаи по микросхемам), опрос
+    её продолжается, и первое же преобразование возвращает её в обход.
+    Пара может преобразовываться серией из oversample раз (set_rate) —
+    в отсчёт идёт среднее серии. pipeline(acq), если задан, получает каждый
+    отсчёт и пишет обработанные значения в filtered (иначе — копия values).
+    """
+
+    def __init__(self, bus, channels=DEFAULT_CHANNELS, rdy_pins=None):
+        self.bus = bus
+        self.rdy_pins = rdy_pins or {}
+        self.values = []          # последний полный отсчёт (вольты)
+        self.filtered = []        # он же после pipeline
+        self.layout = ()
+        self.pipeline = None
+        self.stamp = 0            # ticks_ms публикации
+        self.seq = 0              # 0 — отсчёта ещё не было
+        self.errors = 0           # ошибки шины и таймауты
+        self.running = False
+        self._wbuf = bytearray(3)
+        self._rbuf = bytearray(2)
+        self.configure(channels)
+
+    def configure(self, channels):
+        """
+        Новая карта каналов. Преобразования перезапускаются сразу; values и
+        layout остаются прежними до первого отсчёта по новой карте.
+        """
+        channels = tuple((addr, mux) for addr, mux in channels)
+        self.addrs = []
+        self.slots = []           # по микросхемам: номера каналов в порядке обхода
+        for slot, (addr, mux) in enumerate(channels):
+            if addr not in self.addrs:
+                self.addrs.append(addr)
+                self.slots.append([])
+            self.slots[self.addrs.index(addr)].append(slot)
+        # С выводом RDY компаратор включается (COMP_QUE = 00)
+        self.configs = [mux_config(mux) & ~COMP_QUE_MASK if self.rdy_pins.get(addr) is not None
+                        else mux_config(mux) for addr, mux in channels]
+        n = len(channels)
+        self.oversample = [1] * n # преобразований на отсчёт по каналам
+        self.channels = channels
+        self._pending = [0] * n    # сумма кодов серии (целые — без float в куче)
+        self._count = [0] * n
+        chips = len(self.addrs)
+        self._pins = [self.rdy_pins.get(addr) for addr in self.addrs]
+        self._mux = [0] * chips
+        self._busy = [False] * chips
+        self._started = [0] * chips
+        self._timeouts = [0] * chips  # таймаутов подряд по микросхемам
+        self.dropouts = [0] * chips   # сколько раз микросхема выпадала из обхода
+        self._update_timeout()
+        if self.running:
+            self.running = False  # следующий poll() начнёт обход заново
+
+    def _update_timeout(self):
+        self._timeout_ms = 2 * max([conversion_ms(c) for c in self.configs] or [0]) + 2
+
+    def set_rate(self, slot, sps=128, oversample=1):
+        """Частота преобразований канала slot (номер в values) и длина серии на отсчёт."""
+        cfg = self.configs[slot]
+        self.configs[slot] = (cfg & ~(7 << 5)) | (DR_SPS.index(sps) << 5)
+        self.oversample[slot] = oversample
+        self._update_timeout()
+
+    def start(self):
+        for chip, pin in enumerate(self._pins):
+            if pin is not None:
+                # Hi_thresh MSB = 1, Lo_thresh MSB = 0 → ALERT/RDY = «готово»
+                self._write_reg(self.addrs[chip], REG_HI_THRESH, 0x8000)
+                self._write_reg(self.addrs[chip], REG_LO_THRESH, 0x0000)
+            self._mux[chip] = 0
+            self._start(chip)
+        self.running = True
+
+    def _write_reg(self, addr, reg, value):
+        buf = self._wbuf
+        buf[0] = reg
+        buf[1] = (value >> 8) & 0xFF
+        buf[2] = value & 0xFF
+        try:
+            self.bus.writeto(addr, buf)
+        except OSError:
+            self.errors += 1
+
+    def _start(self, chip):
+        self._write_reg(self.addrs[chip], REG_CONFIG, self.configs[self.slots[chip][self._mux[chip]]])
+        self._busy[chip] = True
+        self._started[chip] = ticks.ticks_ms()
+
+    def _ready(self, chip):
+        pin = self._pins[chip]
+        if pin is not None:
+            return pin.value() == 0
+        buf = self._rbuf
+        self.bus.readfrom_mem_into(self.addrs[chip], REG_CONFIG, buf)
+        return buf[0] & 0x80
+
+    def _read(self, chip):
+        """Код преобразования (со знаком); в вольты переводится при публикации."""
+        buf = self._rbuf
+        self.bus.readfrom_mem_into(self.addrs[chip], REG_CONVERSION, buf)
+        raw = (buf[0] << 8) | buf[1]
+        if raw & 0x8000:
+            raw -= 65536
+        return raw
+
+    def poll(self):
+        """Один неблокирующий шаг. Возвращает True, если опубликован новый отсчёт."""
+        if not self.running:
+            self.start()
+            return False
+        busy = False
+        for chip in range(len(self.addrs)):
+            if not self._busy[chip]:
+                continue
+            try:
+                ready = self._ready(chip)
+                if ready:
+                    slot = self.slots[chip][self._mux[chip]]
+                    self._pending[slot] += self._read(chip)
+                    self._count[slot] += 1
+            except OSError:
+                self.errors += 1
+                ready = False
+            if not ready:
+                if ticks.ticks_diff(ticks.ticks_ms(), self._started[chip]) > self._timeout_ms:
+                    self.errors += 1
+                    self._timeouts[chip] += 1
+                    if self._timeouts[chip] == CHIP_TIMEOUTS:
+                        self.dropouts[chip] += 1
+                    self._start(chip)  # повторяем ту же пару
+                if self._timeouts[chip] < CHIP_TIMEOUTS:
+                    busy = True    # остальные микросхемы отсчёт без неё не ждут
+                continue
+            self._timeouts[chip] = 0
+            if self._count[slot] < self.oversample[slot]:
+                self._start(chip)  # серия: та же пара ещё раз
+                busy = True
+                continue
+            self._mux[chip] += 1
+            if self._mux[chip] < len(self.slots[chip]):
+                self._start(chip)
+                busy = True
+            else:
+                self._busy[chip] = False
+        if busy:
+            return False
+        # Все пары отвечающих микросхем прочитаны — публикуем и начинаем заново;
+        # каналы без преобразований в этом обходе (выпавшая микросхема) — None
+        pending, count = self._pending, self._count
+        if self.layout is not self.channels:
+            # Первый отсчёт по новой карте каналов
+            self.values = [0.0] * len(pending)
+            self.filtered = [0.0] * len(pending)
+            self.layout = self.channels
+        values = self.values
+        for i in range(len(values)):
+            values[i] = pending[i] * SCALE_VOLT / count[i] if count[i] else None
+            pending[i] = 0
+            count[i] = 0
+        self.stamp = ticks.ticks_ms()
+        self.seq += 1
+        if self.pipeline is None:
+            filtered = self.filtered
+            for i in range(len(values)):
+                filtered[i] = values[i]
+        else:
+            self.pipeline(self)
+        for chip in range(len(self.addrs)):
+            if self._busy[chip]:
+                continue   # выпавшая микросхема дожидается своего преобразования
+            self._mux[chip] = 0
+            self._start(chip)
+        return True
+
+    def age_ms(self):
+        return ticks.ticks_diff(ticks.ticks_ms(), self.stamp) if self.seq else None
+
+    def read_blocking(self, timeout_ms=200):
+        """Ждёт следующий полный отсчёт (для вызовов вне основного цикла)."""
+        seq = self.seq
+        t0 = ticks.ticks_ms()
+        while self.seq == seq:
+            self.poll()
+            if ticks.ticks_diff(ticks.ticks_ms(), t0) > timeout_ms:
+                raise OSError("ADS1115 timeout")
+            if self.seq == seq:
+                ticks.sleep_ms(1)
+        return self.values
+
+engine = Acquisition(i2c)
+
+def latest():
+    """Последний опубликованный отсчёт: (сырые вольты, после фильтров, ticks_ms, номер)."""
+    return engine.values, engine.filtered, engine.stamp, engine.seq
+
+def read_all_channels(out=None):
+    """
+    Отфильтрованные напряжения всех пар (без фильтров совпадают с сырыми).
+    out — заранее выделенный список той же длины: значения копируются в него
+    (после смены карты каналов — сколько поместится). Шину не ждёт: если
+    отсчёта ещё не было или он старше MAX_AGE_MS (АЦП не отвечает), — None.
+    """
+    age = engine.age_ms()
+    if age is None or age > MAX_AGE_MS:
+        return None
+    if out is None:
+        return list(engine.filtered)
+    filtered = engine.filtered
+    for i in range(min(len(filtered), len(out))):
+        out[i] = filtered[i]
+    return out
@@ -1,130 +1,463 @@
-# air_pressure_controller.py
-import time
-from ads1115 import read_all_channels
-from modbus_relay import set_relay
-from config_manager import load_config
-
-# Глобальные переменные ПИД
-_last_control_time = 0
-_integral = 0.0
-_last_error = 0.0
-
-def apply_calibration(raw_voltages, config):
-    """
-    Применяет калибровку ко всем 4 каналам.
-    Возвращает словарь с физическими значениями.
-    """
-    def v2y(v, key):
-        ch = config[key]
-        vmin, vmax = ch["v_min"], ch["v_max"]
-        ymin, ymax = ch["y_min"], ch["y_max"]
-        if vmax == vmin:
-            return ymin
-        return (ymax - ymin) / (vmax - vmin) * (v - vmin) + ymin
-
-    return {
-        "o2_1": v2y(raw_voltages[0], "ch0"),
-        "o2_2": v2y(raw_voltages[1], "ch1"),
-        "gas_flow": v2y(raw_voltages[2], "ch2"),
-        "air_pressure": v2y(raw_voltages[3], "ch3"),
-        "o2_avg": (v2y(raw_voltages[0], "ch0") + v2y(raw_voltages[1], "ch1")) / 2.0
-    }
-
-def linear_interpolate(x, table):
-    """Интерполяция по таблице: список словарей с 'gas' и 'air_target'"""
-    if not table:
-        return 0.0
-    if x <= table[0]["gas"]:
-        return table[0]["air_target"]
-    if x >= table[-1]["gas"]:
-        return table[-1]["air_target"]
-    for i in range(len(table) - 1):
-        x0, y0 = table[i]["gas"], table[i]["air_target"]
-        x1, y1 = table[i+1]["gas"], table[i+1]["air_target"]
-        if x0 <= x <= x1:
-            return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
-    return table[-1]["air_target"]
-
-def run_automatic_control():
-    global _last_control_time, _integral, _last_error
-    cfg = load_config()
-    pid = cfg.get("pid_control", {})
-    
-    if not pid.get("enabled", False):
-        return {"status": "disabled"}
-
-    now = time.time()
-    interval = pid.get("control_interval", 10)
-    if now - _last_control_time < interval:
-        return None
-
-    # === ЧИТАЕМ СЫРЫЕ НАПРЯЖЕНИЯ ===
-    raw_voltages = read_all_channels()
-
-    # === ПРИМЕНЯЕМ КАЛИБРОВКУ — ПОЛУЧАЕМ ФИЗИЧЕСКИЕ ЗНАЧЕНИЯ ===
-    values = apply_calibration(raw_voltages, cfg)
-    o2 = values["o2_avg"]
-    gas = values["gas_flow"]
-    pressure = values["air_pressure"]
-
-    if None in (o2, gas, pressure):
-        return {"error": "Invalid sensor data"}
-
-    # === Уровень 1: базовое целевое давление по таблице ===
-    air_target_base = linear_interpolate(gas, cfg.get("air_fuel_table", []))
-
-    # Безопасность
-    min_p = pid.get("pressure_min_safe", 0.5)
-    max_p = pid.get("pressure_max_safe", 9.0)
-    if pressure < min_p or pressure > max_p:
-        return {"warning": f"Pressure out of safe range: {pressure:.2f}"}
-
-    # === Уровень 2: ПИД-коррекция по O2 ===
-    o2_setpoint = pid.get("o2_setpoint", 3.5)
-    error = o2_setpoint - o2  # (+) → мало O2 → нужно больше воздуха
-
-    deadband = pid.get("deadband", 0.1)
-    if abs(error) <= deadband:
-        correction = 0.0
-        _integral = 0.0
-        _last_error = 0.0
-        action = "HOLD"
-    else:
-        dt = interval
-        _integral += error * dt
-        derivative = (error - _last_error) / dt if _last_error is not None else 0.0
-
-        Kp = pid.get("Kp", 0.8)
-        Ki = pid.get("Ki", 0.02)
-        Kd = pid.get("Kd", 0.1)
-
-        pid_output = Kp * error + Ki * _integral + Kd * derivative
-        max_corr = pid.get("max_correction", 0.8)
-        correction = max(-max_corr, min(max_corr, pid_output))
-
-        _last_error = error
-
-        # Управление реле (РЕЛЕ 1 = МЕНЬШЕ, РЕЛЕ 2 = БОЛЬШЕ)
-        if correction > 0.1:
-            # Нужно УВЕЛИЧИТЬ давление → включаем РЕЛЕ 2 ("больше")
-            set_relay(4, True)   # ← было 1, стало 2
-            time.sleep(pid.get("impulse_duration", 1.5))
-            set_relay(4, False)
-            action = "UP"
-        elif correction < -0.1:
-            # Нужно УМЕНЬШИТЬ давление → включаем РЕЛЕ 1 ("меньше")
-            set_relay(3, True)   # ← было 2, стало 1
-            time.sleep(pid.get("impulse_duration", 1.5))
-            set_relay(3, False)
-            action = "DOWN"
-
-    _last_control_time = now
-    return {
-        "gas_flow": round(gas, 1),
-        "air_target_base": round(air_target_base, 2),
-        "air_pressure": round(pressure, 2),
-        "o2_avg": round(o2, 2),
-        "error": round(error, 2),
-        "correction": round(correction, 2) if 'correction' in locals() else 0.0,
-        "action": action
-    }
\ No newline at end of file
+# air_pressure_controller.py
+import ticks
+from ads1115 import engine, read_all_channels
+from modbus_relay import set_relay, relay
+from config_manager import load_config, config_generation
+import calibration
+import autotune
+
+class ControlTimer:
+    """
+    Сроки шагов регулятора по ticks_ms с фиксированным шагом: следующий срок —
+    предыдущий срок + интервал, а не «момент шага + интервал», поэтому
+    задержки не накапливаются. Шаг, начатый позже следующего срока,
+    считается просроченным (overruns); пропущенные сроки не догоняются.
+    """
+
+    def __init__(self):
+        self.steps = 0
+        self.overruns = 0
+        self.max_late_ms = 0
+        self.reset()
+
+    def reset(self):
+        """Следующий due() — сразу, отсчёт dt заново."""
+        self.deadline = None
+        self.last = None
+
+    def ready(self):
+        """Срок наступил (или отсчёт ещё не начат) — без учёта шага."""
+        return self.deadline is None or ticks.ticks_diff(ticks.ticks_ms(), self.deadline) >= 0
+
+    def due(self, interval_ms):
+        """Фактический интервал (мс) с прошлого шага, если срок наступил, иначе None."""
+        now = ticks.ticks_ms()
+        if self.deadline is None:
+            self.deadline = now
+        late = ticks.ticks_diff(now, self.deadline)
+        if late < 0:
+            return None
+        if late > self.max_late_ms:
+            self.max_late_ms = late
+        self.deadline = ticks.ticks_add(self.deadline, interval_ms)
+        if ticks.ticks_diff(now, self.deadline) >= 0:
+            self.overruns += 1
+            self.deadline = ticks.ticks_add(now, interval_ms)
+        dt = interval_ms if self.last is None else ticks.ticks_diff(now, self.last)
+        self.last = now
+        self.steps += 1
+        return dt
+
+class PID:
+    """
+    ПИД по O2 с коэффициентами из секции pid_control.
+    Интеграл не копится, пока выход упирается в max_correction в сторону
+    ошибки (условное интегрирование). Производная берётся по измерению,
+    а не по ошибке (смена уставки не даёт толчка), и сглаживается фильтром
+    первого порядка с постоянной d_filter (с).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Начальное состояние: первый шаг без производной и с нулевым интегралом."""
+        self.integral = 0.0
+        self.derivative = 0.0
+        self.last_pv = None
+        self.output = 0.0
+
+    def preset(self, output, pid):
+        """Безударный переход: выход output за счёт интеграла, без истории производной."""
+        self.reset()
+        Ki = pid.get("Ki", 0.005)
+        if Ki:
+            self.integral = output / Ki
+        self.output = output
+
+    def hold(self, pv, dt):
+        """Шаг в зоне нечувствительности: выход и интеграл не меняются, производная следит."""
+        self._derivative(pv, dt, 0.0)
+        return self.output
+
+    def _derivative(self, pv, dt, d_filter):
+        if self.last_pv is None or dt <= 0:
+            self.derivative = 0.0
+        else:
+            raw = (self.last_pv - pv) / dt  # −d(pv)/dt: знак как у производной ошибки
+            alpha = dt / (d_filter + dt) if d_filter > 0 else 1.0
+            self.derivative += (raw - self.derivative) * alpha
+        self.last_pv = pv
+
+    def update(self, setpoint, pv, dt, pid):
+        self._derivative(pv, dt, pid.get("d_filter", 2.0))
+        error = setpoint - pv
+        Kp = pid.get("Kp", 0.1)
+        Ki = pid.get("Ki", 0.005)
+        Kd = pid.get("Kd", 0.0)
+        limit = pid.get("max_correction", 0.8)
+        pd = Kp * error + Kd * self.derivative
+        integral = self.integral + error * dt
+        output = pd + Ki * integral
+        if (output > limit and error > 0) or (output < -limit and error < 0):
+            integral = self.integral  # насыщение — интеграл не растёт дальше
+            output = pd + Ki * integral
+        self.integral = integral
+        self.output = max(-limit, min(limit, output))
+        return self.output
+
+class Actuator:
+    """
+    Исполнительный механизм постоянной скорости на реле «меньше»/«больше»:
+    импульс пропорционален нужному перемещению (доля диапазона давления ×
+    время полного хода × pulse_gain) в пределах min_pulse..max_pulse.
+    При смене направления добавляется выбор люфта backlash. Следующий
+    импульс — не раньше, чем через pressure_settle после окончания текущего.
+    """
+
+    def __init__(self, less=3, more=4):
+        self.less = less       # реле «меньше»
+        self.more = more       # реле «больше»
+        self.pulses = 0
+        self.reset()
+
+    def reset(self):
+        self.direction = 0     # направление последнего импульса: +1 больше, −1 меньше
+        self.busy_until = None # ticks_ms, до которого механизм движется и давление успокаивается
+
+    def busy(self):
+        return self.busy_until is not None and ticks.ticks_diff(self.busy_until, ticks.ticks_ms()) > 0
+
+    def pulse_time(self, error, span, pid):
+        """Длительность импульса (с) для ошибки давления error при диапазоне span."""
+        stroke = pid.get("full_stroke", 30.0)
+        seconds = abs(error) / span * stroke * pid.get("pulse_gain", 1.0) if span else 0.0
+        seconds = max(pid.get("min_pulse", 0.2), min(pid.get("max_pulse", 5.0), seconds))
+        direction = 1 if error > 0 else -1
+        if self.direction and direction != self.direction:
+            seconds += pid.get("backlash", 0.0)
+        return seconds
+
+    def move(self, pulse, error, seconds, settle):
+        direction = 1 if error > 0 else -1
+        self.direction = direction
+        self.pulses += 1
+        self.busy_until = ticks.ticks_add(ticks.ticks_ms(), int((seconds + settle) * 1000))
+        pulse(self.more if direction > 0 else self.less, seconds)
+
+class Loop:
+    """
+    Контур регулирования из секции "loops": величины O2, газа и давления
+    (по карте каналов), секция ПИД, таблица газ/воздух и пара реле.
+    У каждого контура свои сроки, ПИД, механизм и словари результата.
+    """
+
+    def __init__(self, spec):
+        self.timer = ControlTimer()           # внешний контур: O2, control_interval
+        self.pressure_timer = ControlTimer()  # внутренний контур: давление, pressure_interval
+        self.pid = PID()
+        self.actuator = Actuator()
+        self.last_result = None
+        self._tuning = False   # на прошлом шаге поправку задавала автонастройка
+        self._resume = False   # контур был выключен: поправка — от текущего давления
+        # Два словаря результата попеременно (новый сравнивается с прошлым)
+        self._results = ({}, {})
+        self._flip = 0
+        self._unsafe = {"warning": "Pressure out of safe range", "air_pressure": 0.0}
+        self.configure(spec)
+
+    def configure(self, spec):
+        self.name = spec["name"]
+        self.section = spec["pid"]
+        self.table = spec["table"]
+        self.o2 = spec["o2"]
+        self.gas = spec["gas"]
+        self.pressure = spec["pressure"]
+        self.actuator.less = spec["relay_less"]
+        self.actuator.more = spec["relay_more"]
+
+    def reset(self):
+        self.timer.reset()
+        self.pressure_timer.reset()
+        self.pid.reset()
+        self.actuator.reset()
+        self.last_result = None
+        self._tuning = False
+
+    def step(self, cfg, pulse):
+        """
+        Каскад: внешний контур (ПИД по O2, раз в control_interval) даёт поправку
+        к базовому давлению из таблицы газ/воздух, внутренний (раз в
+        pressure_interval) ведёт давление воздуха к сумме импульсами,
+        пропорциональными ошибке давления.
+        """
+        pid = cfg[self.section]  # секцию проверяет check_loops
+        tuner = autotune.tuner
+        tuning = tuner.loop == self.name
+        if not pid.get("enabled", False):
+            if tuning:
+                tuner.abort("controller disabled")
+            # Безударное включение: первый шаг после включения — сразу,
+            # без производной, накопленного интеграла и dt за время простоя
+            self.timer.reset()
+            self.pressure_timer.reset()
+            self.pid.reset()
+            self._tuning = False
+            self._resume = True
+            return _DISABLED
+
+        # Сроки контуров независимы: O2 — раз в control_interval, давление — раз
+        # в pressure_interval; шаг — когда наступил хотя бы один из них
+        pressure_step = self.pressure_timer.due(int(pid.get("pressure_interval", 2.0) * 1000)) is not None
+        o2_step = self.timer.ready()
+        if not pressure_step and not o2_step:
+            return None
+
+        # === ЧИТАЕМ НАПРЯЖЕНИЯ (ПОСЛЕ ФИЛЬТРОВ) И ПРИМЕНЯЕМ КАЛИБРОВКУ ===
+        cal = calibration.compiled(cfg)
+        values = _sample(cal)
+        if values is None:
+            return None  # отсчёт ещё по прежней карте каналов
+        o2 = values.get(self.o2)
+        gas = values.get(self.gas)
+        pressure = values.get(self.pressure)
+
+        if o2 is None or gas is None or pressure is None:
+            self.pid.reset()
+            return _INVALID
+
+        # === Уровень 1: базовое целевое давление по таблице ===
+        air_target_base = cal.curves[self.table](gas)
+
+        # Безопасность
+        min_p = pid.get("pressure_min_safe", 0.5)
+        max_p = pid.get("pressure_max_safe", 9.0)
+        if pressure < min_p or pressure > max_p:
+            if tuning:
+                tuner.abort("pressure out of safe range")
+            self.pid.reset()
+            self.timer.reset()
+            self._tuning = False
+            self._unsafe["air_pressure"] = round(pressure, 2)
+            return self._unsafe
+
+        # === Уровень 2: ПИД-коррекция по O2 (внешний контур) ===
+        o2_pid = self.pid
+        if self._resume:
+            # Безударное включение: ПИД начинает с поправки, при которой оператор
+            # держал давление, а не с нуля
+            limit = pid.get("max_correction", 0.8)
+            o2_pid.preset(max(-limit, min(limit, pressure - air_target_base)), pid)
+            self._resume = False
+        o2_setpoint = pid.get("o2_setpoint", 3.5)
+        error = o2_setpoint - o2  # (+) → мало O2 → нужно больше воздуха
+        mode = "pid"
+        if tuning and tuner.running:
+            # Релейный опыт: поправку задаёт автонастройка, ПИД ждёт
+            trim = tuner.step(error, o2)
+            if trim is not None:
+                o2_pid.output = trim
+                mode = "autotune"
+        if self._tuning and mode != "autotune":
+            # Любой выход из опыта (готово, таймаут, стоп из веб-интерфейса):
+            # ПИД продолжает с поправки bias (и, возможно, с новыми коэффициентами),
+            # dt за время опыта не учитывается
+            o2_pid.preset(tuner.bias, load_config().get(self.section, pid))
+            self.timer.reset()
+        self._tuning = mode == "autotune"
+        dt_ms = None
+        if self.timer.ready():  # после выхода из опыта таймер сброшен — шаг сразу
+            dt_ms = self.timer.due(int(pid.get("control_interval", 5) * 1000))
+            if mode == "autotune":
+                dt_ms = None  # срок идёт, но поправку задаёт опыт
+        if dt_ms is not None:
+            dt = dt_ms / 1000
+            if abs(error) <= pid.get("deadband", 0.1):
+                o2_pid.hold(o2, dt)
+            else:
+                o2_pid.update(o2_setpoint, o2, dt, pid)
+        correction = o2_pid.output
+
+        # === Внутренний контур: давление воздуха к цели ===
+        pressure_target = max(min_p, min(max_p, air_target_base + correction))
+        pressure_error = pressure_target - pressure
+        ch = cfg.get(cal.keys[cal.index(self.pressure)]) or calibration.IDENTITY
+        span = abs(ch["y_max"] - ch["y_min"])
+        actuator = self.actuator
+        action = "HOLD"
+        seconds = 0.0
+        if actuator.busy():
+            action = "MOVING"
+        elif pressure_step and abs(pressure_error) > pid.get("pressure_deadband", 0.1):
+            seconds = actuator.pulse_time(pressure_error, span, pid)
+            actuator.move(pulse, pressure_error, seconds, pid.get("pressure_settle", 1.0))
+            action = "UP" if pressure_error > 0 else "DOWN"
+
+        self._flip ^= 1
+        result = self._results[self._flip]
+        result["gas_flow"] = round(gas, 1)
+        result["air_target_base"] = round(air_target_base, 2)
+        result["air_pressure"] = round(pressure, 2)
+        result["pressure_target"] = round(pressure_target, 2)
+        result["o2_avg"] = round(o2, 2)
+        result["error"] = round(error, 2)
+        result["correction"] = round(correction, 2)
+        result["pulse"] = round(seconds, 2)
+        result["mode"] = mode
+        result["action"] = action
+        return result
+
+# Контуры по секции "loops": имя → Loop, и они же в порядке конфигурации
+loops = {}
+_order = []
+_loops_cfg = None
+_loops_gen = -1
+
+# Последние решения контуров (для веб-интерфейса и API): имя → результат;
+# last_result — первого контура; changed — решение последнего шага стоит
+# опубликовать (было действие или результат изменился)
+results = {}
+last_result = None
+changed = False
+
+# Рабочие буферы шага: напряжения и физические значения — общие для контуров
+_voltages = []
+_values = {}
+_sampled = False
+_DISABLED = {"status": "disabled"}
+_INVALID = {"error": "Invalid sensor data"}
+
+def _sync(cfg):
+    """Контуры по текущей конфигурации; существующие (по имени) сохраняют состояние."""
+    global loops, _order, _loops_cfg, _loops_gen
+    gen = config_generation()
+    if cfg is _loops_cfg and gen == _loops_gen:
+        return _order
+    new = {}
+    for spec in cfg.get("loops", ()):
+        loop = loops.get(spec["name"])
+        if loop is None:
+            loop = Loop(spec)
+        else:
+            loop.configure(spec)
+        new[loop.name] = loop
+    for name in list(results):
+        if name not in new:
+            del results[name]
+    loops = new
+    _order = list(new.values())
+    _loops_cfg = cfg
+    _loops_gen = gen
+    return _order
+
+def _sample(cal):
+    """Физические значения текущего отсчёта — один раз за шаг на все контуры."""
+    global _voltages, _sampled
+    if not _sampled:
+        if len(_voltages) != len(cal.layout):
+            _voltages = [0.0] * len(cal.layout)
+        if read_all_channels(_voltages) is None:
+            # АЦП молчит — все величины None, контуры сбрасывают ПИД
+            cal.values_into((), _values)
+        elif engine.layout != cal.layout:
+            return None
+        else:
+            cal.values_into(_voltages, _values)
+        _sampled = True
+    return _values
+
+def loop(name=None):
+    """Контур по имени (None — первый); None, если такого нет."""
+    _sync(load_config())
+    if name is None:
+        return _order[0] if _order else None
+    return loops.get(name)
+
+def reset():
+    """Начальное состояние регулятора (перезапуск, симулятор)."""
+    global last_result
+    for lp in _sync(load_config()):
+        lp.reset()
+    results.clear()
+    last_result = None
+
+def apply_calibration(raw_voltages, config):
+    """
+    Применяет калибровку ко всем каналам карты.
+    Возвращает словарь с физическими значениями.
+    """
+    return calibration.compiled(config).values(raw_voltages)
+
+def linear_interpolate(x, table):
+    """Интерполяция по таблице: список словарей с 'gas' и 'air_target'"""
+    return calibration.Curve([(p["gas"], p["air_target"]) for p in table])(x)
+
+def pulse_blocking(channel, duration):
+    """Импульс на реле с ожиданием (используется без планировщика)."""
+    set_relay(channel, True)
+    ticks.sleep_ms(int(duration * 1000))
+    set_relay(channel, False)
+
+def run_automatic_control(pulse=pulse_blocking):
+    """
+    Один шаг всех контуров. pulse(channel, duration) выдаёт импульс на реле;
+    планировщик runtime передаёт неблокирующую версию. Возвращает results,
+    если хотя бы один контур выполнил шаг, иначе None.
+    """
+    global last_result, changed, _sampled
+    cfg = load_config()
+    order = _sync(cfg)
+    _sampled = False
+    changed = False
+    stepped = False
+    for i in range(len(order)):
+        lp = order[i]
+        result = lp.step(cfg, pulse)
+        if result is None:
+            continue
+        stepped = True
+        # «disabled» и предупреждения повторяются каждый шаг — в поток только изменения
+        if "action" in result or result != lp.last_result:
+            changed = True
+        lp.last_result = result
+        results[lp.name] = result
+    if order:
+        last_result = order[0].last_result
+    return results if stepped else None
+
+def check_loops(cfg, quantities):
+    """
+    Проверка секции "loops" в cfg (для /api/config): quantities — величины
+    карты каналов (check_map). ValueError — при ошибке.
+    """
+    specs = cfg.get("loops")
+    if not isinstance(specs, list) or not specs:
+        raise ValueError("loops: expected non-empty list")
+    channels = [c["quantity"] for c in cfg["channels"]]
+    names, relays = [], []
+    for spec in specs:
+        if not isinstance(spec, dict):
+            raise ValueError("loops: expected objects")
+        name = spec.get("name")
+        if not isinstance(name, str) or not name or name in names:
+            raise ValueError("loops.name: expected unique name")
+        names.append(name)
+        pid = cfg.get(spec.get("pid"))
+        if not isinstance(pid, dict) or "o2_setpoint" not in pid:
+            raise ValueError("loops." + name + ".pid: expected PID section")
+        table = cfg.get(spec.get("table"))
+        if not isinstance(table, list) or not all(isinstance(p, dict) and "gas" in p for p in table):
+            raise ValueError("loops." + name + ".table: expected table section")
+        for key in ("o2", "gas"):
+            if spec.get(key) not in quantities:
+                raise ValueError("loops." + name + "." + key + ": unknown quantity")
+        # Размах давления для импульсов берётся из калибровки — только канал
+        if spec.get("pressure") not in channels:
+            raise ValueError("loops." + name + ".pressure: expected channel quantity")
+        for key in ("relay_less", "relay_more"):
+            ch = spec.get(key)
+            if not isinstance(ch, int) or isinstance(ch, bool) or not 1 <= ch <= relay.channels:
+                raise ValueError("loops." + name + "." + key + ": expected 1.." + str(relay.channels))
+            if ch in relays:
+                raise ValueError("loops." + name + "." + key + ": relay already used")
+            relays.append(ch)
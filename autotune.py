@@ -0,0 +1,191 @@
+# autotune.py
+# Автонастройка ПИД по O2 методом релейной обратной связи (Åström–Hägglund).
+# Вместо ПИД поправка к давлению переключается между bias + d и bias − d
+# по знаку ошибки O2 (с гистерезисом ε); внутренний контур давления
+# отрабатывает её импульсами реле 3/4, как и в обычном режиме. По
+# установившимся автоколебаниям O2 (период Tu, амплитуда a) находится
+# критический коэффициент Ku = 4d / (π·√(a² − ε²)), коэффициенты — по
+# правилам Тайреуса–Люйбена (с запасом, для объектов с запаздыванием).
+# Опыт прерывается при выходе давления за безопасные пределы, слишком
+# большом отклонении O2, по таймауту и при выключении регулятора.
+# Опыт идёт на одном контуре (loop — имя из секции "loops"), остальные
+# контуры работают как обычно.
+import math
+import ticks
+from config_manager import load_config, save_config
+
+IDLE = "idle"
+RUNNING = "running"
+DONE = "done"
+ABORTED = "aborted"
+
+RULES = ("pi", "pid")
+MAX_CYCLES = 8
+
+class Autotuner:
+    def __init__(self):
+        self.state = IDLE
+        self.reason = ""
+        self.result = None
+        self.applied = False
+        self.periods = []
+        self.amplitudes = []
+        self.loop = None          # имя контура опыта
+        self.section = "pid_control"
+        self._reset_run()
+
+    def _reset_run(self):
+        self.relay = 0            # +1 — поправка bias + d, −1 — bias − d
+        self.switches = 0
+        self._started = 0
+        self._last_rise = None    # ticks_ms переключения на +d
+        self._hi = None           # экстремумы O2 за текущий период
+        self._lo = None
+        self.elapsed_s = 0.0
+
+    @property
+    def running(self):
+        return self.state == RUNNING
+
+    def start(self, pid, bias=0.0, amplitude=None, hysteresis=None, cycles=4,
+              rule="pi", apply=False, max_deviation=2.0, timeout_s=1800,
+              loop="main", section="pid_control"):
+        """Запускает опыт на контуре loop; параметры по умолчанию — из его секции ПИД pid."""
+        if self.running:
+            raise ValueError("autotune: already running")
+        if not pid.get("enabled", False):
+            raise ValueError("autotune: controller is disabled")
+        if rule not in RULES:
+            raise ValueError("autotune: rule must be pi or pid")
+        limit = pid.get("max_correction", 0.8)
+        self.amplitude = limit / 2 if amplitude is None else amplitude
+        self.hysteresis = pid.get("deadband", 0.1) if hysteresis is None else hysteresis
+        if not 0 < self.amplitude <= limit:
+            raise ValueError("autotune: amplitude must be within 0..max_correction")
+        if self.hysteresis < 0 or not 2 <= cycles <= MAX_CYCLES or max_deviation <= 0 or timeout_s <= 0:
+            raise ValueError("autotune: invalid hysteresis, cycles, max_deviation or timeout")
+        self.loop = loop
+        self.section = section
+        self.bias = bias
+        self.cycles = cycles
+        self.rule = rule
+        self.apply = apply
+        self.max_deviation = max_deviation
+        self.timeout_s = timeout_s
+        self.periods = []
+        self.amplitudes = []
+        self.result = None
+        self.applied = False
+        self.reason = ""
+        self._reset_run()
+        self._started = ticks.ticks_ms()
+        self.state = RUNNING
+
+    def abort(self, reason):
+        if self.running:
+            self.state = ABORTED
+            self.reason = reason
+            print("Autotune aborted:", reason)
+
+    def step(self, error, o2):
+        """
+        Шаг опыта (на каждом шаге внутреннего контура): error = уставка − O2.
+        Возвращает поправку к давлению; после завершения — None.
+        """
+        if not self.running:
+            return None
+        now = ticks.ticks_ms()
+        self.elapsed_s = ticks.ticks_diff(now, self._started) / 1000
+        if abs(error) > self.max_deviation:
+            self.abort("O2 deviation %.2f exceeds %.2f" % (error, self.max_deviation))
+            return None
+        if self.elapsed_s > self.timeout_s:
+            self.abort("timeout")
+            return None
+        if self._hi is None or o2 > self._hi:
+            self._hi = o2
+        if self._lo is None or o2 < self._lo:
+            self._lo = o2
+        eps = self.hysteresis
+        if self.relay == 0:
+            self.relay = 1 if error >= 0 else -1
+        elif self.relay < 0 and error > eps:
+            self.relay = 1
+            self.switches += 1
+            self._rise(now)
+        elif self.relay > 0 and error < -eps:
+            self.relay = -1
+            self.switches += 1
+        if self.state != RUNNING:
+            return None
+        return self.bias + self.relay * self.amplitude
+
+    def _rise(self, now):
+        # Полный период — между соседними переключениями на +d
+        if self._last_rise is not None:
+            self.periods.append(ticks.ticks_diff(now, self._last_rise) / 1000)
+            self.amplitudes.append((self._hi - self._lo) / 2)
+        self._last_rise = now
+        self._hi = self._lo = None
+        # Первый период — переходный, в расчёт идут следующие cycles
+        if len(self.periods) > self.cycles:
+            self._finish()
+
+    def _finish(self):
+        periods = self.periods[-self.cycles:]
+        amps = self.amplitudes[-self.cycles:]
+        tu = sum(periods) / len(periods)
+        a = sum(amps) / len(amps)
+        eps = self.hysteresis
+        # Размах не больше гистерезиса — переключения от шума, а не автоколебания:
+        # Ku по такой амплитуде не имеет смысла, коэффициенты не выдаются
+        if tu <= 0 or a <= eps:
+            self.abort("no oscillation: amplitude %.3f below hysteresis %.3f" % (a, eps))
+            return
+        ku = 4 * self.amplitude / (math.pi * math.sqrt(a * a - eps * eps))
+        if self.rule == "pid":
+            kp = ku / 2.2
+            kd = kp * tu / 6.3
+        else:
+            kp = ku / 3.2
+            kd = 0.0
+        ki = kp / (2.2 * tu)
+        self.result = {"Ku": _sig(ku), "Tu": _sig(tu), "amplitude": _sig(a),
+                       "Kp": _sig(kp), "Ki": _sig(ki), "Kd": _sig(kd)}
+        self.state = DONE
+        print("Autotune done:", self.result)
+        if self.apply:
+            self.apply_gains()
+
+    def apply_gains(self):
+        """Записывает найденные Kp/Ki/Kd в секцию ПИД контура опыта."""
+        if self.result is None:
+            raise ValueError("autotune: no result to apply")
+        cfg = load_config()
+        pid = dict(cfg.get(self.section, {}))
+        for key in ("Kp", "Ki", "Kd"):
+            pid[key] = self.result[key]
+        cfg[self.section] = pid
+        save_config(cfg)
+        self.applied = True
+
+    def status(self):
+        data = {"state": self.state, "elapsed_s": round(self.elapsed_s, 1)}
+        if self.state != IDLE:
+            data.update({
+                "loop": self.loop, "rule": self.rule, "amplitude": self.amplitude, "hysteresis": self.hysteresis,
+                "cycles": self.cycles, "periods_done": max(0, len(self.periods) - 1),
+                "switches": self.switches, "relay": self.relay,
+                "last_period_s": _sig(self.periods[-1]) if self.periods else None,
+                "last_amplitude": _sig(self.amplitudes[-1]) if self.amplitudes else None,
+                "result": self.result, "applied": self.applied, "reason": self.reason,
+            })
+        return data
+
+def _sig(x, digits=4):
+    """Округление до digits значащих цифр."""
+    if not x:
+        return 0.0
+    return round(x, digits - 1 - int(math.floor(math.log10(abs(x)))))
+
+tuner = Autotuner()
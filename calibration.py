@@ -0,0 +1,267 @@
+# calibration.py
+# Калибровка каналов и кривые газ/воздух, «скомпилированные» из конфигурации:
+# карта каналов (channels) — секция калибровки, величина, адрес и пара входов
+# ADS1115; для каждого канала — наклон и точка отсчёта; вычисляемые величины
+# (derived) — средние, суммы, разности; для таблиц контуров — отсортированные
+# массивы точек с двоичным поиском. Пересборка — только при изменении
+# конфигурации (config_generation). Регулятор и веб-интерфейс считают
+# значения одним и тем же кодом.
+from array import array
+from config_manager import load_config, config_generation, DEFAULT_CONFIG
+
+try:
+    import numpy as np  # на хосте — пакетное преобразование без цикла Python
+except ImportError:
+    np = None
+
+# Операции вычисляемых величин
+OPS = ("mean", "sum", "min", "max", "diff")
+LOOP_COLUMNS = ("correction", "action")  # поля решения контура в тренде и журнале
+ADDRS = (0x48, 0x49, 0x4A, 0x4B)  # ADDR → GND, VCC, SDA, SCL
+
+# Секция калибровки нового канала: вольты как есть
+IDENTITY = {"name": "", "v_min": 0.0, "v_max": 1.0, "y_min": 0.0, "y_max": 1.0, "unit": "В"}
+
+class Curve:
+    """Кусочно-линейная кривая по точкам; за пределами — крайние значения."""
+
+    def __init__(self, points):
+        points = sorted(points)
+        self.xs = tuple(p[0] for p in points)
+        self.ys = tuple(p[1] for p in points)
+
+    def __call__(self, x):
+        xs, ys = self.xs, self.ys
+        n = len(xs)
+        if not n:
+            return 0.0
+        if x <= xs[0]:
+            return ys[0]
+        if x >= xs[-1]:
+            return ys[-1]
+        lo, hi = 0, n - 1
+        while hi - lo > 1:
+            mid = (lo + hi) >> 1
+            if xs[mid] <= x:
+                lo = mid
+            else:
+                hi = mid
+        x0, x1 = xs[lo], xs[hi]
+        if x1 == x0:
+            return ys[lo]
+        return ys[lo] + (ys[hi] - ys[lo]) * (x - x0) / (x1 - x0)
+
+    def batch(self, samples):
+        """Пакет значений: ndarray → ndarray (NumPy), иначе → array('f')."""
+        if np is not None and isinstance(samples, np.ndarray):
+            if not self.xs:
+                return np.zeros(samples.shape)
+            return np.interp(samples, self.xs, self.ys)
+        out = array('f', bytes(4 * len(samples)))
+        for i, x in enumerate(samples):
+            out[i] = self(x)
+        return out
+
+class Calibration:
+    """Скомпилированная конфигурация: карта каналов, вычисляемые величины и таблицы контуров."""
+
+    def __init__(self, cfg):
+        channels = cfg.get("channels") or DEFAULT_CONFIG["channels"]
+        self.keys = tuple(c["key"] for c in channels)        # секции калибровки
+        self.names = tuple(c["quantity"] for c in channels)  # величины в порядке каналов
+        self.layout = tuple((c["addr"], c["mux"]) for c in channels)
+        self._ch = []
+        for key in self.keys:
+            c = cfg.get(key) or IDENTITY
+            vmin, vmax = c["v_min"], c["v_max"]
+            ymin, ymax = c["y_min"], c["y_max"]
+            # Та же формула, что и раньше: y = k * (v - v_min) + y_min
+            slope = 0.0 if vmax == vmin else (ymax - ymin) / (vmax - vmin)
+            self._ch.append((slope, vmin, ymin))
+        self.derived = tuple((d["quantity"], OPS.index(d["op"]), tuple(d["of"]))
+                             for d in cfg.get("derived", ()))
+        self.quantities = self.names + tuple(d[0] for d in self.derived)
+        # Столбцы тренда и журнала: величины карты, затем поля решения каждого контура
+        self.loops = tuple(loop["name"] for loop in cfg.get("loops", ()))
+        self.columns = self.quantities + tuple(name + "." + field for name in self.loops
+                                               for field in LOOP_COLUMNS)
+        # Кривые газ/воздух по секциям таблиц (основная — всегда)
+        self.curves = {}
+        for key in ["air_fuel_table"] + [loop["table"] for loop in cfg.get("loops", ())]:
+            if key not in self.curves:
+                self.curves[key] = Curve([(p["gas"], p["air_target"]) for p in cfg.get(key, ())])
+        self.air_target = self.curves["air_fuel_table"]
+
+    def index(self, quantity):
+        """Номер канала величины; -1 — вычисляемая или неизвестная."""
+        return self.names.index(quantity) if quantity in self.names else -1
+
+    def value(self, ch, v):
+        slope, vmin, ymin = self._ch[ch]
+        return slope * (v - vmin) + ymin
+
+    def values(self, voltages):
+        """Физические значения всех каналов (как apply_calibration)."""
+        return self.values_into(voltages, {})
+
+    def values_into(self, voltages, out):
+        """
+        То же, что values(), но в заранее созданный словарь out (без новых
+        объектов-контейнеров). Каналы без напряжения (отсчёт по другой
+        карте, микросхема не отвечает) и зависящие от них величины — None.
+        """
+        ch, names = self._ch, self.names
+        n = len(voltages)
+        for i in range(len(ch)):
+            v = voltages[i] if i < n else None
+            if v is None:
+                out[names[i]] = None
+            else:
+                c = ch[i]
+                out[names[i]] = c[0] * (v - c[1]) + c[2]
+        for name, op, sources in self.derived:
+            out[name] = _derive(op, sources, out)
+        return out
+
+    def batch(self, ch, samples):
+        """Пакет напряжений одного канала: ndarray → ndarray (NumPy), иначе → array('f')."""
+        slope, vmin, ymin = self._ch[ch]
+        if np is not None and isinstance(samples, np.ndarray):
+            return slope * (samples - vmin) + ymin
+        out = array('f', bytes(4 * len(samples)))
+        for i, v in enumerate(samples):
+            out[i] = slope * (v - vmin) + ymin
+        return out
+
+    def batch_values(self, columns):
+        """
+        Пакет отсчётов: columns — напряжения по каналам карты (ndarray или
+        последовательности) → {величина: пакет значений}, включая вычисляемые.
+        Та же формула, что в values(), но без цикла по отсчётам, если есть NumPy.
+        """
+        out = {}
+        for i in range(len(self._ch)):
+            out[self.names[i]] = self.batch(i, columns[i])
+        for name, op, sources in self.derived:
+            out[name] = _derive_batch(op, [out[src] for src in sources])
+        return out
+
+def _derive_batch(op, columns):
+    if np is not None and isinstance(columns[0], np.ndarray):
+        stack = np.vstack(columns)
+        if op == 0:
+            return stack.mean(axis=0)
+        if op == 1:
+            return stack.sum(axis=0)
+        if op == 2:
+            return stack.min(axis=0)
+        if op == 3:
+            return stack.max(axis=0)
+        return stack[0] - stack[1:].sum(axis=0)
+    n = len(columns[0])
+    out = array('f', bytes(4 * n))
+    sources = tuple(range(len(columns)))
+    row = {}
+    for i in range(n):
+        for j in sources:
+            row[j] = columns[j][i]
+        out[i] = _derive(op, sources, row)
+    return out
+
+def _derive(op, sources, values):
+    acc = None
+    for src in sources:
+        v = values.get(src)
+        if v is None:
+            return None
+        if acc is None:
+            acc = v
+        elif op <= 1:      # mean, sum
+            acc += v
+        elif op == 2:
+            acc = min(acc, v)
+        elif op == 3:
+            acc = max(acc, v)
+        else:              # diff
+            acc -= v
+    if op == 0 and acc is not None:
+        acc /= len(sources)
+    return acc
+
+def check_map(cfg):
+    """
+    Проверка карты каналов и вычисляемых величин в cfg (для /api/config).
+    ValueError — при ошибке.
+    """
+    channels = cfg.get("channels")
+    if not isinstance(channels, list) or not channels:
+        raise ValueError("channels: expected non-empty list")
+    keys, names, layout = [], [], []
+    for c in channels:
+        if not isinstance(c, dict):
+            raise ValueError("channels: expected objects")
+        key, name = c.get("key"), c.get("quantity")
+        addr, mux = c.get("addr"), c.get("mux")
+        if not isinstance(key, str) or not key or key in keys:
+            raise ValueError("channels.key: expected unique section name")
+        section = cfg.get(key)
+        if section is not None and not (isinstance(section, dict) and "v_min" in section):
+            raise ValueError("channels." + key + ": not a calibration section")
+        if not isinstance(name, str) or not name or name in names:
+            raise ValueError("channels.quantity: expected unique name")
+        if addr not in ADDRS or isinstance(addr, bool):
+            raise ValueError("channels." + name + ".addr: expected 72..75")
+        if not isinstance(mux, int) or isinstance(mux, bool) or not 0 <= mux <= 7:
+            raise ValueError("channels." + name + ".mux: expected 0..7")
+        if (addr, mux) in layout:
+            raise ValueError("channels." + name + ": input already used")
+        keys.append(key)
+        names.append(name)
+        layout.append((addr, mux))
+    derived = cfg.get("derived", [])
+    if not isinstance(derived, list):
+        raise ValueError("derived: expected list")
+    for d in derived:
+        if not isinstance(d, dict):
+            raise ValueError("derived: expected objects")
+        name, of = d.get("quantity"), d.get("of")
+        if not isinstance(name, str) or not name or name in names:
+            raise ValueError("derived.quantity: expected unique name")
+        if d.get("op") not in OPS:
+            raise ValueError("derived." + name + ".op: expected one of " + ", ".join(OPS))
+        # Источники — каналы и вычисляемые величины выше по списку
+        if not isinstance(of, list) or not of or any(src not in names for src in of):
+            raise ValueError("derived." + name + ".of: expected list of known quantities")
+        names.append(name)
+    return names
+
+def limits(cfg):
+    """
+    Наибольший модуль каждой величины карты: у каналов — по y_min/y_max
+    калибровки, у вычисляемых — по источникам (sum и diff складывают их).
+    """
+    cal = Calibration(cfg)  # не через compiled(): cfg может быть ещё не применённой правкой
+    out = {}
+    for i, name in enumerate(cal.names):
+        c = cfg.get(cal.keys[i]) or IDENTITY
+        out[name] = max(abs(c["y_min"]), abs(c["y_max"]))
+    for name, op, sources in cal.derived:
+        spans = [out[src] for src in sources]
+        out[name] = sum(spans) if OPS[op] in ("sum", "diff") else max(spans)
+    return out
+
+_compiled = None
+_compiled_cfg = None
+_compiled_gen = -1
+
+def compiled(cfg=None):
+    """Калибровка для cfg (по умолчанию — текущей конфигурации), пересобирается при изменении."""
+    global _compiled, _compiled_cfg, _compiled_gen
+    if cfg is None:
+        cfg = load_config()
+    gen = config_generation()
+    if cfg is not _compiled_cfg or gen != _compiled_gen:
+        _compiled = Calibration(cfg)
+        _compiled_cfg = cfg
+        _compiled_gen = gen
+    return _compiled
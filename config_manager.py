@@ -1,50 +1,196 @@
-# config_manager.py
-import json
-
-DEFAULT_CONFIG = {
-    "ch0": {"name": "O2_1", "v_min": 0.0, "v_max": 1.0, "y_min": 0.0, "y_max": 25.0, "unit": "%"},
-    "ch1": {"name": "O2_2", "v_min": 0.0, "v_max": 1.0, "y_min": 0.0, "y_max": 25.0, "unit": "%"},
-    "ch2": {"name": "Gas_Flow", "v_min": 0.0, "v_max": 1.0, "y_min": 0.0, "y_max": 100.0, "unit": "м³/ч"},
-    "ch3": {"name": "Air_Pressure", "v_min": 0.0, "v_max": 1.0, "y_min": 0.0, "y_max": 10.0, "unit": "кПа"},
-
-    # === Базовое соотношение газ/воздух (5 точек) ===
-    "air_fuel_table": [
-        {"gas": 0.0,  "air_target": 1.0},
-        {"gas": 20.0, "air_target": 2.0},
-        {"gas": 40.0, "air_target": 3.5},
-        {"gas": 70.0, "air_target": 6.0},
-        {"gas": 100.0,"air_target": 8.5}
-    ],
-
-    # === ПИД-коррекция по O2 ===
-    "pid_control": {
-        "enabled": True,
-        "o2_setpoint": 3.5,      # %
-        "deadband": 0.1,         # % — зона бездействия
-        "Kp": 0.8,               # коэффициент пропорциональный
-        "Ki": 0.02,              # интегральный
-        "Kd": 0.1,               # дифференциальный
-        "max_correction": 0.8,   # максимальная коррекция давления (± кПа)
-        "control_interval": 10,  # сек
-        "impulse_duration": 1.5, # сек
-        "pressure_min_safe": 0.5,
-        "pressure_max_safe": 9.0
-    }
-}
-
-def load_config():
-    try:
-        with open("config.json", "r") as f:
-            cfg = json.load(f)
-            # Обеспечиваем наличие всех секций
-            for key in DEFAULT_CONFIG:
-                if key not in cfg:
-                    cfg[key] = DEFAULT_CONFIG[key]
-            return cfg
-    except:
-        save_config(DEFAULT_CONFIG)
-        return DEFAULT_CONFIG
-
-def save_config(cfg):
-    with open("config.json", "w") as f:
-        json.dump(cfg, f)
\ No newline at end of file
+# config_manager.py
+# Конфигурация хранится в RAM: flash читается один раз при старте,
+# запись на flash откладывается и выполняется атомарно (tmp + rename).
+import json
+import os
+import ticks
+
+CONFIG_FILE = "config.json"
+TMP_FILE = "config.json.tmp"
+BAD_FILE = "config.json.bad"
+
+SAVE_DELAY_MS = 2000       # пауза после последней правки перед записью
+SAVE_MAX_DELAY_MS = 10000  # запись не позже этого срока после первой правки
+
+DEFAULT_CONFIG = {
+    # === Карта каналов: секция калибровки, величина, ADS1115 (адрес I2C) и пара входов ===
+    # mux: 0 — A0-A1, 1 — A0-A3, 2 — A1-A3, 3 — A2-A3, 4..7 — A0..A3 относительно GND
+    "channels": [
+        {"key": "ch0", "quantity": "o2_1", "addr": 72, "mux": 0},
+        {"key": "ch1", "quantity": "o2_2", "addr": 72, "mux": 3},
+        {"key": "ch2", "quantity": "gas_flow", "addr": 73, "mux": 0},
+        {"key": "ch3", "quantity": "air_pressure", "addr": 73, "mux": 3}
+    ],
+    # Вычисляемые величины: op — mean, sum, min, max или diff (первая минус остальные)
+    "derived": [
+        {"quantity": "o2_avg", "op": "mean", "of": ["o2_1", "o2_2"]}
+    ],
+    # === Контуры регулирования: секции ПИД и таблицы, величины, пара реле ===
+    "loops": [
+        {"name": "main", "pid": "pid_control", "table": "air_fuel_table",
+         "o2": "o2_avg", "gas": "gas_flow", "pressure": "air_pressure",
+         "relay_less": 3, "relay_more": 4}
+    ],
+
+    "ch0": {"name": "O2_1", "v_min": 0.0, "v_max": 1.0, "y_min": 0.0, "y_max": 25.0, "unit": "%"},
+    "ch1": {"name": "O2_2", "v_min": 0.0, "v_max": 1.0, "y_min": 0.0, "y_max": 25.0, "unit": "%"},
+    "ch2": {"name": "Gas_Flow", "v_min": 0.0, "v_max": 1.0, "y_min": 0.0, "y_max": 100.0, "unit": "м³/ч"},
+    "ch3": {"name": "Air_Pressure", "v_min": 0.0, "v_max": 1.0, "y_min": 0.0, "y_max": 10.0, "unit": "кПа"},
+
+    # === Базовое соотношение газ/воздух (5 точек) ===
+    "air_fuel_table": [
+        {"gas": 0.0,  "air_target": 1.0},
+        {"gas": 20.0, "air_target": 2.0},
+        {"gas": 40.0, "air_target": 3.5},
+        {"gas": 70.0, "air_target": 6.0},
+        {"gas": 100.0,"air_target": 8.5}
+    ],
+
+    # === ПИД-коррекция по O2 ===
+    "pid_control": {
+        "enabled": True,
+        "o2_setpoint": 3.5,      # %
+        "deadband": 0.1,         # % — зона бездействия
+        "Kp": 0.1,               # коэффициент пропорциональный
+        "Ki": 0.005,             # интегральный
+        "Kd": 0.0,               # дифференциальный
+        "d_filter": 2.0,         # сек — постоянная фильтра производной
+        "max_correction": 0.8,   # максимальная коррекция давления (± кПа)
+        "control_interval": 5,   # сек — шаг контура O2
+
+        # === Внутренний контур: давление воздуха ===
+        "pressure_interval": 2.0,  # сек — шаг контура давления
+        "pressure_deadband": 0.1,  # кПа — зона бездействия по давлению
+        "full_stroke": 30.0,       # сек — полный ход механизма
+        "pulse_gain": 1.0,         # доля расчётного импульса
+        "min_pulse": 0.2,          # сек
+        "max_pulse": 5.0,          # сек
+        "backlash": 0.0,           # сек — добавка при смене направления (люфт)
+        "pressure_settle": 1.0,    # сек — пауза после импульса
+        "pressure_min_safe": 0.5,
+        "pressure_max_safe": 9.0
+    },
+
+    # === Modbus-сервер для SCADA (порт и UART — после перезапуска) ===
+    "modbus": {
+        "tcp": True,
+        "port": 502,
+        "unit": 1,
+        "rtu": False,            # ведомый RTU на втором UART (UART 1 занят реле)
+        "uart": 0,
+        "baudrate": 19200,
+        "tx": 21,
+        "rx": 20,
+        "scale": {}              # величина → множитель регистра (по умолчанию — по диапазону калибровки)
+    }
+}
+
+_cfg = None
+_generation = 0
+_dirty = False
+_first_edit = 0
+_last_edit = 0
+
+def _copy(obj):
+    return json.loads(json.dumps(obj))
+
+def _read_file(path):
+    with open(path, "r") as f:
+        cfg = json.load(f)
+    if not isinstance(cfg, dict):
+        raise ValueError("config is not an object")
+    return complete(cfg)
+
+def complete(cfg):
+    """
+    Дополняет cfg недостающими секциями и полями из DEFAULT_CONFIG: старая
+    конфигурация без карты каналов и контуров работает как раньше (ch0..ch3).
+    """
+    for key in DEFAULT_CONFIG:
+        if key not in cfg:
+            cfg[key] = _copy(DEFAULT_CONFIG[key])
+        elif isinstance(cfg[key], dict):
+            for field, value in DEFAULT_CONFIG[key].items():
+                if field not in cfg[key]:
+                    cfg[key][field] = _copy(value)  # правки на месте не должны менять DEFAULT_CONFIG
+    return cfg
+
+def _load_from_flash():
+    try:
+        return _read_file(CONFIG_FILE)
+    except OSError:
+        corrupt = False  # файла нет
+    except ValueError as e:
+        corrupt = True
+        print("Config error:", e)
+    # Сбой питания между remove и rename (FAT) оставляет только tmp-файл
+    try:
+        cfg = _read_file(TMP_FILE)
+        _write_atomic(cfg)
+        return cfg
+    except (OSError, ValueError):
+        pass
+    if corrupt:
+        # Испорченный файл не затираем молча — оставляем для разбора
+        try:
+            os.rename(CONFIG_FILE, BAD_FILE)
+        except OSError:
+            pass
+        print("Config: config.json повреждён, загружены значения по умолчанию")
+    cfg = _copy(DEFAULT_CONFIG)
+    _write_atomic(cfg)
+    return cfg
+
+def _write_atomic(cfg):
+    with open(TMP_FILE, "w") as f:
+        json.dump(cfg, f)
+    try:
+        os.rename(TMP_FILE, CONFIG_FILE)
+    except OSError:
+        # FAT не переименовывает поверх существующего файла
+        os.remove(CONFIG_FILE)
+        os.rename(TMP_FILE, CONFIG_FILE)
+
+def load_config():
+    """Текущая конфигурация из RAM. Flash читается только при первом вызове."""
+    global _cfg
+    if _cfg is None:
+        _cfg = _load_from_flash()
+    return _cfg
+
+def config_generation():
+    """Счётчик изменений: растёт при каждом save_config()."""
+    return _generation
+
+def save_config(cfg):
+    """
+    Принимает новую конфигурацию. Читатели видят её сразу,
+    на flash она попадёт при ближайшем flush_config() после паузы.
+    """
+    global _cfg, _generation, _dirty, _first_edit, _last_edit
+    _cfg = cfg
+    _generation += 1
+    now = ticks.ticks_ms()
+    if not _dirty:
+        _first_edit = now
+        _dirty = True
+    _last_edit = now
+
+def flush_config(force=False):
+    """Записывает отложенные изменения на flash. Возвращает True, если запись была."""
+    global _dirty, _first_edit, _last_edit
+    if not _dirty:
+        return False
+    now = ticks.ticks_ms()
+    if not force and ticks.ticks_diff(now, _last_edit) < SAVE_DELAY_MS \
+            and ticks.ticks_diff(now, _first_edit) < SAVE_MAX_DELAY_MS:
+        return False
+    try:
+        _write_atomic(_cfg)
+    except Exception as e:
+        print("Config save error:", e)
+        # Повторим попытку после следующей паузы
+        _first_edit = _last_edit = now
+        return False
+    _dirty = False
+    return True
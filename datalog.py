@@ -0,0 +1,321 @@
+# datalog.py
+# Журнал на flash: записи фиксированного размера (struct) копятся в RAM
+# и пишутся целыми страницами, по кругу в ограниченный набор сегментов.
+# Столбцы записи — по карте каналов и контуров (Calibration.columns); состав
+# столбцов сегмента лежит рядом в segN.map, смена карты начинает новый
+# сегмент. Сегмент без .map — записи прежнего формата (четыре величины и
+# решение первого контура, 32 байта).
+# При запуске неполная или повреждённая последняя страница отбрасывается
+# по CRC записей, журнал продолжается с места остановки.
+import os
+import struct
+from modbus_rtu import crc16
+
+DIRECTORY = "log"
+SEGMENTS = 4
+PAGE_SIZE = 4096
+SEGMENT_SIZE = 64 * PAGE_SIZE  # 256 КБ: при записи раз в секунду — ~2.3 ч на сегмент
+PERIOD_MS = 1000
+
+RECORD_MIN = 32       # размер записи — степень двойки: страница вмещает целое число записей
+READ_BYTES = 1024     # кусок файла на кусок CSV
+
+ACTIONS = {"DOWN": -1, "HOLD": 0, "UP": 1}
+NAN = float("nan")
+
+class Layout:
+    """
+    Формат записи для столбцов columns: uptime мс (I), номер запуска (H),
+    float32 на столбец, маска реле (B), CRC-16 всего предыдущего (H),
+    выравнивание до степени двойки.
+    """
+
+    def __init__(self, columns, fmt=None, crc_offset=None):
+        self.columns = tuple(columns)
+        n = len(self.columns)
+        if fmt is None:
+            crc_offset = 7 + 4 * n
+            size = RECORD_MIN
+            while size < crc_offset + 2:
+                size *= 2
+            pad = size - crc_offset - 2
+            fmt = "<IH%dfBH" % n + ("%dx" % pad if pad else "")
+        self.fmt = fmt
+        self.size = struct.calcsize(fmt)
+        self.crc_offset = crc_offset
+        self.per_page = PAGE_SIZE // self.size
+        self.header = ("boot,t_ms," + ",".join(self.columns) + ",relays\n").encode()
+        self.ints = tuple(name == "action" or name.endswith(".action") for name in self.columns)
+
+# Сегменты без segN.map: o2_1, o2_2, gas_flow, air_pressure, correction, действие
+# (-1/0/1, int8) первого контура, маска реле, CRC первых 28 байт, 2 байта выравнивания
+LEGACY = Layout(("o2_1", "o2_2", "gas_flow", "air_pressure", "correction", "action"),
+                "<IHfffffbBHxx", 28)
+
+def _exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+def _size(path):
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return 0
+
+class DataLog:
+    def __init__(self, directory=DIRECTORY, segments=SEGMENTS, segment_size=SEGMENT_SIZE):
+        self.directory = directory
+        self.segments = segments
+        self.segment_size = segment_size - segment_size % PAGE_SIZE
+        self.page = bytearray(PAGE_SIZE)
+        self.layout = None     # формат текущего сегмента
+        self.fill = 0          # записей в текущей странице
+        self.segment = 0       # сегмент, в который идёт запись
+        self.boot = 0
+        self.pages_written = 0
+        self.recovered = 0     # отброшено записей при восстановлении
+        self.errors = 0
+        self._cal = None
+        self._rbuf = bytearray(READ_BYTES)
+        self._new_segment = False
+        self._ready = False
+
+    def path(self, i):
+        return "%s/seg%d.bin" % (self.directory, i)
+
+    def map_path(self, i):
+        return "%s/seg%d.map" % (self.directory, i)
+
+    def segment_layout(self, i):
+        """Формат записей сегмента i: по segN.map или прежний."""
+        try:
+            with open(self.map_path(i)) as f:
+                names = f.read().strip()
+        except OSError:
+            return LEGACY
+        return Layout(names.split(",") if names else ())
+
+    def _last_record(self, i, layout):
+        """(номер запуска, uptime) последней целой записи сегмента или None."""
+        size = _size(self.path(i))
+        rs = layout.size
+        if size < rs:
+            return None
+        off = size - size % rs - rs
+        with open(self.path(i), "rb") as f:
+            # Испорченный хвост бывает только на последней странице
+            for _ in range(layout.per_page):
+                if off < 0:
+                    break
+                f.seek(off)
+                rec = f.read(rs)
+                if _valid(rec, 0, layout.crc_offset):
+                    return struct.unpack_from("<IH", rec)[::-1]
+                off -= rs
+        return None
+
+    def open(self):
+        """Вызывается один раз при запуске: выбор сегмента и восстановление хвоста."""
+        if not _exists(self.directory):
+            os.mkdir(self.directory)
+        newest = None
+        for i in range(self.segments):
+            layout = self.segment_layout(i)
+            last = self._last_record(i, layout)
+            if last is not None and (newest is None or last > newest[0]):
+                newest = (last, i, layout)
+        if newest is not None:
+            self.segment = newest[1]
+            self.layout = newest[2]
+            self.boot = (newest[0][0] + 1) & 0xFFFF
+            self._recover(self.path(self.segment), self.layout)
+        self._ready = True
+
+    def _recover(self, path, layout):
+        """
+        Сбой питания во время записи может оставить неполную страницу:
+        обрезаем файл до первой записи с неверным CRC в хвосте. Запись на
+        flash — не больше страницы, но после flush() при остановке страницы
+        сегмента не выровнены по PAGE_SIZE, поэтому проверяется всё, что
+        могла затронуть последняя запись: страница до конца файла (по целым
+        записям) и последняя выровненная страница.
+        """
+        rs = layout.size
+        size = _size(path)
+        page_start = (size - 1) // PAGE_SIZE * PAGE_SIZE if size else 0
+        page_start = max(0, min(page_start, size - size % rs - PAGE_SIZE))
+        with open(path, "rb") as f:
+            f.seek(page_start)
+            tail = f.read(size - page_start)
+        good = 0
+        for off in range(0, len(tail) - rs + 1, rs):
+            if not _valid(tail, off, layout.crc_offset):
+                break
+            good = off + rs
+        if page_start + good == size:
+            return
+        self.recovered += (size - page_start - good + rs - 1) // rs
+        # Переписываем сегмент без испорченного хвоста: у FAT/LittleFS в MicroPython нет truncate
+        tmp = path + ".tmp"
+        with open(path, "rb") as src, open(tmp, "wb") as dst:
+            left = page_start
+            while left:
+                chunk = src.read(min(left, PAGE_SIZE))
+                if not chunk:
+                    break
+                dst.write(chunk)
+                left -= len(chunk)
+            dst.write(tail[:good])
+        os.remove(path)
+        os.rename(tmp, path)
+        print("Log recovered:", path, "dropped", self.recovered, "records")
+
+    def _configure(self, cal):
+        self._cal = cal
+        if self.layout is not None and self.layout.columns == cal.columns:
+            return
+        # Другая карта: накопленное — в прежний сегмент, дальше — новый со своим segN.map
+        self.flush()
+        self.layout = Layout(cal.columns)
+        self._new_segment = True
+
+    def append(self, uptime, cal, values, results, relays=0):
+        """
+        Запись в RAM; на flash уходит только заполненная страница. cal —
+        скомпилированная карта, values — значения величин, results — решения
+        контуров по именам.
+        """
+        if not self._ready:
+            return
+        if cal is not self._cal:
+            self._configure(cal)
+        layout = self.layout
+        page = self.page
+        off = self.fill * layout.size
+        struct.pack_into("<IH", page, off, uptime & 0xFFFFFFFF, self.boot)
+        pos = off + 6
+        nq = len(cal.quantities)
+        columns = layout.columns
+        for k in range(len(columns)):
+            if k < nq:
+                v = values.get(columns[k])
+            else:
+                result = results.get(cal.loops[(k - nq) // 2])
+                if not result:
+                    v = None
+                elif layout.ints[k]:
+                    v = ACTIONS.get(result.get("action"), 0)
+                else:
+                    v = result.get("correction")
+            struct.pack_into("<f", page, pos, NAN if v is None else v)
+            pos += 4
+        page[pos] = relays & 0xFF
+        crc = layout.crc_offset
+        struct.pack_into("<H", page, off + crc, crc16(memoryview(page)[off:off + crc]))
+        self.fill += 1
+        if self.fill == layout.per_page:
+            self.flush()
+
+    def flush(self):
+        """Дописывает накопленное в текущий сегмент; при заполнении или смене карты — в следующий."""
+        if not self.fill:
+            return
+        layout = self.layout
+        path = self.path(self.segment)
+        size = _size(path)
+        if size >= self.segment_size or (self._new_segment and size):
+            self.segment = (self.segment + 1) % self.segments
+            path = self.path(self.segment)
+            size = 0
+        mode = "ab"
+        if not size:
+            mode = "wb"  # самый старый сегмент затирается
+            try:
+                with open(self.map_path(self.segment), "w") as f:
+                    f.write(",".join(layout.columns))
+            except OSError as e:
+                self.errors += 1
+                print("Log write error:", e)
+        self._new_segment = False
+        try:
+            with open(path, mode) as f:
+                f.write(memoryview(self.page)[:self.fill * layout.size])
+            self.pages_written += 1
+        except OSError as e:
+            self.errors += 1
+            print("Log write error:", e)
+        self.fill = 0
+
+    def order(self):
+        """Сегменты от самого старого к текущему."""
+        return [(self.segment + 1 + k) % self.segments for k in range(self.segments)]
+
+    def csv_chunks(self):
+        """
+        Журнал в CSV кусками — без чтения файла целиком. Перед записями
+        каждого формата — строка заголовка с его столбцами.
+        """
+        buf = self._rbuf
+        header = None
+        for i in self.order():
+            try:
+                f = open(self.path(i), "rb")
+            except OSError:
+                continue
+            layout = self.segment_layout(i)
+            if layout.header != header:
+                header = layout.header
+                yield header
+            rs = layout.size
+            view = memoryview(buf)[:len(buf) - len(buf) % rs]
+            with f:
+                while True:
+                    n = f.readinto(view)
+                    if not n:
+                        break
+                    yield _csv(layout, buf, n - n % rs)
+        # Ещё не записанная страница — тоже часть журнала
+        if self.fill:
+            layout = self.layout
+            if layout.header != header:
+                yield layout.header
+            yield _csv(layout, bytes(self.page[:self.fill * layout.size]), self.fill * layout.size)
+        elif header is None:
+            yield (self.layout or LEGACY).header
+
+    def stats(self):
+        return {
+            "segment": self.segment,
+            "boot": self.boot,
+            "buffered": self.fill,
+            "pages_written": self.pages_written,
+            "recovered": self.recovered,
+            "errors": self.errors,
+        }
+
+def _valid(buf, off, crc_offset):
+    return crc16(buf[off:off + crc_offset]) == struct.unpack_from("<H", buf, off + crc_offset)[0]
+
+def _num(v):
+    return "" if v != v else "%.3f" % v
+
+def _csv(layout, buf, n):
+    lines = []
+    ints = layout.ints
+    for off in range(0, n, layout.size):
+        if not _valid(buf, off, layout.crc_offset):
+            continue  # испорченная запись внутри сегмента — в CSV не идёт
+        rec = struct.unpack_from(layout.fmt, buf, off)
+        fields = ["%d" % rec[1], "%d" % rec[0]]
+        for k in range(len(ints)):
+            v = rec[2 + k]
+            fields.append("%d" % v if ints[k] and v == v else _num(v))
+        fields.append("%d" % rec[2 + len(ints)])
+        lines.append(",".join(fields))
+        lines.append("\n")
+    return "".join(lines).encode()
+
+log = DataLog()
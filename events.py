@@ -0,0 +1,125 @@
+# events.py
+# Server-Sent Events: поток отсчётов и решений регулятора для открытых страниц.
+# Публикация только отмечает тему новой (без выделения памяти); кадр JSON
+# собирается один раз на номер — при первой отправке любому клиенту.
+# Каждый клиент получает лишь самый свежий кадр темы: пока медленный
+# клиент дописывает предыдущий, промежуточные кадры пропускаются.
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+import json
+import ticks
+
+MAX_CLIENTS = 3
+KEEPALIVE_S = 15  # комментарий-пинг, чтобы прокси и планшет не закрыли поток
+RETRY_MS = 2000   # через сколько браузер переподключается после обрыва
+SEND_TIMEOUT_S = 10  # клиент, не принимающий данные дольше, отключается
+
+HEADER = (b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+          b"Cache-Control: no-cache\r\nConnection: close\r\n\r\nretry: %d\n\n" % RETRY_MS)
+BUSY = b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 5\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+PING = b": ping\n\n"
+
+class Topic:
+    """Тема потока: source() даёт данные последнего события, period_ms ограничивает частоту."""
+
+    def __init__(self, name, source, period_ms=0):
+        self.name = name
+        self._prefix = b"event: " + name.encode() + b"\ndata: "
+        self.source = source
+        self.period_ms = period_ms
+        self.seq = 0
+        self.stamp = ticks.ticks_ms()
+        self._frame = None
+        self._frame_seq = -1
+
+    def frame(self):
+        if self._frame_seq != self.seq:
+            data = json.dumps(self.source(), separators=(",", ":"))
+            self._frame = self._prefix + data.encode() + b"\n\n"
+            self._frame_seq = self.seq
+        return self._frame
+
+class Client:
+    def __init__(self, writer, ntopics):
+        self.writer = writer
+        self.ready = asyncio.Event()
+        self.sent = [-1] * ntopics  # номер последнего отправленного кадра по темам
+        self.frames = 0
+        self.dropped = 0
+
+class Hub:
+    def __init__(self):
+        self.topics = []
+        self.clients = []
+        self.frames = 0
+        self.dropped = 0
+
+    def topic(self, name, source, period_ms=0):
+        t = Topic(name, source, period_ms)
+        self.topics.append(t)
+        return t
+
+    def publish(self, topic):
+        """Новое событие темы. Без клиентов и чаще period_ms — ничего не делает."""
+        if not self.clients:
+            return False
+        now = ticks.ticks_ms()
+        if topic.seq and ticks.ticks_diff(now, topic.stamp) < topic.period_ms:
+            return False
+        topic.seq += 1
+        topic.stamp = now
+        for c in self.clients:
+            c.ready.set()
+        return True
+
+    async def serve(self, writer):
+        """Обслуживает поток /events до отключения клиента."""
+        if len(self.clients) >= MAX_CLIENTS:
+            writer.write(BUSY)
+            await writer.drain()
+            return
+        client = Client(writer, len(self.topics))
+        writer.write(HEADER)
+        await writer.drain()
+        self.clients.append(client)
+        # Новый клиент сразу получает текущее состояние всех тем
+        client.ready.set()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(client.ready.wait(), KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    writer.write(PING)
+                    await asyncio.wait_for(writer.drain(), SEND_TIMEOUT_S)
+                    continue
+                client.ready.clear()
+                await self._send(client)
+        finally:
+            self.clients.remove(client)
+
+    async def _send(self, client):
+        for i, topic in enumerate(self.topics):
+            last = client.sent[i]
+            if last == topic.seq:
+                continue
+            if last >= 0 and topic.seq - last > 1:
+                # Пока шёл предыдущий кадр, вышли более новые — промежуточные пропущены
+                client.dropped += topic.seq - last - 1
+                self.dropped += topic.seq - last - 1
+            client.sent[i] = topic.seq
+            client.writer.write(topic.frame())
+            # drain ждёт, пока сокет примет кадр; публикации за это время только поднимают seq
+            await asyncio.wait_for(client.writer.drain(), SEND_TIMEOUT_S)
+            client.frames += 1
+            self.frames += 1
+
+    def stats(self):
+        return {
+            "clients": len(self.clients),
+            "frames": self.frames,
+            "dropped": self.dropped,
+        }
+
+hub = Hub()
@@ -0,0 +1,212 @@
+# filters.py
+# Цифровая фильтрация каналов АЦП по секции "filter" канала в config.json:
+#   "ch0": {..., "filter": {"oversample": 8, "sps": 860, "median": 5,
+#                           "max_rate": 0.5, "mean": 1, "tau": 2.0}}
+# oversample/sps — серия преобразований на повышенной частоте ADS1115,
+# усредняемая в один отсчёт (выполняет ads1115.Acquisition). Дальше по порядку:
+# медиана из median последних отсчётов (одиночные выбросы), ограничение
+# скорости изменения max_rate (единиц канала в секунду), скользящее среднее
+# из mean отсчётов и экспоненциальное сглаживание с постоянной времени tau (с).
+# Фильтры работают с напряжениями: калибровка линейна, отфильтрованные
+# вольты идут в ту же Calibration. Буферы выделяются при смене конфигурации.
+import math
+from array import array
+import ticks
+from ads1115 import DR_SPS
+from config_manager import load_config, config_generation
+import calibration
+
+OVERSAMPLE_MAX = 16
+MEDIAN_MAX = 9
+MEAN_MAX = 32
+
+# Без секции "filter" канал идёт без обработки с частотой 128 SPS
+DEFAULTS = {"oversample": 1, "sps": 128, "median": 1, "max_rate": 0.0, "mean": 1, "tau": 0.0}
+
+def _ring(n):
+    return array('f', bytes(4 * n))
+
+class Pipeline:
+    """Цепочка фильтров одного канала; __call__(вольты, мс с прошлого отсчёта) → вольты."""
+
+    def __init__(self, spec, volts_per_unit):
+        f = dict(DEFAULTS)
+        f.update(spec)
+        self.median = f["median"]
+        self.mean = f["mean"]
+        self.max_step = f["max_rate"] * volts_per_unit / 1000  # вольт за мс, 0 — без ограничения
+        self.tau_ms = f["tau"] * 1000
+        self._med = _ring(self.median)
+        self._sorted = _ring(self.median)
+        self._ring = _ring(self.mean)
+        self.limited = 0          # отсчётов, урезанных по скорости изменения
+        self.reset()
+
+    def reset(self):
+        self._med_n = self._med_i = 0
+        self._ring_n = self._ring_i = 0
+        self._sum = 0.0
+        self._last = None         # последний отсчёт после ограничения скорости
+        self._ema = None
+
+    def _median_of(self, x):
+        buf, s = self._med, self._sorted
+        buf[self._med_i] = x
+        self._med_i = (self._med_i + 1) % self.median
+        if self._med_n < self.median:
+            self._med_n += 1
+        n = self._med_n
+        # Вставками: окно не больше MEDIAN_MAX
+        for i in range(n):
+            v = buf[i]
+            j = i
+            while j and s[j - 1] > v:
+                s[j] = s[j - 1]
+                j -= 1
+            s[j] = v
+        return s[(n - 1) >> 1]
+
+    def _mean_of(self, x):
+        ring = self._ring
+        i = self._ring_i
+        if self._ring_n < self.mean:
+            self._ring_n += 1
+        else:
+            self._sum -= ring[i]
+        ring[i] = x
+        self._sum += x
+        i += 1
+        if i == self.mean:
+            i = 0
+            # Раз за оборот пересчитываем сумму — ошибки округления не копятся
+            self._sum = sum(ring)
+        self._ring_i = i
+        return self._sum / self._ring_n
+
+    def __call__(self, x, dt_ms):
+        if self.median > 1:
+            x = self._median_of(x)
+        last = self._last
+        if last is not None and self.max_step and dt_ms > 0:
+            step = self.max_step * dt_ms
+            if x > last + step:
+                x = last + step
+                self.limited += 1
+            elif x < last - step:
+                x = last - step
+                self.limited += 1
+        self._last = x
+        if self.mean > 1:
+            x = self._mean_of(x)
+        if self.tau_ms > 0:
+            if self._ema is None or dt_ms <= 0:
+                self._ema = x
+            else:
+                self._ema += (x - self._ema) * (1.0 - math.exp(-dt_ms / self.tau_ms))
+            x = self._ema
+        return x
+
+class FilterBank:
+    """
+    Фильтры всех каналов. Экземпляр ставится в ads1115.Acquisition.pipeline
+    и вызывается при каждом опубликованном отсчёте: читает acq.values
+    (сырые вольты), пишет acq.filtered. Конфигурация сверяется по
+    config_generation; цепочки пересобираются только у изменившихся каналов.
+    """
+
+    def __init__(self):
+        self.pipes = []
+        self._keys = []
+        self._cfg = None
+        self._gen = -1
+        self._stamp = None
+
+    def configure(self, cfg, acq):
+        cal = calibration.compiled(cfg)
+        n = len(cal.keys)
+        if acq.channels != cal.layout:
+            # Новая карта каналов: частоты и серии задаются заново
+            acq.configure(cal.layout)
+            self._keys = [None] * n
+        if len(self.pipes) != n:
+            self.pipes = [None] * n
+            self._keys = [None] * n
+        for i in range(n):
+            key = cal.keys[i]
+            try:
+                spec = check_spec(cfg.get(key, {}).get("filter") or {})
+            except ValueError as e:
+                # Правка config.json вручную: канал работает без фильтра
+                print("Filter error:", key, e)
+                spec = {}
+            slope = cal.value(i, 1.0) - cal.value(i, 0.0)
+            key = (spec, slope)
+            if key == self._keys[i]:
+                continue
+            self._keys[i] = (dict(spec), slope)
+            f = dict(DEFAULTS)
+            f.update(spec)
+            active = f["median"] > 1 or f["mean"] > 1 or f["max_rate"] > 0 or f["tau"] > 0
+            self.pipes[i] = Pipeline(spec, 1.0 / abs(slope) if slope else 0.0) if active else None
+            acq.set_rate(i, f["sps"], f["oversample"])
+        self._cfg = cfg
+        self._gen = config_generation()
+
+    def __call__(self, acq):
+        cfg = load_config()
+        if cfg is not self._cfg or config_generation() != self._gen:
+            self.configure(cfg, acq)
+        stamp = acq.stamp
+        dt = ticks.ticks_diff(stamp, self._stamp) if self._stamp is not None else 0
+        self._stamp = stamp
+        raw, out, pipes = acq.values, acq.filtered, self.pipes
+        if acq.layout is not acq.channels:
+            # Последний отсчёт по прежней карте — без фильтров
+            for i in range(len(raw)):
+                out[i] = raw[i]
+            return
+        for i in range(len(pipes)):
+            pipe = pipes[i]
+            v = raw[i]
+            if pipe is None:
+                out[i] = v
+            elif v is None:
+                # Микросхема канала не отвечает: окна фильтра начнутся заново
+                pipe.reset()
+                out[i] = None
+            else:
+                out[i] = pipe(v, dt)
+
+    def stats(self):
+        """Отсчётов, урезанных ограничением скорости, по каналам."""
+        keys = calibration.compiled().keys
+        return {keys[i]: p.limited for i, p in enumerate(self.pipes) if p is not None and i < len(keys)}
+
+bank = FilterBank()
+
+def check_spec(spec):
+    """Проверка секции "filter" канала (для /api/config). ValueError — при ошибке."""
+    if not isinstance(spec, dict):
+        raise ValueError("filter: expected object")
+    out = {}
+    for key, value in spec.items():
+        if key not in DEFAULTS:
+            raise ValueError("filter." + key + ": unknown field")
+        kind = type(DEFAULTS[key])
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value \
+                or (kind is int and value % 1):
+            raise ValueError("filter." + key + ": expected " + ("integer" if kind is int else "number"))
+        out[key] = kind(value)
+    f = dict(DEFAULTS)
+    f.update(out)
+    if not 1 <= f["oversample"] <= OVERSAMPLE_MAX:
+        raise ValueError("filter.oversample: 1..%d" % OVERSAMPLE_MAX)
+    if f["sps"] not in DR_SPS:
+        raise ValueError("filter.sps: one of " + ", ".join(str(s) for s in DR_SPS))
+    if not 1 <= f["median"] <= MEDIAN_MAX:
+        raise ValueError("filter.median: 1..%d" % MEDIAN_MAX)
+    if not 1 <= f["mean"] <= MEAN_MAX:
+        raise ValueError("filter.mean: 1..%d" % MEAN_MAX)
+    if f["max_rate"] < 0 or f["tau"] < 0:
+        raise ValueError("filter: max_rate and tau must be >= 0")
+    return out
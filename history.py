@@ -0,0 +1,163 @@
+# history.py
+# Кольцевой буфер тренда в типизированных массивах: отметка времени и
+# значения каналов хранятся столбцами (array), без списков словарей.
+# Столбцы — по карте каналов и контуров (Calibration.columns): величины,
+# затем поправка и действие каждого контура; при изменении карты столбцы
+# с прежними именами сохраняют историю, новые начинаются с NaN.
+# Выборка за интервал прореживается до заданного числа корзин,
+# в каждой корзине — минимум и максимум, чтобы не терять пики.
+from array import array
+import ticks
+
+PERIOD_MS = 5000     # шаг записи
+CAPACITY = 2160      # 3 часа при шаге 5 с: 8.6 КБ на столбец float32 (≈ 60 КБ на карту по умолчанию)
+MAX_POINTS = 500     # предел корзин в одном ответе
+
+ACTIONS = {"DOWN": -1, "HOLD": 0, "UP": 1}
+NAN = float("nan")
+
+class History:
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.columns = ()
+        self.t = array('I', bytes(4 * capacity))  # мс от запуска (не переполняется 49 суток)
+        self.data = []
+        self._sources = []   # по столбцам: (величина, None) или (контур, поле решения)
+        self._cal = None
+        self.head = 0        # индекс следующей записи
+        self.count = 0
+        self.uptime = 0
+        self._last = ticks.ticks_ms()
+
+    def configure(self, cal):
+        """Столбцы по скомпилированной карте cal; данные столбцов с прежними именами остаются."""
+        old = dict(zip(self.columns, self.data))
+        cap = self.capacity
+        data = []
+        sources = []
+        for name in cal.columns:
+            loop, _, field = name.rpartition(".")
+            if loop not in cal.loops:
+                loop, field = name, None
+            col = old.get(name)
+            if col is None:
+                # действие регулятора — -1/0/1, остальные столбцы — float32
+                col = array('b', bytes(cap)) if field == "action" else array('f', [NAN]) * cap
+            data.append(col)
+            sources.append((loop, field))
+        self.columns = cal.columns
+        self.data = data
+        self._sources = sources
+        self._cal = cal
+
+    def now(self):
+        """Мс от запуска; ticks_ms переполняется, поэтому накапливаем разности."""
+        t = ticks.ticks_ms()
+        self.uptime += ticks.ticks_diff(t, self._last)
+        self._last = t
+        return self.uptime
+
+    def append(self, cal, values, results):
+        """
+        Одна запись: cal — скомпилированная карта, values — значения величин
+        (Calibration.values_into), results — решения контуров по именам.
+        """
+        if cal is not self._cal:
+            self.configure(cal)
+        i = self.head
+        self.t[i] = self.now()
+        data = self.data
+        sources = self._sources
+        for k in range(len(data)):
+            key, field = sources[k]
+            if field is None:
+                v = values.get(key)
+            else:
+                result = results.get(key)
+                if field == "action":
+                    data[k][i] = ACTIONS.get(result.get("action"), 0) if result else 0
+                    continue
+                v = result.get(field) if result else None
+            data[k][i] = NAN if v is None else v
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def _index(self, k):
+        """k-я по возрасту запись → индекс в массивах."""
+        return (self.head - self.count + k) % self.capacity
+
+    def _bisect(self, t):
+        """Число записей старше t (отметки времени в кольце упорядочены)."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.t[self._index(mid)] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def query(self, t_from=None, t_to=None, points=MAX_POINTS):
+        """
+        Записи с t_from <= t <= t_to, прореженные до points корзин.
+        Отрицательные границы — относительно последней записи.
+        Возвращает (t, {канал: (min, max)}) — массивы длиной <= points.
+        """
+        last = self.t[self._index(self.count - 1)] if self.count else 0
+        if t_from is None:
+            t_from = 0
+        elif t_from < 0:
+            t_from += last
+        if t_to is None:
+            t_to = last
+        elif t_to < 0:
+            t_to += last
+        points = max(1, min(points, MAX_POINTS))
+        first = self._bisect(t_from)
+        end = self._bisect(t_to + 1)
+        n = max(0, end - first)
+        buckets = min(n, points)
+        t_out = array('I', bytes(4 * buckets))
+        out = [(array('f', bytes(4 * buckets)), array('f', bytes(4 * buckets))) for _ in self.columns]
+        cap = self.capacity
+        for b in range(buckets):
+            # Корзина b — записи [lo, hi): работа ограничена числом записей в интервале
+            lo = first + b * n // buckets
+            hi = first + (b + 1) * n // buckets
+            start = self._index(lo)
+            t_out[b] = self.t[start]
+            for col, (mins, maxs) in zip(self.data, out):
+                vmin = vmax = None
+                j = start
+                for _ in range(hi - lo):
+                    v = col[j]
+                    j += 1
+                    if j == cap:
+                        j = 0
+                    if v != v:  # NaN — датчик не дал значения
+                        continue
+                    if vmin is None or v < vmin:
+                        vmin = v
+                    if vmax is None or v > vmax:
+                        vmax = v
+                mins[b] = NAN if vmin is None else vmin
+                maxs[b] = NAN if vmax is None else vmax
+        return t_out, dict(zip(self.columns, out))
+
+    def pack(self, t_out, cols):
+        """
+        Двоичная форма выборки (little-endian, как память ESP32): uint16 число
+        корзин n, uint8 число столбцов, затем uint32[n] отметки времени и для
+        каждого столбца в порядке columns — float32[n] минимумы и float32[n] максимумы.
+        Массивы копируются как есть, без поэлементного преобразования.
+        """
+        n = len(t_out)
+        parts = [bytes((n & 0xFF, n >> 8, len(self.columns))), bytes(t_out)]
+        for name in self.columns:
+            mins, maxs = cols[name]
+            parts.append(bytes(mins))
+            parts.append(bytes(maxs))
+        return b"".join(parts)
+
+trend = History()
@@ -0,0 +1,119 @@
+# http_parser.py
+# Инкрементальный разбор HTTP/1.1 запросов в заранее выделенном буфере.
+# Данные дописываются через recv_into/readinto в space(), запросы
+# извлекаются next_request() по мере готовности — в том числе несколько
+# подряд (pipelining) и с телом, пришедшим несколькими сегментами TCP.
+
+from url_decode import url_decode
+
+BUF_SIZE = 2048
+MAX_HEADERS = 24
+
+class HttpError(Exception):
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+class Request:
+    def __init__(self, method, path, query, version, headers, body):
+        self.method = method    # b"GET"
+        self.path = path        # b"/api/values" (без строки запроса)
+        self.query = query      # b"from=1&to=2"
+        self.version = version  # b"HTTP/1.1"
+        self.headers = headers  # имя в нижнем регистре → значение (bytes)
+        self.body = body
+        conn = headers.get(b"connection", b"").lower()
+        if version == b"HTTP/1.1":
+            self.keep_alive = conn != b"close"
+        else:
+            self.keep_alive = conn == b"keep-alive"
+
+    def header(self, name, default=b""):
+        return self.headers.get(name, default)
+
+    def params(self):
+        """Параметры строки запроса: {str: str}."""
+        return parse_query(self.query)
+
+def parse_query(data):
+    params = {}
+    if not data:
+        return params
+    for pair in bytes(data).decode("utf-8").split("&"):
+        if "=" in pair:
+            k, v = pair.split("=", 1)
+            params[url_decode(k)] = url_decode(v)
+        elif pair:
+            params[url_decode(pair)] = ""
+    return params
+
+class RequestParser:
+    def __init__(self, size=BUF_SIZE):
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.start = 0  # начало необработанных данных
+        self.end = 0    # конец принятых данных
+
+    def reset(self):
+        self.start = self.end = 0
+
+    def pending(self):
+        return self.end - self.start
+
+    def space(self):
+        """Свободная часть буфера для recv_into; уже разобранное сдвигается в начало."""
+        if self.start:
+            n = self.end - self.start
+            if n:
+                self.buf[:n] = self.mv[self.start:self.end]
+            self.start, self.end = 0, n
+        return self.mv[self.end:]
+
+    def feed(self, n):
+        self.end += n
+
+    def next_request(self):
+        """Очередной полный запрос или None, если данных пока мало."""
+        if self.start == self.end:
+            return None
+        # bytearray в MicroPython не умеет find/split — работаем с копией принятого
+        data = bytes(self.mv[self.start:self.end])
+        head_end = data.find(b"\r\n\r\n")
+        if head_end < 0:
+            if len(data) >= len(self.buf):
+                raise HttpError(431, "Request Header Fields Too Large")
+            return None
+        lines = data[:head_end].split(b"\r\n")
+        parts = lines[0].split(b" ")
+        if len(parts) != 3 or not parts[1].startswith(b"/"):
+            raise HttpError(400, "Bad Request")
+        method, target, version = parts
+        if not version.startswith(b"HTTP/1."):
+            raise HttpError(505, "HTTP Version Not Supported")
+        path, _, query = target.partition(b"?")
+
+        if len(lines) > MAX_HEADERS + 1:
+            raise HttpError(431, "Request Header Fields Too Large")
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(b":")
+            if not sep:
+                raise HttpError(400, "Bad Request")
+            headers[name.strip().lower()] = value.strip()
+
+        if b"transfer-encoding" in headers:
+            raise HttpError(501, "Not Implemented")
+        try:
+            length = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            raise HttpError(400, "Bad Request")
+        if length < 0:
+            raise HttpError(400, "Bad Request")
+        body_start = head_end + 4
+        if body_start + length > len(self.buf):
+            raise HttpError(413, "Payload Too Large")
+        if len(data) - body_start < length:
+            return None  # тело ещё не пришло целиком
+        self.start += body_start + length
+        return Request(method, path, query, version, headers, data[body_start:body_start + length])
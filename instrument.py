@@ -0,0 +1,154 @@
+# instrument.py
+# Измерения по ticks_us: гистограммы длительности этапов (задачи планировщика,
+# HTTP-запросы по маршрутам) с фиксированными корзинами в заранее выделенных
+# массивах, счётчики и минимум свободной памяти. Отдаются в /metrics
+# (Prometheus text) и /metrics?format=json.
+# ENABLED = False — обёртки не ставятся вовсе, в горячем пути ничего не остаётся.
+from array import array
+import ticks
+try:
+    import gc
+    mem_free = gc.mem_free
+except (ImportError, AttributeError):
+    mem_free = None  # CPython: памяти кучи MicroPython нет
+
+ENABLED = True
+PREFIX = "newremicont_"
+
+# Верхние границы корзин, мкс; последняя корзина — всё, что длиннее
+BOUNDS_US = (50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000, 1000000)
+
+class Histogram:
+    def __init__(self, stage):
+        self.stage = stage
+        self.counts = array('I', bytes(4 * (len(BOUNDS_US) + 1)))
+        self.count = 0
+        # Сумма — целые секунды плюс остаток в мкс: одно число мкс через
+        # ~18 мин вышло бы за малое целое MicroPython, и каждое сложение
+        # выделяло бы память в куче
+        self.sum_s = 0
+        self.sum_us = 0
+        self.max_us = 0
+
+    def record(self, us):
+        i = 0
+        for bound in BOUNDS_US:
+            if us <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum_us += us
+        while self.sum_us >= 1000000:
+            self.sum_us -= 1000000
+            self.sum_s += 1
+        if us > self.max_us:
+            self.max_us = us
+
+    def total_s(self):
+        return self.sum_s + self.sum_us / 1000000
+
+stages = {}      # этап → Histogram
+counters = {}    # имя → число событий
+gauges = []      # (имя, справка, fn() → число или {метка: число}, тип, имя метки)
+mem_low = None   # наименьший gc.mem_free() с запуска
+
+def stage(name):
+    h = stages.get(name)
+    if h is None:
+        h = stages[name] = Histogram(name)
+    return h
+
+def timed(name, fn):
+    """fn, измеряемая как этап name; при ENABLED = False — сама fn без обёртки."""
+    if not ENABLED:
+        return fn
+    h = stage(name)
+    def wrapper(*args):
+        t0 = ticks.ticks_us()
+        try:
+            return fn(*args)
+        finally:
+            h.record(ticks.ticks_diff(ticks.ticks_us(), t0))
+    return wrapper
+
+def count(name, n=1):
+    if ENABLED:
+        counters[name] = counters.get(name, 0) + n
+
+def gauge(name, help_text, fn, kind="gauge", label="key"):
+    """Значение, снимаемое при запросе /metrics; kind="counter" — для накопительных счётчиков."""
+    if ENABLED:
+        gauges.append((name, help_text, fn, kind, label))
+
+def sample_memory():
+    """Задача планировщика: минимум свободной памяти между сборками мусора."""
+    global mem_low
+    if mem_free is None:
+        return
+    free = mem_free()
+    if mem_low is None or free < mem_low:
+        mem_low = free
+
+def _gauge_values():
+    for name, help_text, fn, kind, label in gauges:
+        try:
+            value = fn()
+        except Exception as e:
+            print("Metrics error:", name, e)
+            continue
+        if value is not None:
+            yield name, help_text, value, kind, label
+
+def snapshot():
+    """Все измерения в виде словаря (для JSON)."""
+    mem = {"free": mem_free() if mem_free else None, "low_water": mem_low}
+    return {
+        "enabled": ENABLED,
+        "bounds_us": BOUNDS_US,
+        "stages": {name: {"count": h.count, "sum_us": h.sum_s * 1000000 + h.sum_us, "max_us": h.max_us, "buckets": list(h.counts)}
+                   for name, h in stages.items()},
+        "counters": counters,
+        "gauges": {g[0]: g[2] for g in _gauge_values()},
+        "memory": mem,
+    }
+
+def _num(value):
+    return "NaN" if value is None else str(int(value) if isinstance(value, bool) else value)
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+def prometheus():
+    """Текстовый формат Prometheus 0.0.4."""
+    out = []
+    add = out.append
+    name = PREFIX + "stage_seconds"
+    add("# HELP %s Duration of scheduler jobs and HTTP requests.\n# TYPE %s histogram\n" % (name, name))
+    for stage_name, h in stages.items():
+        label = _label(stage_name)
+        total = 0
+        for i, bound in enumerate(BOUNDS_US):
+            total += h.counts[i]
+            add('%s_bucket{stage="%s",le="%g"} %d\n' % (name, label, bound / 1000000, total))
+        add('%s_bucket{stage="%s",le="+Inf"} %d\n' % (name, label, h.count))
+        add('%s_sum{stage="%s"} %.6f\n' % (name, label, h.total_s()))
+        add('%s_count{stage="%s"} %d\n' % (name, label, h.count))
+    if counters:
+        name = PREFIX + "events_total"
+        add("# HELP %s Event counters.\n# TYPE %s counter\n" % (name, name))
+        for key in counters:
+            add('%s{event="%s"} %d\n' % (name, _label(key), counters[key]))
+    for gname, help_text, value, kind, label in _gauge_values():
+        name = PREFIX + gname
+        add("# HELP %s %s\n# TYPE %s %s\n" % (name, help_text, name, kind))
+        if isinstance(value, dict):
+            for key in value:
+                add('%s{%s="%s"} %s\n' % (name, label, _label(key), _num(value[key])))
+        else:
+            add("%s %s\n" % (name, _num(value)))
+    if mem_free is not None:
+        add("# TYPE %smem_free_bytes gauge\n%smem_free_bytes %d\n" % (PREFIX, PREFIX, mem_free()))
+        if mem_low is not None:
+            add("# TYPE %smem_free_low_bytes gauge\n%smem_free_low_bytes %d\n" % (PREFIX, PREFIX, mem_low))
+    return "".join(out)
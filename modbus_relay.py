@@ -1,35 +1,236 @@
-# modbus_relay.py
-from machine import UART, Pin
-import time
-
-uart = UART(1, baudrate=9600, tx=Pin(0), rx=Pin(1), bits=8, parity=None, stop=1)
-
-def modbus_crc(data):
-    crc = 0xFFFF
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 0x0001:
-                crc >>= 1
-                crc ^= 0xA001
-            else:
-                crc >>= 1
-    return crc
-
-def set_relay(channel, state):
-    if not (1 <= channel <= 4):
-        return False
-    device_id = 0x02
-    function = 0x05
-    coil_address = channel - 1
-    value = 0xFF00 if state else 0x0000
-
-    data = bytearray([device_id, function])
-    data.extend(coil_address.to_bytes(2, 'big'))
-    data.extend(value.to_bytes(2, 'big'))
-    crc = modbus_crc(data)
-    data.extend(crc.to_bytes(2, 'little'))
-
-    uart.write(data)
-    time.sleep_ms(50)
-    return True
\ No newline at end of file
+# modbus_relay.py
+from machine import UART, Pin
+import ticks
+from modbus_rtu import RtuMaster, Transaction, crc16, coil_frame, OK
+from modbus_rtu import FC_WRITE_COIL, FC_WRITE_COILS, FC_READ_COILS
+
+BAUDRATE = 9600
+RELAY_ID = 0x02
+
+RESPONSE_TIMEOUT_MS = 100  # ответ на 8 байт при 9600 бод приходит за ~10 мс
+RETRIES = 2                # повторов после первой неудачной попытки
+OFF_RETRY_MS = 500         # неподтверждённое ВЫКЛ повторяется, пока реле не ответит
+
+ALL = 0  # «канал» групповой команды 0x0F
+
+uart = UART(1, baudrate=BAUDRATE, tx=Pin(0), rx=Pin(1), bits=8, parity=None, stop=1)
+bus = RtuMaster(uart, BAUDRATE, RESPONSE_TIMEOUT_MS, RETRIES)
+
+def modbus_crc(data):
+    return crc16(data)
+
+class RelayDriver:
+    """
+    Очередь команд для Modbus-реле на общей шине bus (RtuMaster).
+    Команды (в том числе отложенное ВЫКЛ импульса) отправляются из poll()
+    без ожидания; эхо проверяет RtuMaster, при неудаче команда повторяется.
+    Кадры одиночных команд вычисляются один раз при создании; записи очереди
+    и транзакции шины тоже заранее выделены и используются повторно.
+    """
+
+    def __init__(self, bus, device_id=RELAY_ID, channels=4):
+        self.bus = bus
+        self.device_id = device_id
+        self.channels = channels
+        self.state = [None] * channels   # подтверждённое состояние (None — неизвестно)
+        self.faults = [False] * channels # последняя попытка не подтверждена / реле «залипло»
+        self.errors = [0] * channels     # неудачные попытки по каналу
+        self.mismatches = 0              # считанное состояние не совпало с ожидаемым
+        self._frames = [(coil_frame(device_id, ch, False), coil_frame(device_id, ch, True))
+                        for ch in range(channels)]
+        self._queue = []                 # [срок ticks_ms, канал, состояние]
+        # На канал — не больше двух команд (ВКЛ и ВЫКЛ импульса), плюс групповая
+        self._free = [[0, 0, False] for _ in range(2 * channels + 1)]
+        self._write = Transaction(device_id, FC_WRITE_COIL, callback=self._on_write)
+        self._readback = Transaction(device_id, FC_READ_COILS, 0, channels, callback=self._on_readback)
+        self._txn = None
+        self._cmd_channel = None         # команда, отправленная на шину
+        self._cmd_state = False
+
+    def _drop(self, channel):
+        queue = self._queue
+        i = len(queue)
+        while i:
+            i -= 1
+            if queue[i][1] == channel:
+                self._free.append(queue.pop(i))
+
+    def _push(self, due, channel, state):
+        c = self._free.pop() if self._free else [0, 0, False]
+        c[0] = due
+        c[1] = channel
+        c[2] = state
+        self._queue.append(c)
+
+    def set(self, channel, state, delay_ms=0):
+        """Ставит команду в очередь; заменяет ещё не отправленные команды канала."""
+        if not (1 <= channel <= self.channels):
+            return False
+        self._drop(channel)
+        self._push(ticks.ticks_add(ticks.ticks_ms(), delay_ms), channel, bool(state))
+        return True
+
+    def set_all(self, mask):
+        """
+        Все каналы одним кадром 0x0F: бит i маски — канал i+1. Команды каналов,
+        которые маска выключает, снимаются; отложенное ВЫКЛ импульса канала,
+        который маска включает, остаётся и выполняется после группового кадра.
+        """
+        now = ticks.ticks_ms()
+        queue = self._queue
+        i = len(queue)
+        while i:
+            i -= 1
+            c = queue[i]
+            if c[1] == ALL or c[2] or not mask >> (c[1] - 1) & 1:
+                self._free.append(queue.pop(i))
+            elif ticks.ticks_diff(c[0], now) <= 0:
+                c[0] = ticks.ticks_add(now, 1)  # не раньше группового кадра
+        self._push(now, ALL, mask)
+
+    def pulse(self, channel, duration_ms):
+        """ВКЛ сейчас и ВЫКЛ через duration_ms — без ожидания."""
+        if not self.set(channel, True):
+            return False
+        self._push(ticks.ticks_add(ticks.ticks_ms(), duration_ms), channel, False)
+        return True
+
+    def pending(self, channel):
+        cmd = self._cmd_channel
+        if cmd is not None and (cmd == channel or cmd == ALL):
+            return True
+        for c in self._queue:
+            if c[1] == channel or c[1] == ALL:
+                return True
+        return False
+
+    def next_due(self):
+        """ticks_ms ближайшей команды в очереди; None — ждать нечего (или идёт обмен)."""
+        if self._txn is not None:
+            return None
+        due = None
+        for c in self._queue:
+            if due is None or ticks.ticks_diff(c[0], due) < 0:
+                due = c[0]
+        return due
+
+    def verify(self):
+        """Читает катушки (0x01) и сверяет с подтверждённым состоянием."""
+        if self._txn is None:
+            self._txn = self.bus.submit(self._readback.rearm())
+
+    def poll(self):
+        """Один неблокирующий шаг: отправляет созревшую команду в очередь шины."""
+        txn = self._txn
+        if txn is not None:
+            if txn.failures and self._cmd_channel is not None:
+                # Реле не ответило за один таймаут — отмечаем сразу, не дожидаясь повторов
+                self._mark_fault(self._cmd_channel)
+            return
+        if not self._queue:
+            return
+        now = ticks.ticks_ms()
+        due = None
+        for c in self._queue:
+            if ticks.ticks_diff(now, c[0]) >= 0 and (due is None or ticks.ticks_diff(c[0], due[0]) < 0):
+                due = c
+        if due is None:
+            return
+        self._queue.remove(due)
+        self._free.append(due)
+        channel, state = due[1], due[2]
+        self._cmd_channel = channel
+        self._cmd_state = state
+        txn = self._write.rearm()
+        if channel == ALL:
+            txn.fc = FC_WRITE_COILS
+            txn.count = self.channels
+            txn.value = state
+            txn.frame = None
+        else:
+            txn.fc = FC_WRITE_COIL
+            txn.count = 1
+            txn.frame = self._frames[channel - 1][state]
+        self._txn = self.bus.submit(txn)
+
+    def _mark_fault(self, channel):
+        if channel == ALL:
+            for i in range(self.channels):
+                self.faults[i] = True
+        else:
+            self.faults[channel - 1] = True
+
+    def _on_write(self, txn):
+        channel, state = self._cmd_channel, self._cmd_state
+        self._txn = None
+        self._cmd_channel = None
+        if channel == ALL:
+            first, last = 1, self.channels
+        else:
+            first = last = channel
+        for ch in range(first, last + 1):
+            st = bool(state >> (ch - 1) & 1) if channel == ALL else state
+            if txn.failures:
+                self.errors[ch - 1] += txn.failures
+            if txn.status == OK:
+                self.state[ch - 1] = st
+                self.faults[ch - 1] = False
+            else:
+                self.faults[ch - 1] = True
+                print("Relay error: channel", ch, "no confirmation")
+                if not st and not self.pending(ch):
+                    # Реле могло остаться включённым — повторяем ВЫКЛ, пока не подтвердится
+                    self.set(ch, False, OFF_RETRY_MS)
+
+    def _on_readback(self, txn):
+        self._txn = None
+        if txn.status != OK:
+            for i in range(self.channels):
+                self.faults[i] = True
+            return
+        for i in range(self.channels):
+            actual = bool(txn.result >> i & 1)
+            if self.state[i] is not None and self.state[i] != actual and not self.pending(i + 1):
+                self.mismatches += 1
+                self.faults[i] = True
+                print("Relay error: channel", i + 1, "state", actual)
+            self.state[i] = actual
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "faults": self.faults,
+            "errors": self.errors,
+            "mismatches": self.mismatches,
+            "bus": self.bus.stats(),
+        }
+
+relay = RelayDriver(bus)
+
+def poll():
+    """Шаг очереди реле и шины Modbus."""
+    relay.poll()
+    bus.poll()
+
+def _wait(channel):
+    limit = (bus.retries + 1) * (bus.timeout_ms + 20 + bus.gap_ms) + 50
+    t0 = ticks.ticks_ms()
+    while relay.pending(channel) and ticks.ticks_diff(ticks.ticks_ms(), t0) < limit:
+        poll()
+        ticks.sleep_ms(1)
+
+def set_relay(channel, state):
+    """
+    Блокирующая команда с подтверждением — для вызовов вне планировщика.
+    Возвращает True, если реле подтвердило новое состояние.
+    """
+    if not relay.set(channel, state):
+        return False
+    _wait(channel)
+    return relay.state[channel - 1] == bool(state)
+
+def all_off():
+    """Блокирующее выключение всех каналов одним кадром."""
+    relay.set_all(0)
+    _wait(ALL)
+    return not any(relay.state)
@@ -0,0 +1,291 @@
+# modbus_rtu.py
+# Modbus RTU master: табличный CRC, очередь транзакций с неблокирующим
+# приёмом ответа, повторами и паузой 3.5 символа между кадрами.
+# Одна линия RS-485 обслуживает несколько ведомых (реле, датчики).
+from array import array
+import ticks
+
+FC_READ_COILS = 0x01
+FC_READ_HOLDING = 0x03
+FC_READ_INPUT = 0x04
+FC_WRITE_COIL = 0x05
+FC_WRITE_REGISTER = 0x06
+FC_WRITE_COILS = 0x0F
+FC_WRITE_REGISTERS = 0x10
+
+MAX_ADU = 256
+
+def _make_crc_table():
+    table = array('H', bytes(512))
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table[i] = crc
+    return table
+
+CRC_TABLE = _make_crc_table()
+
+def crc16(data, n=-1):
+    """CRC-16/MODBUS первых n байт data (по умолчанию — всех)."""
+    if n < 0:
+        n = len(data)
+    crc = 0xFFFF
+    table = CRC_TABLE
+    for i in range(n):
+        crc = (crc >> 8) ^ table[(crc ^ data[i]) & 0xFF]
+    return crc
+
+def char_us(baudrate):
+    """Длительность символа RTU (11 бит) в мкс."""
+    return 11000000 // baudrate
+
+def frame_gap_ms(baudrate):
+    """Пауза между кадрами: 3.5 символа, но не меньше 1.75 мс (выше 19200 бод)."""
+    us = 35 * char_us(baudrate) // 10
+    if baudrate > 19200:
+        us = 1750
+    return (us + 999) // 1000
+
+def _put_crc(buf, n):
+    crc = crc16(buf, n)
+    buf[n] = crc & 0xFF
+    buf[n + 1] = crc >> 8
+    return n + 2
+
+def build_request(buf, slave, fc, addr, value):
+    """Кадр из 8 байт для функций 0x01/0x03/0x04 (value — количество) и 0x05/0x06."""
+    buf[0] = slave
+    buf[1] = fc
+    buf[2] = addr >> 8
+    buf[3] = addr & 0xFF
+    buf[4] = value >> 8
+    buf[5] = value & 0xFF
+    return _put_crc(buf, 6)
+
+def build_write_coils(buf, slave, addr, count, bits):
+    """Кадр функции 0x0F: count катушек, начиная с addr, из битовой маски bits."""
+    nbytes = (count + 7) // 8
+    buf[0] = slave
+    buf[1] = FC_WRITE_COILS
+    buf[2] = addr >> 8
+    buf[3] = addr & 0xFF
+    buf[4] = count >> 8
+    buf[5] = count & 0xFF
+    buf[6] = nbytes
+    for i in range(nbytes):
+        buf[7 + i] = (bits >> (8 * i)) & 0xFF
+    return _put_crc(buf, 7 + nbytes)
+
+def coil_frame(slave, coil, state):
+    """Готовый кадр записи одной катушки (для неизменных команд)."""
+    buf = bytearray(8)
+    build_request(buf, slave, FC_WRITE_COIL, coil, 0xFF00 if state else 0x0000)
+    return bytes(buf)
+
+def response_length(fc, count):
+    if fc == FC_READ_COILS:
+        return 5 + (count + 7) // 8
+    if fc == FC_READ_HOLDING or fc == FC_READ_INPUT:
+        return 5 + 2 * count
+    return 8  # 0x05, 0x06, 0x0F — эхо адреса и значения/количества
+
+PENDING = 0
+OK = 1
+FAILED = 2
+
+class Transaction:
+    """
+    Запрос к ведомому. Либо готовый кадр frame, либо параметры для сборки.
+    По завершении status = OK/FAILED, result — значение ответа
+    (битовая маска для 0x01, список регистров для 0x03/0x04),
+    затем вызывается callback(txn). Завершённый запрос можно отправить
+    снова после rearm() — постоянным командам не нужен новый объект.
+    """
+
+    def __init__(self, slave, fc, addr=0, count=1, value=0, frame=None, callback=None):
+        self.slave = slave
+        self.fc = fc
+        self.addr = addr
+        self.count = count
+        self.value = value
+        self.frame = frame
+        self.callback = callback
+        self.status = PENDING
+        self.failures = 0       # неудачные попытки (таймаут, CRC, чужой адрес; исключение — без повтора)
+        self.exception = 0      # код исключения Modbus, если был
+        self.result = None
+
+    def rearm(self):
+        self.status = PENDING
+        self.failures = 0
+        self.exception = 0
+        self.result = None
+        return self
+
+class RtuMaster:
+    def __init__(self, uart, baudrate=9600, timeout_ms=100, retries=2):
+        self.uart = uart
+        self.timeout_ms = timeout_ms
+        self.retries = retries
+        self.char_us = char_us(baudrate)
+        self.gap_ms = frame_gap_ms(baudrate)
+        self.queue = []
+        self.frames_sent = 0
+        self.timeouts = 0
+        self.crc_errors = 0
+        self.exceptions = 0
+        self.slave_errors = {}  # адрес ведомого → неудачные попытки
+        self._txn = None
+        self._deadline = 0
+        self._idle_at = ticks.ticks_ms()
+        self._tx = bytearray(MAX_ADU)
+        self._tx_len = 0
+        self._tx_views = {}
+        self._rx = bytearray(MAX_ADU)
+        self._chunk = bytearray(MAX_ADU)  # приём порции: срез memoryview — тоже объект в куче
+        self._rx_len = 0
+        self._expect = 0
+
+    def submit(self, txn):
+        self.queue.append(txn)
+        return txn
+
+    def busy(self):
+        return self._txn is not None or bool(self.queue)
+
+    def poll(self):
+        """Один неблокирующий шаг: приём ответа или отправка следующего запроса."""
+        if self._txn is not None:
+            self._poll_response()
+        elif self.queue and ticks.ticks_diff(ticks.ticks_ms(), self._idle_at) >= 0:
+            self._txn = self.queue.pop(0)
+            self._send()
+
+    def _tx_ms(self, nbytes):
+        return (nbytes * self.char_us + 999) // 1000
+
+    def _send(self):
+        txn = self._txn
+        if txn.frame is not None:
+            frame = txn.frame
+            n = len(frame)
+        else:
+            frame = self._tx
+            if txn.fc == FC_WRITE_COILS:
+                n = build_write_coils(frame, txn.slave, txn.addr, txn.count, txn.value)
+            else:
+                value = txn.value if txn.fc == FC_WRITE_COIL or txn.fc == FC_WRITE_REGISTER else txn.count
+                n = build_request(frame, txn.slave, txn.fc, txn.addr, value)
+        self._expect = response_length(txn.fc, txn.count)
+        uart = self.uart
+        # Остатки прошлых ответов не должны смешаться с новым
+        while uart.any():
+            uart.read()
+        self._rx_len = 0
+        uart.write(frame if n == len(frame) else self._tx_view(n))
+        self.frames_sent += 1
+        # Ответ не может начаться раньше, чем уйдёт запрос
+        self._deadline = ticks.ticks_add(ticks.ticks_ms(), self._tx_ms(n + self._expect) + self.timeout_ms)
+
+    def _tx_view(self, n):
+        # Срез буфера сборки; длин кадров немного — срезы создаются один раз
+        view = self._tx_views.get(n)
+        if view is None:
+            view = self._tx_views[n] = memoryview(self._tx)[:n]
+        return view
+
+    def _poll_response(self):
+        uart = self.uart
+        n = uart.any()
+        if n:
+            n = min(n, self._expect - self._rx_len)
+            chunk = self._chunk
+            got = uart.readinto(chunk, n)
+            rx = self._rx
+            if got:
+                pos = self._rx_len
+                for i in range(got):
+                    rx[pos + i] = chunk[i]
+                self._rx_len = pos + got
+            txn = self._txn
+            if self._rx_len >= 5 and rx[1] == txn.fc | 0x80:
+                if self._check_crc(5) and rx[0] == txn.slave:
+                    # Устройство ответило и отказало: повтор получит тот же отказ
+                    txn.exception = rx[2]
+                    txn.failures += 1
+                    self.exceptions += 1
+                    self.slave_errors[txn.slave] = self.slave_errors.get(txn.slave, 0) + 1
+                    self._idle_at = ticks.ticks_add(ticks.ticks_ms(), self.gap_ms)
+                    self._finish(FAILED)
+                else:
+                    self._fail()
+            elif self._rx_len >= self._expect:
+                if not self._check_crc(self._expect):
+                    self._fail()
+                elif rx[0] != txn.slave or rx[1] != txn.fc:
+                    self._fail()
+                else:
+                    self._parse()
+                    self._finish(OK)
+        elif ticks.ticks_diff(ticks.ticks_ms(), self._deadline) > 0:
+            self.timeouts += 1
+            self._fail()
+
+    def _check_crc(self, n):
+        rx = self._rx
+        if crc16(rx, n - 2) == rx[n - 2] | (rx[n - 1] << 8):
+            return True
+        self.crc_errors += 1
+        return False
+
+    def _parse(self):
+        txn = self._txn
+        rx = self._rx
+        if txn.fc == FC_READ_COILS:
+            bits = 0
+            for i in range(rx[2]):
+                bits |= rx[3 + i] << (8 * i)
+            txn.result = bits & ((1 << txn.count) - 1)
+        elif txn.fc in (FC_READ_HOLDING, FC_READ_INPUT):
+            txn.result = [(rx[3 + 2 * i] << 8) | rx[4 + 2 * i] for i in range(txn.count)]
+        elif txn.fc == FC_WRITE_COIL or txn.fc == FC_WRITE_REGISTER:
+            txn.result = (rx[4] << 8) | rx[5]
+        else:
+            txn.result = txn.value
+
+    def _fail(self):
+        txn = self._txn
+        txn.failures += 1
+        self.slave_errors[txn.slave] = self.slave_errors.get(txn.slave, 0) + 1
+        # Хвост испорченного ответа должен закончиться до повтора
+        self._idle_at = ticks.ticks_add(ticks.ticks_ms(), self.gap_ms)
+        if txn.failures <= self.retries:
+            self.queue.insert(0, txn)
+            self._txn = None
+            return
+        self._finish(FAILED)
+
+    def _finish(self, status):
+        txn = self._txn
+        self._txn = None
+        txn.status = status
+        if status == OK:
+            self._idle_at = ticks.ticks_add(ticks.ticks_ms(), self.gap_ms)
+        if txn.callback is not None:
+            try:
+                txn.callback(txn)
+            except Exception as e:
+                print("Modbus callback error:", e)
+
+    def stats(self):
+        return {
+            "frames_sent": self.frames_sent,
+            "timeouts": self.timeouts,
+            "crc_errors": self.crc_errors,
+            "exceptions": self.exceptions,
+            "slave_errors": self.slave_errors,
+        }
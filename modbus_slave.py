@@ -0,0 +1,391 @@
+# modbus_slave.py
+# Modbus-сервер для SCADA: TCP на точке доступа (порт 502) и, по выбору,
+# RTU на втором UART. Запрос разбирается и ответ собирается в буферах,
+# выделенных один раз на соединение или линию; значения регистров
+# считаются при чтении из последнего отсчёта АЦП и решений контуров —
+# опрос раз в 100 мс не рендерит страниц и не задерживает регулятор.
+# Уставки записываются через config_manager, как из веб-интерфейса.
+#
+# Input registers (0x04) — знаковые целые, величина × scale (секция "modbus";
+# без своего масштаба — наибольший из 100, 10, 1, 0.1, ..., при котором весь
+# диапазон величины по калибровке помещается в int16):
+#   0..89         величины карты каналов по порядку (channels, затем derived)
+#   90            номер отсчёта АЦП (младшие 16 бит)
+#   91, 92        реле: включены / с отказом, бит i — реле i+1
+#   93, 94        число величин и контуров
+#   100 + 20·k    контур k из "loops": +0 состояние (STATUS), +1 действие
+#                 (ACTIONS), +2..+8 поля LOOP_FIELDS, +9 импульс (мс),
+#                 +10 число импульсов
+# Holding registers (0x03, 0x06, 0x10):
+#   20·k          контур k: +0 enabled (0/1), +1 o2_setpoint, +2 deadband
+# Нет значения (датчик, решение) — 0x8000 (−32768).
+from machine import UART, Pin
+import ticks
+from modbus_rtu import crc16, frame_gap_ms, MAX_ADU
+from modbus_rtu import FC_READ_HOLDING, FC_READ_INPUT, FC_WRITE_REGISTER, FC_WRITE_REGISTERS
+from config_manager import load_config, save_config
+from ads1115 import engine as adc
+from modbus_relay import relay
+import air_pressure_controller
+import calibration
+
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_ADDRESS = 0x02
+ILLEGAL_VALUE = 0x03
+
+MAX_READ = 125             # регистров в одном чтении (ограничение протокола)
+MAX_WRITE = 123
+NO_VALUE = 0x8000
+DEFAULT_SCALE = 100        # величина без своего масштаба: сотые доли, если диапазон позволяет
+INT16_MAX = 32767
+O2_MAX = 21.0              # предел уставки и зоны O2, %
+
+IR_SEQ = 90
+IR_RELAYS = 91
+IR_FAULTS = 92
+IR_QUANTITIES = 93
+IR_LOOPS = 94
+LOOP_BASE = 100
+LOOP_SIZE = 20
+
+# Состояние контура (регистр +0)
+ST_NONE = 0       # решения ещё не было
+ST_DISABLED = 1
+ST_PID = 2
+ST_AUTOTUNE = 3
+ST_INVALID = 4    # нет данных датчиков
+ST_UNSAFE = 5     # давление вне безопасных пределов
+ACTIONS = {"HOLD": 0, "UP": 1, "DOWN": 2, "MOVING": 3}
+# Регистры контура +2..+8: поле результата и величина контура, чей масштаб берётся
+LOOP_FIELDS = (("o2_avg", "o2"), ("error", "o2"), ("correction", "pressure"),
+               ("air_target_base", "pressure"), ("pressure_target", "pressure"),
+               ("air_pressure", "pressure"), ("gas_flow", "gas"))
+# Holding-регистры контура: поле секции ПИД и величина масштаба (None — флаг 0/1)
+HOLDING = (("enabled", None), ("o2_setpoint", "o2"), ("deadband", "o2"))
+
+MBAP = 7  # заголовок Modbus TCP: транзакция, протокол, длина, unit
+
+def default_scale(limit):
+    """Наибольший масштаб 100 / 10ⁿ, при котором ±limit помещается в int16."""
+    scale = DEFAULT_SCALE
+    n = 0
+    while limit * scale > INT16_MAX and n < 9:
+        n += 1
+        scale = DEFAULT_SCALE / 10 ** n
+    return scale
+
+def scales(cfg):
+    """Масштаб каждой величины карты: из секции "modbus" или по её диапазону."""
+    explicit = cfg["modbus"]["scale"]
+    out = {}
+    for quantity, limit in calibration.limits(cfg).items():
+        out[quantity] = explicit.get(quantity) or default_scale(limit)
+    return out
+
+def _scaled(x, scale):
+    """Число → регистр (дополнительный код); не число, NaN — NO_VALUE."""
+    if type(x) is not float and type(x) is not int:
+        return NO_VALUE
+    x *= scale
+    if x != x:
+        return NO_VALUE
+    if x > INT16_MAX:
+        return INT16_MAX
+    if x < -INT16_MAX:
+        return NO_VALUE + 1  # −32767: −32768 занят под «нет значения»
+    return int(round(x)) & 0xFFFF
+
+def _status(result):
+    if result is None:
+        return ST_NONE
+    mode = result.get("mode")
+    if mode is not None:
+        return ST_AUTOTUNE if mode == "autotune" else ST_PID
+    if "status" in result:
+        return ST_DISABLED
+    if "warning" in result:
+        return ST_UNSAFE
+    return ST_INVALID
+
+class Server:
+    """
+    Регистры и разбор PDU (функция + данные); кадры TCP и RTU собирает
+    транспорт. process() пишет ответ в переданный буфер и не выделяет
+    контейнеров — кроме записи уставок, где меняется конфигурация.
+    """
+
+    def __init__(self, unit=1):
+        self.unit = unit
+        self.requests = 0
+        self.exceptions = 0
+        self.writes = 0
+        self._values = {}
+        self._cal = None
+        self._scales = {}
+
+    def _scale(self, cfg, quantity):
+        # Масштабы пересчитываются вместе с калибровкой — при изменении конфигурации
+        cal = calibration.compiled(cfg)
+        if cal is not self._cal:
+            self._scales = scales(cfg)
+            self._cal = cal
+        return self._scales.get(quantity, DEFAULT_SCALE)
+
+    def process(self, rx, pos, n, tx, opos):
+        """PDU запроса rx[pos:pos + n] → PDU ответа в tx с opos; возвращает длину ответа."""
+        self.requests += 1
+        fc = rx[pos]
+        if fc != FC_READ_INPUT and fc != FC_READ_HOLDING and fc != FC_WRITE_REGISTER \
+                and fc != FC_WRITE_REGISTERS:
+            return self._exception(tx, opos, fc, ILLEGAL_FUNCTION)
+        if n < 5:
+            return self._exception(tx, opos, fc, ILLEGAL_VALUE)
+        addr = (rx[pos + 1] << 8) | rx[pos + 2]
+        count = (rx[pos + 3] << 8) | rx[pos + 4]
+        cfg = load_config()
+        if fc == FC_READ_INPUT or fc == FC_READ_HOLDING:
+            if not 1 <= count <= MAX_READ:
+                return self._exception(tx, opos, fc, ILLEGAL_VALUE)
+            if fc == FC_READ_INPUT:
+                ok = self._read_input(cfg, addr, count, tx, opos + 2)
+            else:
+                ok = self._read_holding(cfg, addr, count, tx, opos + 2)
+            if not ok:
+                return self._exception(tx, opos, fc, ILLEGAL_ADDRESS)
+            tx[opos] = fc
+            tx[opos + 1] = 2 * count
+            return 2 + 2 * count
+        if fc == FC_WRITE_REGISTER:
+            code = self._write(cfg, addr, 1, rx, pos + 3)
+        elif not 1 <= count <= MAX_WRITE or n < 6 + 2 * count or rx[pos + 5] != 2 * count:
+            code = ILLEGAL_VALUE
+        else:
+            code = self._write(cfg, addr, count, rx, pos + 6)
+        if code:
+            return self._exception(tx, opos, fc, code)
+        # Ответ на запись — эхо функции, адреса и значения (количества)
+        for i in range(5):
+            tx[opos + i] = rx[pos + i]
+        return 5
+
+    def _exception(self, tx, opos, fc, code):
+        self.exceptions += 1
+        tx[opos] = fc | 0x80
+        tx[opos + 1] = code
+        return 2
+
+    # === Input registers ===
+    def _read_input(self, cfg, addr, count, tx, o):
+        cal = calibration.compiled(cfg)
+        values = self._values
+        if adc.layout == cal.layout:
+            cal.values_into(adc.filtered, values)
+        else:
+            # Отсчёт ещё по прежней карте каналов
+            for q in cal.quantities:
+                values[q] = None
+        loops = cfg["loops"]
+        end = LOOP_BASE + LOOP_SIZE * len(loops)
+        for a in range(addr, addr + count):
+            if a >= end:
+                return False
+            if a < IR_SEQ:
+                if a < len(cal.quantities):
+                    q = cal.quantities[a]
+                    v = _scaled(values.get(q), self._scale(cfg, q))
+                else:
+                    v = NO_VALUE
+            elif a < LOOP_BASE:
+                v = self._status_register(a, cal, loops)
+            else:
+                spec = loops[(a - LOOP_BASE) // LOOP_SIZE]
+                v = self._loop_register(cfg, spec, (a - LOOP_BASE) % LOOP_SIZE)
+            tx[o] = v >> 8
+            tx[o + 1] = v & 0xFF
+            o += 2
+        return True
+
+    def _status_register(self, a, cal, loops):
+        if a == IR_SEQ:
+            return adc.seq & 0xFFFF
+        if a == IR_RELAYS or a == IR_FAULTS:
+            bits = relay.state if a == IR_RELAYS else relay.faults
+            mask = 0
+            for i in range(len(bits)):
+                if bits[i]:
+                    mask |= 1 << i
+            return mask
+        if a == IR_QUANTITIES:
+            return len(cal.quantities)
+        if a == IR_LOOPS:
+            return len(loops)
+        return 0
+
+    def _loop_register(self, cfg, spec, offset):
+        result = air_pressure_controller.results.get(spec["name"])
+        if offset == 0:
+            return _status(result)
+        if offset == 1:
+            return ACTIONS.get(result.get("action"), 0) if result is not None else 0
+        if offset < 2 + len(LOOP_FIELDS):
+            if result is None:
+                return NO_VALUE
+            field, quantity = LOOP_FIELDS[offset - 2]
+            return _scaled(result.get(field), self._scale(cfg, spec[quantity]))
+        if offset == 9:
+            return _scaled(result.get("pulse"), 1000) if result is not None else NO_VALUE
+        if offset == 10:
+            loop = air_pressure_controller.loops.get(spec["name"])
+            return loop.actuator.pulses & 0xFFFF if loop is not None else 0
+        return 0
+
+    # === Holding registers ===
+    def _read_holding(self, cfg, addr, count, tx, o):
+        loops = cfg["loops"]
+        for a in range(addr, addr + count):
+            k = a // LOOP_SIZE
+            if k >= len(loops):
+                return False
+            offset = a % LOOP_SIZE
+            v = 0
+            if offset < len(HOLDING):
+                spec = loops[k]
+                pid = cfg[spec["pid"]]
+                field, quantity = HOLDING[offset]
+                if quantity is None:
+                    v = 1 if pid.get(field) else 0
+                else:
+                    v = _scaled(pid.get(field), self._scale(cfg, spec[quantity]))
+            tx[o] = v >> 8
+            tx[o + 1] = v & 0xFF
+            o += 2
+        return True
+
+    def _write(self, cfg, addr, count, rx, pos):
+        """Проверяет все значения и одним save_config() записывает их в секции ПИД; код исключения или 0."""
+        loops = cfg["loops"]
+        updates = {}
+        for i in range(count):
+            a = addr + i
+            k = a // LOOP_SIZE
+            offset = a % LOOP_SIZE
+            if k >= len(loops) or offset >= len(HOLDING):
+                return ILLEGAL_ADDRESS
+            raw = (rx[pos + 2 * i] << 8) | rx[pos + 2 * i + 1]
+            if raw & 0x8000:
+                raw -= 0x10000
+            spec = loops[k]
+            section = spec["pid"]
+            pid = updates.get(section)
+            if pid is None:
+                pid = updates[section] = dict(cfg[section])
+            field, quantity = HOLDING[offset]
+            if quantity is None:
+                if raw != 0 and raw != 1:
+                    return ILLEGAL_VALUE
+                pid[field] = raw == 1
+            else:
+                value = raw / self._scale(cfg, spec[quantity])
+                if not 0 <= value <= O2_MAX:
+                    return ILLEGAL_VALUE
+                pid[field] = value
+        for section, pid in updates.items():
+            cfg[section] = pid
+        save_config(cfg)
+        self.writes += 1
+        return 0
+
+    def stats(self):
+        return {"requests": self.requests, "exceptions": self.exceptions, "writes": self.writes}
+
+server = Server()
+
+# === Modbus TCP ===
+def tcp_length(rx):
+    """Длина PDU по заголовку MBAP в rx[0:7]; −1 — не Modbus или кадр длиннее буфера."""
+    if rx[2] or rx[3]:
+        return -1  # идентификатор протокола — всегда 0
+    n = ((rx[4] << 8) | rx[5]) - 1
+    return n if 1 <= n <= MAX_ADU - MBAP else -1
+
+def tcp_process(rx, n, tx):
+    """Запрос TCP (заголовок и PDU длиной n) → ответ в tx; возвращает его длину."""
+    m = server.process(rx, MBAP, n, tx, MBAP)
+    for i in range(4):
+        tx[i] = rx[i]  # транзакция и протокол — как в запросе
+    tx[4] = (m + 1) >> 8
+    tx[5] = (m + 1) & 0xFF
+    tx[6] = rx[6]      # unit: через шлюз SCADA может адресовать любой
+    return MBAP + m
+
+# === Modbus RTU ===
+class RtuSlave:
+    """
+    Ведомый Modbus RTU на UART. poll() забирает принятые байты без ожидания;
+    конец кадра — пауза 3.5 символа. Кадры чужим адресам игнорируются,
+    широковещательная запись (адрес 0) выполняется без ответа.
+    """
+
+    def __init__(self, uart, baudrate, srv=server):
+        self.uart = uart
+        self.server = srv
+        self.gap_ms = frame_gap_ms(baudrate)
+        self.frames = 0
+        self.crc_errors = 0
+        self._rx = bytearray(MAX_ADU)
+        self._chunk = bytearray(MAX_ADU)
+        self._tx = bytearray(MAX_ADU)
+        self._tx_views = {}
+        self._rx_len = 0
+        self._last = 0
+
+    def poll(self):
+        uart = self.uart
+        n = uart.any()
+        if n:
+            room = MAX_ADU - self._rx_len
+            if n > room:
+                # Переполнение: кадр испорчен, ждём паузу и начинаем заново
+                self._rx_len = 0
+                room = MAX_ADU
+            got = uart.readinto(self._chunk, min(n, room))
+            if got:
+                rx, chunk, pos = self._rx, self._chunk, self._rx_len
+                for i in range(got):
+                    rx[pos + i] = chunk[i]
+                self._rx_len = pos + got
+            self._last = ticks.ticks_ms()
+        elif self._rx_len and ticks.ticks_diff(ticks.ticks_ms(), self._last) > self.gap_ms:
+            self._frame(self._rx_len)
+            self._rx_len = 0
+
+    def _frame(self, n):
+        rx = self._rx
+        unit = self.server.unit
+        if n < 4 or (rx[0] != unit and rx[0] != 0):
+            return
+        if crc16(rx, n - 2) != rx[n - 2] | (rx[n - 1] << 8):
+            self.crc_errors += 1
+            return
+        self.frames += 1
+        tx = self._tx
+        m = self.server.process(rx, 1, n - 3, tx, 1)
+        if rx[0] == 0:
+            return
+        tx[0] = unit
+        crc = crc16(tx, m + 1)
+        tx[m + 1] = crc & 0xFF
+        tx[m + 2] = crc >> 8
+        self.uart.write(self._tx_view(m + 3))
+
+    def _tx_view(self, n):
+        view = self._tx_views.get(n)
+        if view is None:
+            view = self._tx_views[n] = memoryview(self._tx)[:n]
+        return view
+
+def open_rtu(cfg):
+    """RtuSlave на UART из секции "modbus"."""
+    uart = UART(cfg["uart"], baudrate=cfg["baudrate"], tx=Pin(cfg["tx"]), rx=Pin(cfg["rx"]),
+                bits=8, parity=None, stop=1)
+    return RtuSlave(uart, cfg["baudrate"])
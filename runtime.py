@@ -0,0 +1,439 @@
+# runtime.py
+# Кооперативный планировщик на asyncio (uasyncio на устройстве, asyncio на хосте).
+# Периодические задачи (очередь реле, опрос АЦП, регулятор, запись конфигурации)
+# выполняются по приоритету и контролируются по сроку; веб-сервер, поток
+# событий и Modbus TCP — отдельные задачи asyncio, которые работают
+# в промежутках и не задерживают регулятор.
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+import gc
+import sys
+import ticks
+from ads1115 import engine as adc
+import modbus_relay
+from modbus_relay import relay
+import air_pressure_controller
+from air_pressure_controller import run_automatic_control
+from config_manager import load_config, flush_config
+from history import trend, PERIOD_MS as HISTORY_PERIOD_MS
+import datalog
+import calibration
+import filters
+import instrument
+import webserver
+import modbus_slave
+from modbus_rtu import MAX_ADU
+from http_parser import RequestParser, HttpError
+from events import hub
+
+LOG_INTERVAL_MS = 10000
+RELAY_VERIFY_MS = 5000  # сверка состояния катушек (0x01)
+HTTP_BACKLOG = 5
+HTTP_MAX_CLIENTS = 4        # одновременных соединений (буферы выделены заранее)
+HTTP_IDLE_TIMEOUT = 5       # сек без нового запроса — соединение keep-alive закрывается
+EVENTS_SAMPLE_MS = 200      # отсчёты в /events не чаще 5 раз в секунду
+MODBUS_MAX_CLIENTS = 2      # одновременных соединений Modbus TCP
+MODBUS_IDLE_TIMEOUT = 60    # сек без запроса — соединение SCADA закрывается
+# CPython 3.12+ держит неотправленный хвост без копирования, а буфер страницы
+# переиспользуется — на хосте куски копируются (asyncio MicroPython копирует сам)
+_COPY_CHUNKS = sys.implementation.name != "micropython"
+GC_THRESHOLD = 16 * 1024    # байт с прошлой сборки — собирать в ближайшем окне простоя
+GC_AUTO_THRESHOLD = 48 * 1024  # страховка: автоматическая сборка MicroPython
+GC_MARGIN_US = 1000         # запас окна сверх длительности прошлой сборки
+
+if hasattr(asyncio, "sleep_ms"):
+    _sleep_ms = asyncio.sleep_ms  # MicroPython: без float на каждое ожидание
+else:
+    def _sleep_ms(ms):
+        return asyncio.sleep(ms / 1000)
+
+class Job:
+    """Периодическая задача: fn() вызывается раз в period_ms и должна уложиться в deadline_ms."""
+
+    def __init__(self, name, fn, period_ms, deadline_ms, priority):
+        self.name = name
+        self.fn = fn
+        self.period_ms = period_ms
+        self.deadline_ms = deadline_ms
+        self.priority = priority  # больше — важнее
+        self.release = ticks.ticks_ms()
+        self.runs = 0
+        self.overruns = 0         # завершилась позже срока
+        self.max_late_ms = 0      # наибольшая задержка старта
+
+    def stats(self):
+        return {"runs": self.runs, "overruns": self.overruns, "max_late_ms": self.max_late_ms}
+
+class Scheduler:
+    def __init__(self):
+        self.jobs = []
+
+    def add(self, job):
+        job.fn = instrument.timed("job " + job.name, job.fn)
+        self.jobs.append(job)
+        self.jobs.sort(key=lambda j: -j.priority)
+        return job
+
+    def _run_due(self):
+        # Из созревших задач всегда первой выполняется самая приоритетная
+        for job in self.jobs:
+            now = ticks.ticks_ms()
+            late = ticks.ticks_diff(now, job.release)
+            if late < 0:
+                continue
+            try:
+                job.fn()
+            except Exception as e:
+                print("Job error:", job.name, e)
+            job.runs += 1
+            if late > job.max_late_ms:
+                job.max_late_ms = late
+            if ticks.ticks_diff(ticks.ticks_ms(), job.release) > job.deadline_ms:
+                job.overruns += 1
+            job.release = ticks.ticks_add(job.release, job.period_ms)
+            # После долгой паузы не догоняем пропущенные периоды пачкой
+            if ticks.ticks_diff(now, job.release) > 0:
+                job.release = ticks.ticks_add(now, job.period_ms)
+            return True
+        return False
+
+    def next_wait(self, now):
+        """мс до ближайшего срока (без генератора — цикл планировщика не выделяет память)."""
+        wait = None
+        for job in self.jobs:
+            w = ticks.ticks_diff(job.release, now)
+            if wait is None or w < wait:
+                wait = w
+        return 0 if wait is None or wait < 0 else wait
+
+    async def run(self, idle=None):
+        """idle(now) вызывается, когда созревших задач нет (сборка мусора)."""
+        while True:
+            if self._run_due():
+                # Отдаём управление между задачами, чтобы веб-клиенты не голодали
+                await asyncio.sleep(0)
+                continue
+            if idle is not None and idle(ticks.ticks_ms()):
+                continue
+            await _sleep_ms(self.next_wait(ticks.ticks_ms()))
+
+scheduler = Scheduler()
+
+class Collector:
+    """
+    Сборка мусора по расписанию: gc.collect() в окне простоя планировщика,
+    когда с прошлой сборки выделено больше threshold байт и до ближайшего
+    ВЫКЛ импульса реле дольше, чем длилась прошлая сборка. Автоматическая
+    сборка MicroPython остаётся страховкой с порогом auto_threshold.
+    На CPython (нет gc.mem_alloc) ничего не делает.
+    """
+
+    def __init__(self, threshold=GC_THRESHOLD, auto_threshold=GC_AUTO_THRESHOLD):
+        self.threshold = threshold
+        self.auto_threshold = auto_threshold
+        self.enabled = hasattr(gc, "mem_alloc")
+        self.runs = 0
+        self.last_us = 0
+        self._base = 0
+
+    def start(self):
+        if not self.enabled:
+            return
+        if hasattr(gc, "threshold"):
+            gc.threshold(self.auto_threshold)
+        gc.collect()
+        self._base = gc.mem_alloc()
+
+    def __call__(self, now):
+        if not self.enabled or gc.mem_alloc() - self._base < self.threshold:
+            return False
+        if _quiet_ms(now) * 1000 < self.last_us + GC_MARGIN_US:
+            return False
+        t0 = ticks.ticks_us()
+        gc.collect()
+        self.last_us = ticks.ticks_diff(ticks.ticks_us(), t0)
+        self._base = gc.mem_alloc()
+        self.runs += 1
+        if instrument.ENABLED:
+            instrument.stage("gc").record(self.last_us)
+        return True
+
+collector = Collector()
+
+# === Импульсы реле ===
+
+def _quiet_ms(now):
+    """мс до ближайшего события, которое нельзя задержать: обмена по шине или команды реле."""
+    if modbus_relay.bus.busy():
+        return 0
+    due = relay.next_due()
+    return 1 << 20 if due is None else ticks.ticks_diff(due, now)
+
+def request_pulse(channel, duration):
+    """Неблокирующая замена pulse_blocking: ВКЛ/ВЫКЛ отправляет задача relay."""
+    loops = load_config()["loops"]
+    for i in range(len(loops)):
+        # Встречные команды на исполнительный механизм контура не перекрываются
+        less, more = loops[i]["relay_less"], loops[i]["relay_more"]
+        if channel == less or channel == more:
+            other = less if channel == more else more
+            if relay.pending(other) or relay.state[other - 1]:
+                relay.set(other, False)
+            break
+    relay.pulse(channel, int(duration * 1000))
+
+# Фильтры каналов по конфигурации — на каждом опубликованном отсчёте АЦП
+adc.pipeline = filters.bank
+
+# === Поток событий ===
+sample_topic = hub.topic("sample", webserver.api_sample, EVENTS_SAMPLE_MS)
+control_topic = hub.topic("control", lambda: air_pressure_controller.results)
+
+def adc_step():
+    if adc.poll():
+        hub.publish(sample_topic)
+
+# === Тренд ===
+_values = {}  # физические значения: один словарь на тренд и журнал
+
+def history_step():
+    cal = calibration.compiled()
+    if adc.layout != cal.layout:
+        return  # отсчёт ещё по прежней карте каналов
+    values = cal.values_into(adc.filtered, _values)
+    trend.append(cal, values, air_pressure_controller.results)
+
+# === Журнал на flash ===
+def datalog_step():
+    cal = calibration.compiled()
+    if adc.layout != cal.layout:
+        return
+    values = cal.values_into(adc.filtered, _values)
+    mask = 0
+    state = relay.state
+    for i in range(len(state)):
+        if state[i]:
+            mask |= 1 << i
+    datalog.log.append(trend.now(), cal, values, air_pressure_controller.results, mask)
+
+# === Регулятор ===
+_last_log = 0
+
+def control_step():
+    global _last_log
+    result = run_automatic_control(request_pulse)
+    if result is not None and air_pressure_controller.changed:
+        # «disabled» и предупреждения повторяются каждый шаг — в поток только изменения
+        hub.publish(control_topic)
+    now = ticks.ticks_ms()
+    if result and ticks.ticks_diff(now, _last_log) > LOG_INTERVAL_MS:
+        print("[AUTO CTRL]", result)
+        _last_log = now
+
+# === Веб-сервер ===
+_parsers = [RequestParser() for _ in range(HTTP_MAX_CLIENTS)]
+# Долгие ответы: обработчик сам пишет в сокет до отключения клиента
+STREAMS = {(b"GET", b"/events"): hub.serve}
+BUSY = b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+async def _readinto(reader, mv):
+    if hasattr(reader, "readinto"):
+        return await reader.readinto(mv)  # asyncio MicroPython — без промежуточной копии
+    data = await reader.read(len(mv))
+    n = len(data)
+    mv[:n] = data
+    return n
+
+async def _send(writer, chunks):
+    for chunk in chunks:
+        writer.write(bytes(chunk) if _COPY_CHUNKS else chunk)
+        await writer.drain()
+
+async def serve_client(reader, writer):
+    parser = _parsers.pop() if _parsers else None
+    try:
+        if parser is None:
+            # Лимит соединений: остальным клиентам отвечаем сразу, без буфера
+            instrument.count("http_503")
+            writer.write(BUSY)
+            await writer.drain()
+            return
+        parser.reset()
+        while True:
+            try:
+                req = parser.next_request()
+            except HttpError as e:
+                instrument.count("http_%d" % e.status)
+                await _send(writer, webserver.error_response(e.status, e.reason, True))
+                break
+            if req is None:
+                space = parser.space()
+                if not len(space):
+                    await _send(writer, webserver.error_response(413, "Payload Too Large", True))
+                    break
+                try:
+                    n = await asyncio.wait_for(_readinto(reader, space), HTTP_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not n:
+                    break
+                parser.feed(n)
+                continue
+            stream = STREAMS.get((req.method, req.path))
+            if stream is not None:
+                # Буфер разбора потоку не нужен — возвращаем его другим клиентам
+                _parsers.append(parser)
+                parser = None
+                instrument.count("sse_connects")
+                await stream(writer)
+                break
+            if instrument.ENABLED:
+                t0 = ticks.ticks_us()
+                await _send(writer, webserver.dispatch(req))
+                instrument.stage(webserver.route_label(req)).record(ticks.ticks_diff(ticks.ticks_us(), t0))
+            else:
+                await _send(writer, webserver.dispatch(req))
+            if not req.keep_alive:
+                break
+    except Exception as e:
+        print("HTTP error:", e)
+    finally:
+        if parser is not None:
+            _parsers.append(parser)
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+# === Modbus TCP ===
+# Буферы кадров на соединение выделены заранее: (приём, ответ)
+_modbus_buffers = [(bytearray(MAX_ADU), bytearray(MAX_ADU)) for _ in range(MODBUS_MAX_CLIENTS)]
+
+async def _read_exact(reader, mv, n):
+    """Ровно n байт в mv; False — соединение закрыто."""
+    got = 0
+    while got < n:
+        k = await _readinto(reader, mv[got:n])
+        if not k:
+            return False
+        got += k
+    return True
+
+async def serve_modbus(reader, writer):
+    """Соединение Modbus TCP: запросы SCADA по очереди, пока клиент держит соединение."""
+    buffers = _modbus_buffers.pop() if _modbus_buffers else None
+    try:
+        if buffers is None:
+            instrument.count("modbus_busy")  # лимит соединений — закрываем сразу
+            return
+        rx, tx = buffers
+        rx_mv, tx_mv = memoryview(rx), memoryview(tx)
+        pdu_mv = rx_mv[modbus_slave.MBAP:]
+        while True:
+            try:
+                if not await asyncio.wait_for(_read_exact(reader, rx_mv, modbus_slave.MBAP), MODBUS_IDLE_TIMEOUT):
+                    break
+                # Заголовок без PDU не должен держать соединение из пула дольше простоя
+                n = modbus_slave.tcp_length(rx)
+                if n < 0 or not await asyncio.wait_for(_read_exact(reader, pdu_mv, n), MODBUS_IDLE_TIMEOUT):
+                    break
+            except asyncio.TimeoutError:
+                break
+            if instrument.ENABLED:
+                t0 = ticks.ticks_us()
+                m = modbus_slave.tcp_process(rx, n, tx)
+                instrument.stage("modbus tcp").record(ticks.ticks_diff(ticks.ticks_us(), t0))
+            else:
+                m = modbus_slave.tcp_process(rx, n, tx)
+            await _send(writer, (tx_mv[:m],))
+    except Exception as e:
+        print("Modbus error:", e)
+    finally:
+        if buffers is not None:
+            _modbus_buffers.append(buffers)
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+# === Измерения (/metrics) ===
+MEMORY_SAMPLE_MS = 100
+
+def _jobs(attr):
+    return lambda: {j.name: getattr(j, attr) for j in scheduler.jobs}
+
+def _loops(attr):
+    return lambda: {name: getattr(loop.timer, attr) for name, loop in air_pressure_controller.loops.items()}
+
+def register_metrics():
+    gauge = instrument.gauge
+    gauge("job_runs_total", "Scheduler job runs.", _jobs("runs"), "counter", "job")
+    gauge("job_overruns_total", "Jobs that finished after their deadline.", _jobs("overruns"), "counter", "job")
+    gauge("job_max_late_ms", "Largest job start delay, ms.", _jobs("max_late_ms"), "gauge", "job")
+    gauge("control_overruns_total", "Controller steps started after the next deadline.",
+          _loops("overruns"), "counter", "loop")
+    gauge("control_max_late_ms", "Largest controller step delay past its deadline, ms.",
+          _loops("max_late_ms"), "gauge", "loop")
+    gauge("i2c_errors_total", "ADS1115 bus errors and conversion timeouts.", lambda: adc.errors, "counter")
+    gauge("adc_samples_total", "Published ADC samples.", lambda: adc.seq, "counter")
+    gauge("adc_chip_dropouts_total", "Times an ADS1115 was left out of samples after repeated timeouts.",
+          lambda: {"0x%02x" % a: n for a, n in zip(adc.addrs, adc.dropouts)}, "counter", "chip")
+    gauge("filter_limited_total", "Samples clipped by the rate-of-change limit.",
+          filters.bank.stats, "counter", "channel")
+    gauge("modbus_total", "Modbus RTU frames and failures.", lambda: {
+        "frames": modbus_relay.bus.frames_sent, "timeouts": modbus_relay.bus.timeouts,
+        "crc_errors": modbus_relay.bus.crc_errors, "exceptions": modbus_relay.bus.exceptions,
+    }, "counter", "kind")
+    gauge("modbus_slave_total", "Modbus server requests from SCADA.",
+          modbus_slave.server.stats, "counter", "kind")
+    gauge("relay_errors_total", "Unconfirmed relay commands per channel.",
+          lambda: {i + 1: n for i, n in enumerate(relay.errors)}, "counter", "channel")
+    gauge("http_connections", "Open HTTP connections.", lambda: HTTP_MAX_CLIENTS - len(_parsers))
+    gauge("sse_clients", "Connected /events clients.", lambda: len(hub.clients))
+    gauge("sse_dropped_total", "Stale /events frames skipped for slow clients.", lambda: hub.dropped, "counter")
+    gauge("log_pages_total", "Data log pages written to flash.", lambda: datalog.log.pages_written, "counter")
+    if collector.enabled:
+        gauge("gc_runs_total", "Garbage collections run in scheduler idle slots.",
+              lambda: collector.runs, "counter")
+
+async def main(port=80):
+    load_config()  # единственное чтение config.json с flash
+    adc.configure(calibration.compiled().layout)  # карта каналов из конфигурации
+    datalog.log.open()
+    scheduler.add(Job("relay", modbus_relay.poll, 2, 5, priority=4))
+    scheduler.add(Job("adc", adc_step, 2, 10, priority=3))
+    scheduler.add(Job("control", control_step, 100, 50, priority=2))
+    scheduler.add(Job("history", history_step, HISTORY_PERIOD_MS, 100, priority=1))
+    scheduler.add(Job("datalog", datalog_step, datalog.PERIOD_MS, 100, priority=0))
+    scheduler.add(Job("relay_verify", relay.verify, RELAY_VERIFY_MS, RELAY_VERIFY_MS, priority=1))
+    scheduler.add(Job("config", flush_config, 500, 500, priority=0))
+    modbus = load_config()["modbus"]
+    modbus_slave.server.unit = modbus["unit"]
+    if modbus["rtu"]:
+        scheduler.add(Job("modbus_rtu", modbus_slave.open_rtu(modbus).poll, 2, 10, priority=1))
+    if instrument.ENABLED and instrument.mem_free is not None:
+        scheduler.add(Job("memory", instrument.sample_memory, MEMORY_SAMPLE_MS, MEMORY_SAMPLE_MS, priority=0))
+    register_metrics()
+    await asyncio.start_server(serve_client, "0.0.0.0", port, backlog=HTTP_BACKLOG)
+    if modbus["tcp"]:
+        await asyncio.start_server(serve_modbus, "0.0.0.0", modbus["port"], backlog=MODBUS_MAX_CLIENTS)
+    print("Веб-сервер и регулятор запущены")
+    collector.start()
+    await scheduler.run(collector)
+
+def run(port=80):
+    try:
+        asyncio.run(main(port))
+    finally:
+        # Выход (Ctrl+C / исключение) не должен оставить исполнительный механизм под током
+        try:
+            modbus_relay.all_off()
+        except Exception:
+            pass
+        datalog.log.flush()
+        # Правки из веб-интерфейса и Modbus, ещё ждущие паузы записи
+        flush_config(force=True)
@@ -0,0 +1,21 @@
+# sim/__init__.py
+# Симулятор для хоста: заменители machine/network, модель котла и
+# виртуальные часы. install() вызывается до импорта модулей прошивки.
+# На устройство не копируется.
+import sys
+from sim.clock import VirtualClock
+from sim import machine, network
+
+clock = None
+
+def install(step_ms=10):
+    """Подменяет machine, network и ticks; повторный вызов возвращает те же часы."""
+    global clock
+    if clock is None:
+        if "ads1115" in sys.modules or "modbus_relay" in sys.modules:
+            raise RuntimeError("sim.install() must run before firmware modules are imported")
+        clock = VirtualClock(step_ms).install()
+        machine.clock = clock
+        sys.modules["machine"] = machine
+        sys.modules["network"] = network
+    return clock
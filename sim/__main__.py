@@ -0,0 +1,38 @@
+# sim/__main__.py
+# Прогон конфигурации на модели котла:
+#   python -m sim --config config.json --duration 3600 --profile step
+# Печатает время установления, перерегулирование, число импульсов реле
+# и во сколько раз прогон быстрее реального времени.
+import argparse
+import json
+from sim import plant
+
+def main():
+    p = argparse.ArgumentParser(prog="python -m sim", description="Boiler simulation for a controller config")
+    p.add_argument("--config", default="config.json")
+    p.add_argument("--duration", type=float, default=3600.0, help="model seconds")
+    p.add_argument("--profile", default="step", choices=plant.PROFILES)
+    p.add_argument("--gas", type=float, help="base gas flow (default: middle of air_fuel_table)")
+    p.add_argument("--table-lambda", type=float, default=1.1, help="excess air given by air_fuel_table")
+    p.add_argument("--stroke", type=float, default=30.0, help="actuator full stroke, s")
+    p.add_argument("--dead-time", type=float, default=5.0, help="O2 transport delay, s")
+    p.add_argument("--tau", type=float, default=8.0, help="O2 analyser time constant, s")
+    p.add_argument("--noise", type=float, default=0.0, help="O2 sensor noise, %% (sigma)")
+    p.add_argument("--band", type=float, help="settling band, %% O2 (default: deadband)")
+    p.add_argument("--from", dest="start", type=float, default=0.0, help="ignore metrics before, s")
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args()
+
+    with open(args.config) as f:
+        cfg = json.load(f)
+    from sim.harness import Simulation
+    gas = plant.profile(args.profile, cfg, args.duration, args.gas, args.seed)
+    sim = Simulation(cfg, gas, band=args.band, start_s=args.start,
+                     table_lambda=args.table_lambda, full_stroke_s=args.stroke,
+                     dead_time_s=args.dead_time, o2_tau_s=args.tau, o2_noise=args.noise, seed=args.seed)
+    result = sim.run(args.duration)
+    for key, value in result.items():
+        print("{:<16} {}".format(key, value))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# sim/clock.py
+# Виртуальные часы: подменяют ticks.* (и time.time/sleep у регулятора),
+# время идёт только когда симулятор его продвигает. Модель котла и
+# эмуляторы шин получают шаги через подписку on_advance.
+import ticks
+
+TICKS_PERIOD = 1 << 30
+_MASK = TICKS_PERIOD - 1
+_HALF = TICKS_PERIOD // 2
+
+class VirtualClock:
+    def __init__(self, step_ms=10):
+        self.us = 0
+        self.step_us = step_ms * 1000  # наибольший шаг модели при продвижении
+        self.listeners = []            # fn(dt_s) после каждого шага
+
+    # === Интерфейс ticks ===
+    def ticks_ms(self):
+        return (self.us // 1000) & _MASK
+
+    def ticks_us(self):
+        return self.us & _MASK
+
+    @staticmethod
+    def ticks_add(t, delta):
+        return (t + delta) & _MASK
+
+    @staticmethod
+    def ticks_diff(a, b):
+        return ((a - b + _HALF) & _MASK) - _HALF
+
+    def sleep_ms(self, ms):
+        self.advance_us(int(ms * 1000))
+
+    # === Интерфейс time для кода, который ещё считает в секундах ===
+    def time(self):
+        return self.us / 1000000.0
+
+    def sleep(self, seconds):
+        self.advance_us(int(seconds * 1000000))
+
+    # === Продвижение ===
+    def seconds(self):
+        return self.us / 1000000.0
+
+    def advance_us(self, us):
+        """Продвигает время шагами не длиннее step_us, вызывая подписчиков."""
+        while us > 0:
+            dt = min(us, self.step_us)
+            self.us += dt
+            us -= dt
+            for fn in self.listeners:
+                fn(dt / 1000000.0)
+
+    def advance_to_ms(self, t):
+        """До отметки ticks_ms t (если она ещё впереди)."""
+        delta = self.ticks_diff(t, self.ticks_ms())
+        if delta > 0:
+            self.advance_us(delta * 1000 - self.us % 1000)
+
+    def install(self):
+        """Подмена функций модуля ticks: модули вызывают их как ticks.ticks_ms()."""
+        ticks.ticks_ms = self.ticks_ms
+        ticks.ticks_us = self.ticks_us
+        ticks.ticks_add = self.ticks_add
+        ticks.ticks_diff = self.ticks_diff
+        ticks.sleep_ms = self.sleep_ms
+        return self
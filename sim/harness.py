@@ -0,0 +1,132 @@
+# sim/harness.py
+# Прогон прошивки на модели котла быстрее реального времени: те же задачи
+# планировщика (реле, АЦП, регулятор, тренд), что и на устройстве, но время
+# идёт по виртуальным часам и сразу перескакивает к ближайшему сроку задачи.
+import time
+from sim import install, machine
+from sim.plant import Boiler, Sensors
+from sim.metrics import Metrics
+
+STEP_MS = 50  # шаг модели котла между сроками задач, мс
+
+class Simulation:
+    # Периоды задач крупнее, чем на устройстве: регулятору нужен отсчёт раз в 100 мс,
+    # а реле переключаются точно в сроки задач — модель продвигается ровно до них
+    def __init__(self, cfg, gas, adc_ms=50, relay_ms=10, control_ms=100, sample_ms=100,
+                 step_ms=STEP_MS, band=None, start_s=0.0, plant_cfg=None, **plant_kwargs):
+        self.clock = install(step_ms)
+        # Модули прошивки импортируются только после подмены machine/ticks
+        import config_manager
+        import air_pressure_controller
+        import modbus_relay
+        import runtime
+        import filters
+        self.runtime = runtime
+        self.controller = air_pressure_controller
+        self.modbus_relay = modbus_relay
+        config_manager.complete(cfg)     # старые файлы — без карты каналов и контуров
+        config_manager.save_config(cfg)  # только в RAM: задача записи на flash не запускается
+        air_pressure_controller.reset()
+        runtime.LOG_INTERVAL_MS = 1 << 28   # без печати [AUTO CTRL] каждые 10 с модели
+
+        # plant_cfg — конфигурация, под которую построен котёл: при подборе
+        # таблицы газ/воздух модель не должна меняться вместе с кандидатом
+        self.plant = Boiler.from_config(plant_cfg or cfg, gas, **plant_kwargs)
+        sensors = Sensors(self.plant, cfg)
+        machine.I2C_DEVICES.clear()
+        for addr in sensors.addrs():
+            machine.I2C_DEVICES[addr] = machine.Ads1115(sensors.source(addr))
+        # Повторный прогон в том же процессе: обход АЦП и фильтры начинаются
+        # заново на новых микросхемах, отсчёт прежней модели не публикуется
+        adc = runtime.adc
+        adc.configure(adc.channels)
+        adc.seq = 0
+        for pipe in filters.bank.pipes:
+            if pipe is not None:
+                pipe.reset()
+        self.board = machine.RelayBoard(modbus_relay.RELAY_ID, on_change=self._relay)
+        machine.UART_DEVICES[1] = self.board
+
+        pid = cfg[cfg["loops"][0]["pid"]]
+        self.metrics = Metrics(pid["o2_setpoint"], pid["deadband"] if band is None else band, start_s)
+        self.t0 = self.clock.us
+        self.clock.listeners[:] = [self.plant.step]
+
+        sched = runtime.Scheduler()
+        self._relay_job = sched.add(runtime.Job("relay", self._relay_step, relay_ms, relay_ms + 5, priority=4))
+        sched.add(runtime.Job("adc", runtime.adc_step, adc_ms, adc_ms + 10, priority=3))
+        sched.add(runtime.Job("control", self._control_step, control_ms, 50, priority=2))
+        sched.add(runtime.Job("history", runtime.history_step, 5000, 100, priority=1))
+        sched.add(runtime.Job("metrics", self._sample, sample_ms, sample_ms, priority=0))
+        self.scheduler = sched
+        modbus_relay.relay.set_all(0)
+        self.wall_s = 0.0
+        # Контуры живут в модуле между прогонами — шаги считаются от этой точки
+        self._steps0 = {lp: lp.timer.steps for lp in air_pressure_controller.loops.values()}
+
+    def now(self):
+        """Секунды модели от начала прогона."""
+        return (self.clock.us - self.t0) / 1000000.0
+
+    def _relay(self, channel, state):
+        self.plant.relay(channel, state)
+        self.metrics.relay(self.now(), channel, state)
+
+    def _relay_step(self):
+        # Пока шина и очередь реле пусты, задача спит до срока ближайшей команды —
+        # иначе половина времени прогона уходит на пустые опросы
+        self.modbus_relay.poll()
+        if self.modbus_relay.bus.busy():
+            return
+        due = self.modbus_relay.relay.next_due()
+        if due is None:
+            due = self.clock.ticks_add(self.clock.ticks_ms(), 1 << 20)
+        job = self._relay_job
+        # release сдвинется на период после возврата — учитываем заранее
+        job.release = self.clock.ticks_add(due, -job.period_ms)
+
+    def _control_step(self):
+        self.runtime.control_step()
+        # Регулятор мог поставить импульс — будим задачу реле
+        self._relay_job.release = self.clock.ticks_ms()
+
+    def _sample(self):
+        self.metrics.sample(self.now(), self.plant.o2)
+
+    def run(self, seconds):
+        """Продвигает модель на seconds; возвращает сводку показателей."""
+        clock = self.clock
+        end = clock.us + int(seconds * 1000000)
+        sched = self.scheduler
+        wall = time.perf_counter()
+        while clock.us < end:
+            if sched._run_due():
+                continue
+            now = clock.ticks_ms()
+            wait = min(clock.ticks_diff(j.release, now) for j in sched.jobs)
+            clock.advance_us(min(max(wait, 1) * 1000, end - clock.us))
+        self.wall_s += time.perf_counter() - wall
+        return self.summary()
+
+    def summary(self):
+        result = self.metrics.summary()
+        result["pulses_less"] = self.metrics.pulses.get(self.plant.less, 0)
+        result["pulses_more"] = self.metrics.pulses.get(self.plant.more, 0)
+        result["o2_end"] = round(self.plant.o2, 3)
+        result["pressure_end"] = round(self.plant.pressure, 2)
+        # Шаги ПИД по O2 всех контуров (control_interval), а не запуски задачи раз в 100 мс
+        result["pid_steps"] = sum(lp.timer.steps - self._steps0.get(lp, 0)
+                                  for lp in self.controller.loops.values())
+        result["speedup"] = round(self.now() / self.wall_s, 1) if self.wall_s else None
+        return result
+
+    def request(self, method, path, body=b""):
+        """HTTP-запрос к webserver в момент модели; возвращает ответ целиком (bytes)."""
+        import webserver
+        from http_parser import RequestParser
+        raw = b"%s %s HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (method, path, len(body), body)
+        parser = RequestParser()
+        space = parser.space()
+        space[:len(raw)] = raw
+        parser.feed(len(raw))
+        return b"".join(bytes(chunk) for chunk in webserver.dispatch(parser.next_request()))
@@ -0,0 +1,207 @@
+# sim/machine.py
+# Заменитель модуля machine для хоста: I2C с моделями ADS1115 и UART
+# с моделью Modbus-реле. Время конверсий и ответов идёт по виртуальным
+# часам clock (устанавливает sim.install), устройства подключаются
+# в I2C_DEVICES / UART_DEVICES до создания шин.
+from modbus_rtu import crc16, FC_READ_COILS, FC_WRITE_COIL, FC_WRITE_COILS
+
+clock = None
+I2C_DEVICES = {}   # адрес → модель микросхемы
+UART_DEVICES = {}  # номер UART → модель устройства на линии
+
+ENODEV = 19
+ETIMEDOUT = 110
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 2
+
+    def __init__(self, pin, mode=IN, pull=None, value=1):
+        self.pin = pin
+        self._value = value
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = v
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+# === ADS1115 ===
+FSR = (6.144, 4.096, 2.048, 1.024, 0.512, 0.256, 0.256, 0.256)
+SPS = (8, 16, 32, 64, 128, 250, 475, 860)
+
+class Ads1115:
+    """
+    Модель ADS1115 в однократном режиме: запись OS=1 в конфигурацию
+    запускает преобразование на время 1/SPS, бит OS сообщает готовность.
+    source(mux) возвращает напряжение на входе пары mux (биты 14:12).
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.regs = [0, 0x8583, 0x8000, 0x7FFF]  # conversion, config, lo, hi
+        self.pointer = 0
+        self.done_us = 0
+        self._sampled = True
+        self.conversions = 0
+        self.stalled = False     # True — преобразование не завершается (проверка таймаута)
+
+    def write(self, data):
+        self.pointer = data[0] & 3
+        if len(data) < 3:
+            return
+        value = (data[1] << 8) | data[2]
+        if self.pointer == 1:
+            self.regs[1] = value & 0x7FFF
+            if value & 0x8000:
+                self.done_us = clock.us + 1000000 // SPS[(value >> 5) & 7]
+                self._sampled = False
+                self.conversions += 1
+        elif self.pointer:
+            self.regs[self.pointer] = value
+
+    def _ready(self):
+        if self.stalled or clock.us < self.done_us:
+            return False
+        if not self._sampled:
+            cfg = self.regs[1]
+            fsr = FSR[(cfg >> 9) & 7]
+            raw = int(self.source((cfg >> 12) & 7) / fsr * 32768)
+            raw = max(-32768, min(32767, raw))
+            self.regs[0] = raw & 0xFFFF
+            self._sampled = True
+        return True
+
+    def read(self, reg):
+        if reg == 1:
+            return self.regs[1] | (0x8000 if self._ready() else 0)
+        if reg == 0:
+            self._ready()
+        return self.regs[reg]
+
+class I2C:
+    def __init__(self, id=0, scl=None, sda=None, freq=400000):
+        self.id = id
+        self.transfers = 0
+
+    def _device(self, addr):
+        dev = I2C_DEVICES.get(addr)
+        if dev is None:
+            raise OSError(ENODEV)
+        self.transfers += 1
+        return dev
+
+    def scan(self):
+        return sorted(I2C_DEVICES)
+
+    def writeto(self, addr, buf, stop=True):
+        self._device(addr).write(bytes(buf))
+        return len(buf)
+
+    def readfrom_mem_into(self, addr, reg, buf):
+        value = self._device(addr).read(reg & 3)
+        buf[0] = value >> 8
+        buf[1] = value & 0xFF
+
+    def readfrom_into(self, addr, buf):
+        dev = self._device(addr)
+        self.readfrom_mem_into(addr, dev.pointer, buf)
+
+# === Modbus-реле ===
+class RelayBoard:
+    """
+    Модель платы реле Modbus RTU: функции 0x01, 0x05, 0x0F.
+    Ответ готов через время передачи запроса и ответа плюс latency_ms.
+    on_change(канал 1..N, состояние) вызывается при переключении катушки.
+    """
+
+    def __init__(self, address=0x02, channels=4, baudrate=9600, latency_ms=2, on_change=None):
+        self.address = address
+        self.coils = [False] * channels
+        self.char_us = 11000000 // baudrate
+        self.latency_us = latency_ms * 1000
+        self.on_change = on_change
+        self.offline = False     # True — плата молчит (проверка отказов)
+        self.frames = 0
+        self.switches = [0] * channels  # включений по каналам
+
+    def request(self, frame):
+        """Кадр запроса → (ответ, время готовности в мкс) или None."""
+        self.frames += 1
+        if self.offline or len(frame) < 8 or frame[0] != self.address:
+            return None
+        if crc16(frame, len(frame) - 2) != frame[-2] | (frame[-1] << 8):
+            return None
+        fc = frame[1]
+        addr = (frame[2] << 8) | frame[3]
+        value = (frame[4] << 8) | frame[5]
+        if fc == FC_WRITE_COIL and addr < len(self.coils):
+            self._set(addr, value == 0xFF00)
+            resp = bytearray(frame[:6])
+        elif fc == FC_WRITE_COILS and addr + value <= len(self.coils):
+            for i in range(value):
+                self._set(addr + i, bool(frame[7 + i // 8] >> (i % 8) & 1))
+            resp = bytearray(frame[:6])
+        elif fc == FC_READ_COILS and addr + value <= len(self.coils):
+            bits = 0
+            for i in range(value):
+                if self.coils[addr + i]:
+                    bits |= 1 << i
+            nbytes = (value + 7) // 8
+            resp = bytearray((self.address, fc, nbytes))
+            for i in range(nbytes):
+                resp.append((bits >> (8 * i)) & 0xFF)
+        else:
+            resp = bytearray((self.address, fc | 0x80, 2))  # ILLEGAL DATA ADDRESS
+        crc = crc16(resp)
+        resp.append(crc & 0xFF)
+        resp.append(crc >> 8)
+        ready = clock.us + (len(frame) + len(resp)) * self.char_us + self.latency_us
+        return bytes(resp), ready
+
+    def _set(self, index, state):
+        if self.coils[index] == state:
+            return
+        self.coils[index] = state
+        if state:
+            self.switches[index] += 1
+        if self.on_change is not None:
+            self.on_change(index + 1, state)
+
+class UART:
+    def __init__(self, id, baudrate=9600, tx=None, rx=None, bits=8, parity=None, stop=1, **kwargs):
+        self.id = id
+        self.baudrate = baudrate
+        self._rx = b""
+        self._ready_us = 0
+
+    def write(self, buf):
+        data = bytes(buf)
+        dev = UART_DEVICES.get(self.id)
+        reply = dev.request(data) if dev is not None else None
+        if reply is not None:
+            self._rx, self._ready_us = reply
+        return len(data)
+
+    def any(self):
+        if self._rx and clock.us >= self._ready_us:
+            return len(self._rx)
+        return 0
+
+    def read(self, n=-1):
+        if not self.any():
+            return None
+        if n < 0:
+            n = len(self._rx)
+        data, self._rx = self._rx[:n], self._rx[n:]
+        return data
+
+    def readinto(self, buf, n=-1):
+        data = self.read(len(buf) if n < 0 else n)
+        if not data:
+            return None
+        buf[:len(data)] = data
+        return len(data)
@@ -0,0 +1,65 @@
+# sim/metrics.py
+# Показатели качества регулирования по ходу симуляции: интеграл модуля
+# ошибки (IAE), перерегулирование, время установления, импульсы реле.
+
+class Metrics:
+    def __init__(self, setpoint, band, start_s=0.0):
+        self.setpoint = setpoint
+        self.band = band              # O2 в пределах ±band — «установилось»
+        self.start_s = start_s        # раньше — не учитывается (разгон, ступень возмущения)
+        self.samples = 0
+        self.iae = 0.0
+        self.side = 0                 # знак начальной ошибки
+        self.overshoot = 0.0          # наибольший выход за уставку на другую сторону
+        self.last_outside = None      # последний момент вне полосы
+        self.pulses = {}              # канал → число включений
+        self.on_time = {}             # канал → суммарное время включения, с
+        self._on_since = {}
+        self._t = None
+        self.t_end = start_s
+
+    def sample(self, t, o2):
+        if t < self.start_s:
+            return
+        e = o2 - self.setpoint
+        if self._t is not None:
+            self.iae += abs(e) * (t - self._t)
+        self._t = t
+        self.t_end = t
+        self.samples += 1
+        if not self.side and e:
+            self.side = 1 if e > 0 else -1
+        if self.side and -self.side * e > self.overshoot:
+            self.overshoot = -self.side * e
+        if abs(e) > self.band:
+            self.last_outside = t
+
+    def relay(self, t, channel, state):
+        if state:
+            self._on_since[channel] = t
+            if t >= self.start_s:
+                self.pulses[channel] = self.pulses.get(channel, 0) + 1
+        elif channel in self._on_since:
+            t0 = max(self._on_since.pop(channel), self.start_s)
+            if t > t0:
+                self.on_time[channel] = self.on_time.get(channel, 0.0) + t - t0
+
+    def settling_time(self):
+        """Время от start_s, после которого O2 не выходил из полосы; None — не установился."""
+        if not self.samples:
+            return None
+        if self.last_outside is None:
+            return 0.0
+        if self.last_outside >= self.t_end:
+            return None
+        return self.last_outside - self.start_s
+
+    def summary(self):
+        return {
+            "duration_s": round(self.t_end - self.start_s, 1),
+            "iae": round(self.iae, 2),
+            "overshoot": round(self.overshoot, 3),
+            "settling_s": None if self.settling_time() is None else round(self.settling_time(), 1),
+            "pulses": dict(sorted(self.pulses.items())),
+            "relay_on_s": {ch: round(v, 1) for ch, v in sorted(self.on_time.items())},
+        }
@@ -0,0 +1,36 @@
+# sim/network.py
+# Заменитель модуля network для хоста: точка доступа «включается» сразу.
+
+AP_IF = 1
+STA_IF = 0
+
+AUTH_OPEN = 0
+AUTH_WPA2_PSK = 3
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._active = False
+        self._config = {"essid": "", "password": "", "authmode": AUTH_OPEN}
+        self._ifconfig = ("192.168.4.1", "255.255.255.0", "192.168.4.1", "0.0.0.0")
+
+    def active(self, state=None):
+        if state is None:
+            return self._active
+        self._active = bool(state)
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config.get(args[0])
+        self._config.update(kwargs)
+
+    def ifconfig(self, config=None):
+        if config is None:
+            return self._ifconfig
+        self._ifconfig = tuple(config)
+
+    def isconnected(self):
+        return self._active and self.interface == STA_IF
+
+    def status(self, *args):
+        return 1010 if self._active else 1000  # STAT_GOT_IP / STAT_IDLE
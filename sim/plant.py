@@ -0,0 +1,186 @@
+# sim/plant.py
+# Модель котла для симулятора: исполнительный механизм воздуха (реле
+# «меньше»/«больше»), давление воздуха с инерцией, O2 в дымовых газах
+# с транспортной задержкой и апериодическим звеном, возмущения по газу.
+import math
+import random
+from collections import deque
+from calibration import Curve, compiled
+
+RELAY_LESS = 3   # реле «меньше» — механизм закрывается
+RELAY_MORE = 4   # реле «больше» — механизм открывается
+O2_AIR = 20.9    # % O2 в воздухе
+
+# === Профили расхода газа: fn(t, с) → расход ===
+def constant(value):
+    return lambda t: value
+
+def step(before, after, at_s):
+    return lambda t: before if t < at_s else after
+
+def ramp(start, end, t0_s, t1_s):
+    def fn(t):
+        if t <= t0_s:
+            return start
+        if t >= t1_s:
+            return end
+        return start + (end - start) * (t - t0_s) / (t1_s - t0_s)
+    return fn
+
+def sine(mean, amplitude, period_s):
+    return lambda t: mean + amplitude * math.sin(2 * math.pi * t / period_s)
+
+def random_walk(start, sigma, low, high, seed=1, interval_s=10.0):
+    """Случайное блуждание с новым шагом раз в interval_s (воспроизводимо по seed)."""
+    rnd = random.Random(seed)
+    points = [start]
+    def fn(t):
+        k = int(t // interval_s)
+        while len(points) <= k:
+            points.append(min(high, max(low, points[-1] + rnd.gauss(0, sigma))))
+        return points[k]
+    return fn
+
+PROFILES = ("constant", "step", "ramp", "sine", "random")
+
+def profile(name, cfg, duration, gas=None, seed=1):
+    """Профиль PROFILES вокруг gas (по умолчанию — середина таблицы газ/воздух)."""
+    table = cfg.get("air_fuel_table", [])
+    lo = table[0]["gas"] if table else 0.0
+    hi = table[-1]["gas"] if table else 100.0
+    base = gas if gas is not None else (lo + hi) / 2
+    swing = (hi - lo) * 0.2
+    if name == "constant":
+        return constant(base)
+    if name == "step":
+        return step(base, base + swing, duration / 2)
+    if name == "ramp":
+        return ramp(base, base + swing, duration * 0.25, duration * 0.75)
+    if name == "sine":
+        return sine(base, swing / 2, 600.0)
+    if name == "random":
+        return random_walk(base, swing / 10, lo, hi, seed)
+    raise ValueError("unknown profile: " + name)
+
+class Boiler:
+    """
+    Состояние котла во времени модели (секунды от начала). Модель —
+    один контур: механизм воздуха на реле less/more.
+    air_needed(gas) — давление воздуха при стехиометрии (λ = 1);
+    λ = давление / air_needed, O2 установившийся = 20.9 * (1 - 1/λ).
+    """
+
+    def __init__(self, gas, air_needed, pressure_max, full_stroke_s=30.0,
+                 pressure_tau_s=1.0, o2_tau_s=8.0, dead_time_s=5.0, position=0.5,
+                 o2_noise=0.0, sensor_skew=0.0, seed=1, less=RELAY_LESS, more=RELAY_MORE):
+        self.gas_profile = gas
+        self.air_needed = air_needed
+        self.pressure_max = pressure_max
+        self.full_stroke_s = full_stroke_s
+        self.pressure_tau_s = pressure_tau_s
+        self.o2_tau_s = o2_tau_s
+        self.dead_time_s = dead_time_s
+        self.o2_noise = o2_noise
+        self.sensor_skew = sensor_skew   # расхождение двух датчиков O2, %
+        self.rnd = random.Random(seed)
+        self.t = 0.0
+        self.position = position         # 0 — закрыт, 1 — открыт
+        self.direction = 0               # -1 / 0 / +1 по состоянию реле
+        self.less = less
+        self.more = more
+        self.relays = {less: False, more: False}
+        self.gas = gas(0.0)
+        self.pressure = pressure_max * position
+        self.o2 = self._o2_steady()
+        self._delay = deque()            # (t, O2) — транспортная задержка
+
+    @classmethod
+    def from_config(cls, cfg, gas, table_lambda=1.1, pressure=None, **kwargs):
+        """
+        Котёл под конфигурацию: таблица газ/воздух даёт избыток воздуха table_lambda
+        (меньше уставки — ПИД-коррекции есть что исправлять), диапазон давления —
+        из калибровки канала давления, начальное положение — по давлению pressure
+        (по умолчанию — по таблице).
+        Всё — по первому контуру из секции "loops".
+        """
+        loop = cfg["loops"][0]
+        cal = compiled(cfg)
+        table = cal.curves[loop["table"]]
+        needed = Curve([(x, y / table_lambda) for x, y in zip(table.xs, table.ys)])
+        ch = cfg[cal.keys[cal.index(loop["pressure"])]]
+        pressure_max = max(ch["y_min"], ch["y_max"])
+        if pressure is None:
+            pressure = table(gas(0.0))
+        position = min(1.0, max(0.0, pressure / pressure_max))
+        return cls(gas, needed, pressure_max, position=position,
+                   less=loop["relay_less"], more=loop["relay_more"], **kwargs)
+
+    def relay(self, channel, state):
+        if channel in self.relays:
+            self.relays[channel] = state
+            # Одновременное включение обоих направлений механизм не двигает
+            self.direction = int(self.relays[self.more]) - int(self.relays[self.less])
+
+    def _o2_steady(self):
+        needed = self.air_needed(self.gas)
+        if needed <= 0 or self.pressure <= 0:
+            return O2_AIR if self.gas <= 0 else 0.0
+        lam = self.pressure / needed
+        if lam <= 1.0:
+            return 0.0
+        return O2_AIR * (1.0 - 1.0 / lam)
+
+    def step(self, dt):
+        self.t += dt
+        self.gas = self.gas_profile(self.t)
+        if self.direction:
+            self.position = min(1.0, max(0.0, self.position + self.direction * dt / self.full_stroke_s))
+        target = self.pressure_max * self.position
+        self.pressure += (target - self.pressure) * min(1.0, dt / self.pressure_tau_s)
+        # Анализатор видит газы, вышедшие из топки dead_time_s назад
+        delay = self._delay
+        delay.append((self.t, self._o2_steady()))
+        seen = None
+        while delay and delay[0][0] <= self.t - self.dead_time_s:
+            seen = delay.popleft()[1]
+        if seen is not None:
+            self.o2 += (seen - self.o2) * min(1.0, dt / self.o2_tau_s)
+
+    def measured(self):
+        """Показания датчиков: O2 левый, O2 правый, газ, давление воздуха."""
+        noise = self.rnd.gauss(0, self.o2_noise) if self.o2_noise else 0.0
+        half = self.sensor_skew / 2
+        return (self.o2 + noise - half, self.o2 + noise + half, self.gas, self.pressure)
+
+# Величины, которые показывает модель, в порядке Boiler.measured()
+MEASURED = ("o2_1", "o2_2", "gas_flow", "air_pressure")
+
+class Sensors:
+    """
+    Обратная калибровка: физические значения модели → напряжения на входах
+    ADS1115 по карте каналов. Каналы величин, которых нет в модели, — 0 В.
+    """
+
+    def __init__(self, plant, cfg):
+        self.plant = plant
+        self.inputs = {}   # (адрес, MUX) → (номер в measured() или -1, k, y_min, v_min)
+        cal = compiled(cfg)
+        for key, name, (addr, mux) in zip(cal.keys, cal.names, cal.layout):
+            c = cfg.get(key) or {"v_min": 0.0, "v_max": 1.0, "y_min": 0.0, "y_max": 1.0}
+            dy = c["y_max"] - c["y_min"]
+            k = (c["v_max"] - c["v_min"]) / dy if dy else 0.0
+            index = MEASURED.index(name) if name in MEASURED else -1
+            self.inputs[(addr, mux)] = (index, k, c["y_min"], c["v_min"])
+
+    def voltage(self, addr, mux):
+        index, k, ymin, vmin = self.inputs.get((addr, mux), (-1, 0.0, 0.0, 0.0))
+        if index < 0:
+            return 0.0
+        return vmin + k * (self.plant.measured()[index] - ymin)
+
+    def addrs(self):
+        return sorted(set(addr for addr, _ in self.inputs))
+
+    def source(self, addr):
+        """Источник для Ads1115 с адресом addr: пара mux → напряжение."""
+        return lambda mux: self.voltage(addr, mux)
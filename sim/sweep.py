@@ -0,0 +1,297 @@
+# sim/sweep.py
+# Подбор настроек регулятора на модели котла — до правки pid_control на
+# живом котле:
+#   python -m sim.sweep --config config.json --trace trace.csv \
+#       --set pid_control.Kp=0.05,0.1,0.2 --set pid_control.deadband=0.1,0.2 \
+#       --set air_fuel_table=0.95,1,1.05
+# Запись --trace — CSV с напряжениями на входах ADS1115: столбец t (с) или
+# t_ms и по столбцу на канал карты (ключ секции калибровки или величина).
+# Запись калибруется целиком той же формулой, что и на устройстве (NumPy,
+# если установлен), и задаёт модели расход газа, начальное давление, избыток
+# воздуха по таблице и шум O2. Каждый кандидат — сетка --set/--grid — идёт
+# через прошивку (run_automatic_control и задачи планировщика) в своём
+# процессе пула: модули прошивки — синглтоны, прогон в том же процессе
+# унаследовал бы фильтры, очередь реле и ПИД прошлого кандидата.
+# Кандидаты ранжируются по сумме мест по IAE, перерегулированию O2 и числу
+# включений реле; в конце — пропускная способность в циклах регулятора в секунду.
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from calibration import Calibration, Curve
+from sim import plant
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+METRICS = ("iae", "overshoot", "relay_ops")
+
+# === Запись ===
+def read_trace(path, cal):
+    """CSV → (t, с; напряжения по каналам карты): ndarray с NumPy, иначе списки."""
+    with open(path) as f:
+        reader = csv.reader(f)
+        header = [h.strip() for h in next(reader)]
+        rows = [r for r in reader if r]
+    if "t" in header:
+        t_col, t_scale = header.index("t"), 1.0
+    elif "t_ms" in header:
+        t_col, t_scale = header.index("t_ms"), 0.001
+    else:
+        raise ValueError("trace: no t or t_ms column")
+    cols = []
+    for key, name in zip(cal.keys, cal.names):
+        if key in header:
+            cols.append(header.index(key))
+        elif name in header:
+            cols.append(header.index(name))
+        else:
+            raise ValueError("trace: no column for channel " + key + " (" + name + ")")
+    t = [float(r[t_col]) * t_scale for r in rows]
+    volts = [[float(r[c]) for r in rows] for c in cols]
+    if np is not None:
+        return np.array(t), [np.array(v) for v in volts]
+    return t, volts
+
+def fit(cfg, t, values):
+    """
+    Параметры модели по откалиброванной записи и первому контуру cfg:
+    профиль газа, начальное давление, избыток воздуха таблицы (из O2 при
+    записанном давлении), шум O2 (по разностям соседних отсчётов) и IAE записи.
+    """
+    loop = cfg["loops"][0]
+    o2 = [float(x) for x in values[loop["o2"]]]
+    gas = [float(x) for x in values[loop["gas"]]]
+    pressure = [float(x) for x in values[loop["pressure"]]]
+    table = Calibration(cfg).curves[loop["table"]]
+    target = table.batch(values[loop["gas"]])
+    t0 = float(t[0])
+    ts = [float(x) - t0 for x in t]
+    # O2 = 20.9 · (1 − 1/λ) → λ; таблица даёт давление λ_table · стехиометрическое
+    lambdas = []
+    for i in range(len(o2)):
+        if pressure[i] > 0 and target[i] > 0 and 0 < o2[i] < plant.O2_AIR - 0.5:
+            lam = plant.O2_AIR / (plant.O2_AIR - o2[i])
+            lambdas.append(lam * float(target[i]) / pressure[i])
+    lambdas.sort()
+    diffs = [o2[i + 1] - o2[i] for i in range(len(o2) - 1)]
+    mean = sum(diffs) / len(diffs) if diffs else 0.0
+    noise = math.sqrt(sum((d - mean) ** 2 for d in diffs) / len(diffs) / 2) if diffs else 0.0
+    setpoint = cfg[loop["pid"]]["o2_setpoint"]
+    iae = sum(abs(o2[i] - setpoint) * (ts[i + 1] - ts[i]) for i in range(len(ts) - 1))
+    return {
+        "gas": list(zip(ts, gas)),
+        "pressure": pressure[0],
+        "table_lambda": lambdas[len(lambdas) // 2] if lambdas else None,
+        "noise": noise,
+        "duration": ts[-1] if ts else 0.0,
+        "iae": iae,
+    }
+
+# === Сетка кандидатов ===
+def parse_set(text):
+    """'pid_control.Kp=0.05,0.1' → ('pid_control.Kp', [0.05, 0.1])."""
+    name, sep, values = text.partition("=")
+    if not sep or not values:
+        raise ValueError("--set: expected section.field=v1,v2,...")
+    return name.strip(), [json.loads(v) for v in values.split(",")]
+
+def check_param(cfg, name, values):
+    section, _, field = name.partition(".")
+    if section not in cfg:
+        raise ValueError(name + ": unknown section")
+    if field:
+        if not isinstance(cfg[section], dict) or field not in cfg[section]:
+            raise ValueError(name + ": unknown field")
+    elif not isinstance(cfg[section], list):
+        raise ValueError(name + ": expected section.field or table section")
+    if not values:
+        raise ValueError(name + ": no values")
+
+def candidate(cfg, overrides):
+    """Копия cfg с заменами; таблица — список точек или множитель air_target."""
+    c = json.loads(json.dumps(cfg))
+    for name, value in overrides:
+        section, _, field = name.partition(".")
+        if field:
+            c[section][field] = value
+        elif isinstance(value, list):
+            c[section] = value
+        else:
+            c[section] = [{"gas": p["gas"], "air_target": p["air_target"] * value} for p in c[section]]
+    return c
+
+def label(name, value):
+    section, _, field = name.partition(".")
+    if field:
+        return "{}={}".format(field, value)
+    if isinstance(value, list):
+        return "{}={}pt".format(section, len(value))
+    return "{}=x{}".format(section, value)
+
+# === Прогон в процессе пула ===
+_job = None
+
+def _init(job):
+    global _job
+    _job = job
+
+def _run(task):
+    index, overrides = task
+    from sim.harness import Simulation
+    job = _job
+    cfg = candidate(job["cfg"], overrides)
+    if job["trace"] is not None:
+        gas = Curve(job["trace"])
+    else:
+        gas = plant.profile(job["profile"], job["cfg"], job["duration"], job["gas"], job["plant"]["seed"])
+    sim = Simulation(cfg, gas, band=job["band"], start_s=job["start"], plant_cfg=job["cfg"], **job["plant"])
+    result = sim.run(job["duration"])
+    result["relay_ops"] = result["pulses_less"] + result["pulses_more"]
+    return index, result
+
+def _pool(workers, job):
+    import multiprocessing
+    try:
+        # Ответвление от процесса, где прошивка уже импортирована: новый процесс
+        # на каждого кандидата стоит миллисекунды, а не повторный импорт
+        ctx = multiprocessing.get_context("fork")
+        from sim import install
+        from sim.harness import STEP_MS
+        install(STEP_MS)
+        import runtime  # модули прошивки — до ответвления
+    except ValueError:
+        ctx = multiprocessing.get_context()
+    return ctx.Pool(workers, _init, (job,), maxtasksperchild=1)
+
+def rank(rows):
+    """Сумма мест по METRICS (равным значениям — одно место); при равенстве — меньший IAE."""
+    for row in rows:
+        row["score"] = 0
+    for key in METRICS:
+        place = {}
+        for i, value in enumerate(sorted(row[key] for row in rows)):
+            place.setdefault(value, i)
+        for row in rows:
+            row["score"] += place[row[key]]
+    rows.sort(key=lambda row: (row["score"], row["iae"]))
+    return rows
+
+def main():
+    p = argparse.ArgumentParser(prog="python -m sim.sweep",
+                                description="Controller parameter sweep on the boiler model")
+    p.add_argument("--config", default="config.json")
+    p.add_argument("--trace", help="CSV of raw ADC voltages: t or t_ms, one column per channel")
+    p.add_argument("--set", action="append", default=[], metavar="SECTION.FIELD=V1,V2",
+                   help="candidate values; a table section takes air_target multipliers")
+    p.add_argument("--grid", help='JSON {"pid_control.Kp": [...], "air_fuel_table": [1.0, [points]]}')
+    p.add_argument("--duration", type=float, help="model seconds (default: trace length or 3600)")
+    p.add_argument("--profile", default="step", choices=plant.PROFILES, help="gas profile without --trace")
+    p.add_argument("--gas", type=float, help="base gas flow without --trace")
+    p.add_argument("--table-lambda", type=float, help="excess air given by air_fuel_table (default: from trace or 1.1)")
+    p.add_argument("--stroke", type=float, default=30.0, help="actuator full stroke, s")
+    p.add_argument("--dead-time", type=float, default=5.0, help="O2 transport delay, s")
+    p.add_argument("--tau", type=float, default=8.0, help="O2 analyser time constant, s")
+    p.add_argument("--noise", type=float, help="O2 sensor noise, %% (default: from trace or 0)")
+    p.add_argument("--band", type=float, help="settling band, %% O2 (default: current deadband)")
+    p.add_argument("--from", dest="start", type=float, default=0.0, help="ignore metrics before, s")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    p.add_argument("--top", type=int, default=10, help="candidates to print")
+    p.add_argument("--csv", help="write all ranked candidates to this file")
+    args = p.parse_args()
+
+    import config_manager
+    with open(args.config) as f:
+        cfg = config_manager.complete(json.load(f))
+    params = []
+    if args.grid:
+        with open(args.grid) as f:
+            params.extend(json.load(f).items())
+    try:
+        params.extend(parse_set(text) for text in args.set)
+        for name, values in params:
+            check_param(cfg, name, values)
+    except ValueError as e:
+        raise SystemExit(e)
+
+    fitted = None
+    if args.trace:
+        cal = Calibration(cfg)
+        t0 = time.perf_counter()
+        try:
+            t, volts = read_trace(args.trace, cal)
+        except (OSError, ValueError) as e:
+            raise SystemExit(e)
+        values = cal.batch_values(volts)
+        cal_s = time.perf_counter() - t0
+        fitted = fit(cfg, t, values)
+        print("trace            {} samples, {:.1f} s, read and calibrated in {:.3f} s ({})".format(
+            len(t), fitted["duration"], cal_s, "numpy" if np is not None else "python"))
+        print("trace iae        {:.2f}".format(fitted["iae"]))
+    table_lambda = args.table_lambda
+    if table_lambda is None:
+        table_lambda = fitted["table_lambda"] if fitted and fitted["table_lambda"] else 1.1
+    noise = args.noise
+    if noise is None:
+        noise = fitted["noise"] if fitted else 0.0
+    duration = args.duration or (fitted["duration"] if fitted else 3600.0)
+    pid = cfg[cfg["loops"][0]["pid"]]
+    print("model            table_lambda {:.3f}, noise {:.3f}, stroke {} s, dead time {} s, tau {} s".format(
+        table_lambda, noise, args.stroke, args.dead_time, args.tau))
+
+    plant_kwargs = {"table_lambda": table_lambda, "full_stroke_s": args.stroke, "dead_time_s": args.dead_time,
+                    "o2_tau_s": args.tau, "o2_noise": noise, "seed": args.seed}
+    if fitted:
+        plant_kwargs["pressure"] = fitted["pressure"]
+    job = {"cfg": cfg, "plant": plant_kwargs, "duration": duration, "start": args.start,
+           "band": pid["deadband"] if args.band is None else args.band,
+           "trace": fitted["gas"] if fitted else None, "profile": args.profile, "gas": args.gas}
+    names = [name for name, _ in params]
+    grid = [list(zip(names, combo)) for combo in itertools.product(*[values for _, values in params])]
+    if not any(candidate(cfg, overrides) == cfg for overrides in grid):
+        grid.insert(0, [])  # текущая конфигурация — для сравнения
+
+    rows = [None] * len(grid)
+    wall = time.perf_counter()
+    with _pool(max(1, min(args.jobs, len(grid))), job) as pool:
+        for done, (index, result) in enumerate(pool.imap_unordered(_run, enumerate(grid)), 1):
+            result["params"] = " ".join(label(n, v) for n, v in grid[index]) or "(current)"
+            if grid[index] and candidate(cfg, grid[index]) == cfg:
+                result["params"] += " (current)"
+            result["overrides"] = grid[index]
+            rows[index] = result
+            sys.stderr.write("\r{}/{}".format(done, len(grid)))
+    wall = time.perf_counter() - wall
+    sys.stderr.write("\r" + " " * 24 + "\r")
+    rank(rows)
+
+    print("{:>4} {:>5} {:>10} {:>9} {:>6} {:>10}  {}".format(
+        "rank", "score", "iae", "overshoot", "relay", "settling_s", "params"))
+    for i, row in enumerate(rows[:args.top], 1):
+        print("{:>4} {:>5} {:>10} {:>9} {:>6} {:>10}  {}".format(
+            i, row["score"], row["iae"], row["overshoot"], row["relay_ops"],
+            "-" if row["settling_s"] is None else row["settling_s"], row["params"]))
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["rank", "score"] + list(METRICS) + ["settling_s"] + names)
+            for i, row in enumerate(rows, 1):
+                given = dict(row["overrides"])
+                w.writerow([i, row["score"]] + [row[key] for key in METRICS] + [row["settling_s"]] +
+                           [json.dumps(given[n]) if n in given else "" for n in names])
+    steps = sum(row["pid_steps"] for row in rows)
+    print("{:<16} {}".format("candidates", len(rows)))
+    print("{:<16} {}".format("pid_steps", steps))
+    print("{:<16} {:.1f}".format("wall_s", wall))
+    print("{:<16} {:.0f}".format("steps_per_s", steps / wall if wall else 0.0))
+    print("{:<16} {}".format("workers", max(1, min(args.jobs, len(grid)))))
+
+if __name__ == "__main__":
+    main()
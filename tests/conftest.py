@@ -0,0 +1,20 @@
+# tests/conftest.py
+# Тесты на хосте: заменители machine/network и виртуальные часы из sim
+# ставятся до импорта модулей прошивки.
+#   python -m pytest tests
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pytest
+from sim import install, machine
+
+clock = install()
+
+@pytest.fixture
+def i2c_devices(monkeypatch):
+    """Пустая шина I2C на время теста: адрес → модель микросхемы."""
+    devices = {}
+    monkeypatch.setattr(machine, "I2C_DEVICES", devices)
+    return devices
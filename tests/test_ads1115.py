@@ -0,0 +1,112 @@
+# tests/test_ads1115.py
+# Неблокирующий опрос ADS1115 на модели микросхемы: параллельные
+# преобразования, готовность по биту OS, таймаут с повтором, устаревший отсчёт,
+# выпадение неотвечающей микросхемы без остановки остальных каналов.
+import ads1115
+from ads1115 import Acquisition
+from sim import machine
+from conftest import clock
+
+CHANNELS = ((0x48, 0), (0x48, 3), (0x49, 0), (0x49, 3))
+VOLTS = {(0x48, 0): 0.25, (0x48, 3): 0.5, (0x49, 0): 1.0, (0x49, 3): 1.5}
+LSB = 6.144 / 32768
+
+def _chips(devices):
+    for addr in (0x48, 0x49):
+        devices[addr] = machine.Ads1115(lambda mux, addr=addr: VOLTS[(addr, mux)])
+    return devices
+
+def _poll_until_sample(acq, limit_ms=200):
+    """Опрос шагами по 1 мс; время модели (мс) до публикации отсчёта."""
+    seq = acq.seq
+    t0 = clock.us
+    while acq.seq == seq:
+        acq.poll()
+        clock.advance_us(1000)
+        assert clock.us - t0 < limit_ms * 1000, "no sample"
+    return (clock.us - t0) // 1000
+
+def test_two_chips_convert_in_parallel(i2c_devices):
+    devices = _chips(i2c_devices)
+    acq = Acquisition(machine.I2C(0), CHANNELS)
+    elapsed = _poll_until_sample(acq)
+    per_pair = ads1115.conversion_ms(ads1115.BASE_CONFIG)
+    # Две пары на микросхему: обход занимает два преобразования, а не четыре
+    assert elapsed <= 2 * per_pair + 2
+    # По два преобразования на отсчёт и третье — начало следующего обхода
+    assert devices[0x48].conversions == 3 and devices[0x49].conversions == 3
+    for value, key in zip(acq.values, CHANNELS):
+        assert abs(value - VOLTS[key]) <= LSB
+    assert acq.layout == CHANNELS and acq.errors == 0
+
+def test_ready_is_polled_by_os_bit(i2c_devices):
+    devices = _chips(i2c_devices)
+    acq = Acquisition(machine.I2C(0), CHANNELS)
+    acq.poll()                       # запуск преобразований (860 SPS — 1.2 мс)
+    clock.advance_us(500)
+    assert acq.poll() is False       # бит OS ещё 0 — код не читается
+    assert devices[0x48].conversions == 1
+    _poll_until_sample(acq)
+    assert acq.seq == 1
+
+def test_timeout_restarts_conversion(i2c_devices):
+    devices = _chips(i2c_devices)
+    acq = Acquisition(machine.I2C(0), CHANNELS)
+    devices[0x49].stalled = True
+    acq.poll()
+    for _ in range(3 * acq._timeout_ms):
+        acq.poll()
+        clock.advance_us(1000)
+    assert acq.seq == 0
+    assert acq.errors >= 2
+    assert devices[0x49].conversions >= 3   # та же пара запускается заново
+    devices[0x49].stalled = False
+    _poll_until_sample(acq)
+    assert abs(acq.values[3] - VOLTS[(0x49, 3)]) <= LSB
+
+def test_missing_chip_counts_errors(i2c_devices):
+    _chips(i2c_devices)
+    del i2c_devices[0x49]
+    acq = Acquisition(machine.I2C(0), CHANNELS)
+    for _ in range(50):
+        acq.poll()                   # OSError шины не выходит наружу
+        clock.advance_us(1000)
+    assert acq.errors > 0 and acq.dropouts == [0, 1]
+    assert acq.seq > 0 and acq.values[2] is None and acq.values[3] is None
+    assert abs(acq.values[0] - VOLTS[(0x48, 0)]) <= LSB
+
+def test_stalled_chip_does_not_freeze_others(i2c_devices):
+    devices = _chips(i2c_devices)
+    acq = Acquisition(machine.I2C(0), CHANNELS)
+    devices[0x49].stalled = True
+    # Первый отсчёт — после CHIP_TIMEOUTS таймаутов, каналы 0x49 пустые
+    elapsed = _poll_until_sample(acq, (ads1115.CHIP_TIMEOUTS + 1) * (acq._timeout_ms + 1))
+    assert elapsed > ads1115.CHIP_TIMEOUTS * acq._timeout_ms
+    assert acq.values[2:] == [None, None] and acq.dropouts == [0, 1]
+    assert abs(acq.values[1] - VOLTS[(0x48, 3)]) <= LSB
+    # Дальше отсчёты идут с частотой исправной микросхемы
+    per_pair = ads1115.conversion_ms(ads1115.BASE_CONFIG)
+    assert _poll_until_sample(acq) <= 2 * per_pair + 2
+    assert acq.values[2:] == [None, None] and acq.dropouts == [0, 1]
+    # Ответившая микросхема возвращается в обход
+    devices[0x49].stalled = False
+    for _ in range(3):
+        _poll_until_sample(acq)
+    assert abs(acq.values[2] - VOLTS[(0x49, 0)]) <= LSB
+    assert abs(acq.values[3] - VOLTS[(0x49, 3)]) <= LSB
+
+def test_read_all_channels_never_blocks(i2c_devices, monkeypatch):
+    _chips(i2c_devices)
+    acq = Acquisition(machine.I2C(0), CHANNELS)
+    monkeypatch.setattr(ads1115, "engine", acq)
+    t0 = clock.us
+    assert ads1115.read_all_channels() is None     # отсчёта ещё не было
+    assert clock.us == t0
+    _poll_until_sample(acq)
+    out = [0.0] * 4
+    assert ads1115.read_all_channels(out) is out
+    assert abs(out[2] - VOLTS[(0x49, 0)]) <= LSB
+    clock.advance_us((ads1115.MAX_AGE_MS + 1) * 1000)
+    t0 = clock.us
+    assert ads1115.read_all_channels(out) is None  # устарел: None без ожидания шины
+    assert clock.us == t0
@@ -0,0 +1,57 @@
+# tests/test_air_pressure_controller.py
+# Каскад на модели котла с поставляемым config.json: O2 и давление — каждый
+# в свои сроки, без просрочек; включение контура без толчка поправки.
+import json
+import os
+import pytest
+from sim import plant
+from sim.harness import Simulation
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config.json")
+
+@pytest.fixture
+def sim():
+    with open(CONFIG) as f:
+        cfg = json.load(f)
+    sim = Simulation(cfg, plant.profile("step", cfg, 3600, None, 1))
+    sim.run(60)
+    return sim
+
+def _loop():
+    import air_pressure_controller
+    return air_pressure_controller.loop(None)
+
+def _config(sim, patch):
+    response = sim.request(b"POST", b"/api/config", json.dumps(patch).encode())
+    assert response.startswith(b"HTTP/1.1 200"), response
+
+def test_shipped_intervals_run_on_time(sim):
+    from config_manager import load_config
+    pid = load_config()["pid_control"]
+    assert pid["control_interval"] < pid["pressure_interval"]   # 1 с и 2 с
+    loop = _loop()
+    steps, overruns = loop.timer.steps, loop.timer.overruns
+    pressure_steps, pressure_overruns = loop.pressure_timer.steps, loop.pressure_timer.overruns
+    sim.run(120)
+    assert loop.timer.overruns == overruns
+    assert loop.pressure_timer.overruns == pressure_overruns
+    assert abs(loop.timer.steps - steps - 120 / pid["control_interval"]) <= 1
+    assert abs(loop.pressure_timer.steps - pressure_steps - 120 / pid["pressure_interval"]) <= 1
+
+def test_enable_is_bumpless(sim):
+    import air_pressure_controller
+    _config(sim, {"pid_control": {"enabled": False}})
+    sim.run(5)
+    assert air_pressure_controller.results["main"] == {"status": "disabled"}
+    # Оператор вручную открыл заслонку: давление выше табличного
+    sim.plant.position = min(1.0, sim.plant.position + 0.03)
+    sim.run(30)
+    _config(sim, {"pid_control": {"enabled": True}})
+    sim.run(0.1)
+    result = air_pressure_controller.results["main"]
+    offset = result["air_pressure"] - result["air_target_base"]
+    assert offset > 20
+    # Поправка продолжает с давления оператора (плюс П-составляющая первого шага),
+    # задание давления остаётся рядом с фактическим — импульса назад нет
+    assert abs(result["correction"] - offset) < 2
+    assert result["action"] == "HOLD"
@@ -0,0 +1,31 @@
+# tests/test_alloc.py
+# Память горячего пути на хосте: прошивка на модели котла не копит блоки
+# в куче от цикла к циклу, байт-код HOT_PATH без выделений (tools/alloc_check.py).
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+import alloc_check
+
+def test_no_retained_blocks_per_cycle():
+    cycles, blocks, sites = alloc_check.measure(seconds=120, warmup_s=60)
+    assert cycles >= 1000
+    assert blocks / cycles <= alloc_check.HOST_LIMIT, sites[:3]
+
+def test_measure_sees_a_leak(monkeypatch):
+    import ads1115
+    import runtime
+    leak = []
+    step = runtime.control_step
+
+    def leaking():
+        step()
+        leak.append(ads1115.read_all_channels())
+    # Утечка в модуле прошивки: read_all_channels() без out — новый список на каждый цикл
+    monkeypatch.setattr(runtime, "control_step", leaking)
+    cycles, blocks, sites = alloc_check.measure(seconds=20, warmup_s=10)
+    assert blocks / cycles > alloc_check.HOST_LIMIT
+    assert any("ads1115.py" in lines[-2] for _, lines in sites)
+
+def test_hot_path_lint():
+    assert alloc_check.lint() == 0
@@ -0,0 +1,80 @@
+# tests/test_autotune.py
+# Безударный выход из релейного опыта: после стопа из веб-интерфейса,
+# таймаута и завершения ПИД контура продолжает с поправки bias, а не с
+# интеграла, накопленного за весь опыт. Переключения без автоколебаний
+# (размах O2 не больше гистерезиса) прерывают опыт без коэффициентов.
+import json
+import os
+import pytest
+from sim import plant
+from sim.harness import Simulation
+from conftest import clock
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config.json")
+
+@pytest.fixture
+def sim():
+    with open(CONFIG) as f:
+        cfg = json.load(f)
+    sim = Simulation(cfg, plant.profile("step", cfg, 3600, None, 1))
+    sim.run(300)
+    return sim
+
+def _autotune(sim, body):
+    response = sim.request(b"POST", b"/api/autotune", body)
+    assert response.startswith(b"HTTP/1.1 200"), response
+
+def _until_stopped(sim, tuner, limit_s):
+    end = sim.now() + limit_s
+    while tuner.running and sim.now() < end:
+        sim.run(0.1)   # период задачи регулятора — выход ловится на том же шаге
+    assert not tuner.running
+
+def _check_bumpless(sim, loop, tuner):
+    from config_manager import load_config
+    ki = load_config()[loop.section]["Ki"]
+    # Первый шаг ПИД после опыта добавляет к bias не больше Ki·|ошибка|·dt
+    # (ошибка в опыте ограничена max_deviation = 2, dt = control_interval = 1 с)
+    assert abs(loop.pid.integral * ki - tuner.bias) < 0.05
+    assert abs(loop.pid.output - tuner.bias) < 2.0   # без выхода: ~50 — амплитуда опыта
+    sim.run(10)
+    assert abs(loop.pid.output - tuner.bias) < 5.0
+
+@pytest.mark.parametrize("body, limit_s, state, reason", [
+    (b'{"action": "start"}', 118, "aborted", "stopped by user"),
+    (b'{"action": "start", "timeout_s": 30}', 60, "aborted", "timeout"),
+    (b'{"action": "start", "cycles": 2}', 600, "done", ""),
+])
+def test_exit_is_bumpless(sim, body, limit_s, state, reason):
+    import air_pressure_controller
+    import autotune
+    loop = air_pressure_controller.loop(None)
+    tuner = autotune.tuner
+    _autotune(sim, body)
+    assert tuner.running and tuner.bias == loop.pid.output
+    if reason == "stopped by user":
+        sim.run(limit_s)
+        assert tuner.running
+        _autotune(sim, b'{"action": "stop"}')
+        sim.run(0.1)
+    else:
+        _until_stopped(sim, tuner, limit_s)
+    assert tuner.state == state and tuner.reason == reason
+    _check_bumpless(sim, loop, tuner)
+
+def test_amplitude_below_hysteresis_gives_no_gains(monkeypatch):
+    import autotune
+    saved = []
+    monkeypatch.setattr(autotune, "save_config", saved.append)
+    tuner = autotune.Autotuner()
+    tuner.start({"enabled": True, "max_correction": 100, "deadband": 0.5}, cycles=2, apply=True)
+    # Ошибка пересекает ±ε от шума, а O2 колеблется лишь на ±0.1
+    for i in range(40):
+        sign = 1 if i % 2 else -1
+        tuner.step(0.6 * sign, 3.0 + 0.1 * sign)
+        clock.advance_us(5000000)
+        if not tuner.running:
+            break
+    assert tuner.state == autotune.ABORTED
+    assert tuner.reason.startswith("no oscillation: amplitude 0.100 below hysteresis 0.500")
+    assert tuner.result is None and not tuner.applied and saved == []
@@ -0,0 +1,33 @@
+# tests/test_config_manager.py
+# Дополнение старой конфигурации и запись отложенных правок при остановке.
+import pytest
+import config_manager
+from config_manager import DEFAULT_CONFIG, complete, save_config
+
+def test_complete_copies_default_fields():
+    cfg = complete({"modbus": {"tcp": False}, "pid_control": {"enabled": True}})
+    assert cfg["modbus"]["scale"] == {} and cfg["modbus"]["tcp"] is False
+    cfg["modbus"]["scale"]["gas_flow"] = 0.5          # правка на месте, как в обработчиках
+    cfg["channels"][0]["quantity"] = "o2_left"
+    assert DEFAULT_CONFIG["modbus"]["scale"] == {}
+    assert DEFAULT_CONFIG["channels"][0]["quantity"] == "o2_1"
+    assert cfg["modbus"]["scale"] is not complete({"modbus": {}})["modbus"]["scale"]
+
+def test_run_flushes_pending_edits(monkeypatch):
+    import runtime
+    written = []
+
+    async def fail(port):
+        raise RuntimeError("fatal")
+    monkeypatch.setattr(runtime, "main", fail)
+    monkeypatch.setattr(runtime.modbus_relay, "all_off", lambda: None)
+    monkeypatch.setattr(config_manager, "_write_atomic", written.append)
+    config_manager.flush_config(force=True)           # правки прошлых тестов
+    written.clear()
+    cfg = config_manager.load_config()
+    save_config(cfg)                                  # правка внутри паузы записи
+    assert not config_manager.flush_config()
+    with pytest.raises(RuntimeError):
+        runtime.run()
+    assert written == [cfg]
+    assert not config_manager.flush_config(force=True)   # записывать больше нечего
@@ -0,0 +1,150 @@
+# tests/test_datalog.py
+# Восстановление журнала после сбоя питания: оборванная запись на flash
+# обрезается до последней целой записи, в том числе когда страницы сегмента
+# сдвинуты частичным flush() и оборванная запись пересекает границу PAGE_SIZE.
+# Столбцы записи — по карте: смена карты начинает сегмент со своим заголовком
+# CSV, сегменты прежнего формата без segN.map читаются как раньше; записи
+# с неверным CRC в CSV не попадают.
+import copy
+import json
+import os
+import struct
+from pathlib import Path
+from calibration import Calibration
+from datalog import DataLog, Layout, LEGACY, PAGE_SIZE
+from modbus_rtu import crc16
+
+CONFIG = Path(__file__).resolve().parent.parent / "config.json"
+CFG = json.loads(CONFIG.read_text())
+CAL = Calibration(CFG)
+RECORD_SIZE = Layout(CAL.columns).size
+PER_PAGE = PAGE_SIZE // RECORD_SIZE
+
+VALUES = {"o2_1": 3.0, "o2_2": 3.2, "gas_flow": 40.0, "air_pressure": 5.0, "o2_avg": 3.1}
+RESULTS = {"main": {"correction": 0.1, "action": "UP"}}
+
+def _log(tmp_path):
+    log = DataLog(directory=str(tmp_path / "log"), segments=2, segment_size=16 * PAGE_SIZE)
+    log.open()
+    return log
+
+def _append(log, n, t0=0, cal=CAL):
+    for i in range(n):
+        log.append(t0 + i * 1000, cal, VALUES, RESULTS, 0b1000)
+
+def _rows(log):
+    return b"".join(log.csv_chunks()).decode().splitlines()[1:]
+
+def test_truncated_mid_record(tmp_path):
+    log = _log(tmp_path)
+    _append(log, 10)
+    log.flush()
+    path = log.path(0)
+    with open(path, "ab") as f:
+        f.write(b"\x01" * (RECORD_SIZE // 2))       # половина записи
+    log = _log(tmp_path)
+    assert log.recovered == 1
+    assert os.path.getsize(path) == 10 * RECORD_SIZE
+    assert len(_rows(log)) == 10
+    assert log.boot == 1                              # номер запуска — после последней записи
+
+def test_torn_write_across_page_boundary(tmp_path):
+    log = _log(tmp_path)
+    _append(log, 10)
+    log.flush()                                       # частичная страница: дальше всё со сдвигом
+    _append(log, PER_PAGE, 10000)                     # страница — через границу 4096
+    path = log.path(0)
+    assert os.path.getsize(path) == (10 + PER_PAGE) * RECORD_SIZE
+    # Оборванная запись: байты до границы испорчены, файл кончается посреди записи
+    with open(path, "r+b") as f:
+        f.seek(4000)
+        f.write(b"\xff" * 8)
+        f.seek(0)
+        data = f.read(4200)
+    with open(path, "wb") as f:
+        f.write(data)
+    log = _log(tmp_path)
+    good = 4000 // RECORD_SIZE * RECORD_SIZE          # до записи с испорченными байтами
+    assert os.path.getsize(path) == good
+    assert log.recovered == (4200 - good + RECORD_SIZE - 1) // RECORD_SIZE
+    rows = _rows(log)
+    assert len(rows) == good // RECORD_SIZE
+    assert rows[-1].split(",")[1] == str(10000 + (good // RECORD_SIZE - 11) * 1000)
+    # Журнал продолжается с места обрыва
+    _append(log, 3, 999000)
+    log.flush()
+    assert os.path.getsize(path) == good + 3 * RECORD_SIZE
+    assert len(_rows(log)) == good // RECORD_SIZE + 3
+
+def test_csv_skips_corrupt_records(tmp_path):
+    log = _log(tmp_path)
+    _append(log, 10)
+    log.flush()
+    with open(log.path(0), "r+b") as f:
+        f.seek(3 * RECORD_SIZE + 8)                   # бит flash в середине сегмента
+        f.write(b"\x55")
+    rows = _rows(log)
+    assert len(rows) == 9
+    assert "3000" not in [row.split(",")[1] for row in rows]
+
+def test_intact_log_is_untouched(tmp_path):
+    log = _log(tmp_path)
+    _append(log, 10)
+    log.flush()
+    _append(log, PER_PAGE)
+    size = os.path.getsize(log.path(0))
+    log = _log(tmp_path)
+    assert log.recovered == 0 and os.path.getsize(log.path(0)) == size
+
+def test_columns_follow_map(tmp_path):
+    log = _log(tmp_path)
+    _append(log, 3)
+    log.flush()
+    lines = b"".join(log.csv_chunks()).decode().splitlines()
+    assert lines[0] == "boot,t_ms," + ",".join(CAL.columns) + ",relays"
+    assert lines[0].endswith("o2_avg,main.correction,main.action,relays")
+    assert lines[1].split(",")[-3:] == ["0.100", "1", "8"]
+    # Переименованная величина и второй контур: новый сегмент со своими столбцами
+    cfg = copy.deepcopy(CFG)
+    cfg["channels"][2]["quantity"] = "gas_2"
+    cfg["loops"].append(dict(cfg["loops"][0], name="aux"))
+    cal = Calibration(cfg)
+    values = dict(VALUES, gas_2=12.5)
+    for i in range(2):
+        log.append(5000 + i * 1000, cal, values, {"main": RESULTS["main"], "aux": {"correction": -2.0, "action": "DOWN"}}, 0)
+    log.flush()
+    assert log.segment == 1
+    assert os.path.getsize(log.path(1)) == 2 * Layout(cal.columns).size
+    lines = b"".join(log.csv_chunks()).decode().splitlines()
+    assert len(lines) == 1 + 3 + 1 + 2
+    header = lines[4].split(",")
+    row = dict(zip(header, lines[5].split(",")))
+    assert row["gas_2"] == "12.500" and "gas_flow" not in row
+    assert row["aux.correction"] == "-2.000" and row["aux.action"] == "-1"
+    # После перезапуска журнал продолжает сегмент с его картой
+    log = _log(tmp_path)
+    assert log.segment == 1 and log.layout.columns == cal.columns
+    _append(log, 1, 9000, cal)
+    log.flush()
+    assert log.segment == 1 and len(_rows(log)) == 3 + 1 + 3
+
+def test_legacy_segment(tmp_path):
+    # Сегмент прежней версии: 32-байтные записи без segN.map
+    os.mkdir(str(tmp_path / "log"))
+    rec = bytearray(LEGACY.size)
+    with open(str(tmp_path / "log" / "seg0.bin"), "wb") as f:
+        for i in range(4):
+            struct.pack_into("<IHfffffbB", rec, 0, i * 1000, 7, 3.0, 3.2, 40.0, 5.0, 0.5, -1, 0b1000)
+            struct.pack_into("<H", rec, 28, crc16(rec[:28]))
+            f.write(rec)
+    log = _log(tmp_path)
+    assert log.recovered == 0 and log.boot == 8
+    lines = b"".join(log.csv_chunks()).decode().splitlines()
+    assert lines[0] == "boot,t_ms,o2_1,o2_2,gas_flow,air_pressure,correction,action,relays"
+    assert lines[4] == "7,3000,3.000,3.200,40.000,5.000,0.500,-1,8"
+    # Новые записи — в следующий сегмент по текущей карте, старый остаётся читаемым
+    _append(log, 2, 10000)
+    log.flush()
+    assert log.segment == 1
+    lines = b"".join(log.csv_chunks()).decode().splitlines()
+    assert len(lines) == 1 + 4 + 1 + 2 and lines[5].endswith("main.action,relays")
@@ -0,0 +1,34 @@
+# tests/test_history.py
+# Столбцы тренда по карте: при её изменении история столбцов с прежними
+# именами сохраняется, новые величины и контуры начинаются с NaN.
+import copy
+import json
+from pathlib import Path
+from calibration import Calibration
+from history import History
+
+CONFIG = Path(__file__).resolve().parent.parent / "config.json"
+
+def test_columns_follow_map():
+    cfg = json.loads(CONFIG.read_text())
+    cal = Calibration(cfg)
+    trend = History(capacity=8)
+    values = {"o2_1": 3.0, "o2_2": 3.2, "gas_flow": 40.0, "air_pressure": 5.0, "o2_avg": 3.1}
+    for _ in range(2):
+        trend.append(cal, values, {"main": {"correction": 1.5, "action": "DOWN"}})
+    assert trend.columns == cal.columns
+    _, cols = trend.query()
+    assert cols["main.correction"][0][0] == 1.5 and cols["main.action"][0][0] == -1
+    # Второй контур и переименованный канал
+    cfg = copy.deepcopy(cfg)
+    cfg["channels"][2]["quantity"] = "gas_2"
+    cfg["loops"].append(dict(cfg["loops"][0], name="aux"))
+    cal = Calibration(cfg)
+    trend.append(cal, dict(values, gas_2=12.0), {"main": {"correction": 2.0, "action": "HOLD"},
+                                                 "aux": {"correction": -1.0, "action": "UP"}})
+    assert "gas_flow" not in trend.columns and "aux.action" in trend.columns
+    _, cols = trend.query(points=3)
+    assert list(cols["o2_1"][0]) == [3.0, 3.0, 3.0]                # история сохранилась
+    assert cols["gas_2"][0][2] == 12.0 and cols["gas_2"][0][0] != cols["gas_2"][0][0]
+    assert cols["aux.correction"][0][2] == -1.0 and cols["aux.action"][0][2] == 1
+    assert list(cols["main.correction"][1]) == [1.5, 1.5, 2.0]
@@ -0,0 +1,130 @@
+# tests/test_http_parser.py
+# Инкрементальный разбор HTTP: заголовок и тело по кускам, несколько
+# запросов в одном буфере, Content-Length, коды ошибок, keep-alive,
+# точная маршрутизация по методу и пути.
+import pytest
+from http_parser import RequestParser, HttpError, BUF_SIZE, MAX_HEADERS
+
+def _feed(parser, data):
+    space = parser.space()
+    space[:len(data)] = data
+    parser.feed(len(data))
+
+def _requests(parser):
+    out = []
+    req = parser.next_request()
+    while req is not None:
+        out.append(req)
+        req = parser.next_request()
+    return out
+
+def _status(data):
+    parser = RequestParser()
+    _feed(parser, data)
+    with pytest.raises(HttpError) as e:
+        parser.next_request()
+    return e.value.status
+
+def test_head_split_across_feeds():
+    parser = RequestParser()
+    raw = b"GET /api/values?from=-10&to=0 HTTP/1.1\r\nHost: 192.168.4.1\r\n\r\n"
+    for chunk in (raw[:5], raw[5:23], raw[23:-1]):
+        _feed(parser, chunk)
+        assert parser.next_request() is None
+    _feed(parser, raw[-1:])
+    req = parser.next_request()
+    assert (req.method, req.path, req.query) == (b"GET", b"/api/values", b"from=-10&to=0")
+    assert req.params() == {"from": "-10", "to": "0"}
+    assert req.header(b"host") == b"192.168.4.1"
+    assert parser.pending() == 0
+
+def test_body_split_across_feeds():
+    parser = RequestParser()
+    body = b'{"pid_control": {"Kp": 0.2}}'
+    _feed(parser, b"POST /api/config HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body[:10])
+    assert parser.next_request() is None
+    _feed(parser, body[10:20])
+    assert parser.next_request() is None
+    _feed(parser, body[20:])
+    req = parser.next_request()
+    assert req.body == body
+    assert parser.next_request() is None
+
+@pytest.mark.parametrize("count", [2, 3])
+def test_pipelined_requests(count):
+    parser = RequestParser()
+    raw = (b"GET /api/values HTTP/1.1\r\n\r\n"
+           b"POST /relay HTTP/1.1\r\nContent-Length: 13\r\n\r\nrelay=1&state"
+           b"GET /metrics HTTP/1.1\r\n\r\n")
+    parts = raw.split(b"GET /metrics")
+    _feed(parser, raw if count == 3 else parts[0])
+    reqs = _requests(parser)
+    assert [(r.method, r.path) for r in reqs] == [
+        (b"GET", b"/api/values"), (b"POST", b"/relay"), (b"GET", b"/metrics")][:count]
+    assert reqs[1].body == b"relay=1&state"
+    assert parser.pending() == 0
+
+def test_pipelined_tail_waits_for_rest():
+    parser = RequestParser()
+    _feed(parser, b"GET / HTTP/1.1\r\n\r\nGET /fo")
+    assert parser.next_request().path == b"/"
+    assert parser.next_request() is None
+    _feed(parser, b"rm HTTP/1.1\r\n\r\n")
+    assert parser.next_request().path == b"/form"
+
+def test_content_length():
+    parser = RequestParser()
+    # Без Content-Length тела нет: следующие байты — уже новый запрос
+    _feed(parser, b"POST /pid HTTP/1.1\r\n\r\nGET / HTTP/1.1\r\n\r\n")
+    first, second = _requests(parser)
+    assert first.body == b"" and second.path == b"/"
+    parser = RequestParser()
+    _feed(parser, b"POST /pid HTTP/1.1\r\ncontent-length: 3\r\n\r\nKp=1")
+    assert parser.next_request().body == b"Kp="
+    assert parser.pending() == 1
+
+@pytest.mark.parametrize("raw", [
+    b"GET\r\n\r\n",
+    b"GET api/values HTTP/1.1\r\n\r\n",
+    b"GET / HTTP/1.1\r\nno colon\r\n\r\n",
+    b"POST / HTTP/1.1\r\nContent-Length: x\r\n\r\n",
+    b"POST / HTTP/1.1\r\nContent-Length: -1\r\n\r\n",
+])
+def test_bad_request(raw):
+    assert _status(raw) == 400
+
+def test_payload_too_large():
+    assert _status(b"POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % BUF_SIZE) == 413
+
+def test_header_fields_too_large():
+    head = b"GET / HTTP/1.1\r\nX-Pad: "
+    assert _status(head + b"a" * (BUF_SIZE - len(head))) == 431   # буфер полон, конца заголовка нет
+    many = b"".join(b"X-%d: 1\r\n" % i for i in range(MAX_HEADERS + 1))
+    assert _status(b"GET / HTTP/1.1\r\n" + many + b"\r\n") == 431
+
+def test_version_not_supported():
+    assert _status(b"GET / HTTP/2.0\r\n\r\n") == 505
+
+def test_keep_alive():
+    parser = RequestParser()
+    _feed(parser, b"GET / HTTP/1.1\r\n\r\n"
+                  b"GET / HTTP/1.1\r\nConnection: close\r\n\r\n"
+                  b"GET / HTTP/1.0\r\n\r\n"
+                  b"GET / HTTP/1.0\r\nConnection: Keep-Alive\r\n\r\n")
+    assert [r.keep_alive for r in _requests(parser)] == [True, False, False, True]
+
+def test_routing_is_exact(monkeypatch):
+    import webserver
+    calls = []
+    monkeypatch.setitem(webserver.ROUTES, (b"POST", b"/relay"), lambda req: calls.append(req) or (b"",))
+    parser = RequestParser()
+    body = b"POST /relay HTTP/1.1\r\n\r\nrelay=1&state=on"
+    _feed(parser, b"POST /table HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body
+                  + b"GET /relay HTTP/1.1\r\n\r\n"
+                  + b"POST /relay/x HTTP/1.1\r\n\r\n")
+    table, get_relay, sub = _requests(parser)
+    monkeypatch.setitem(webserver.ROUTES, (b"POST", b"/table"), lambda req: (b"table",))
+    assert webserver.dispatch(table) == (b"table",)   # путь из тела не учитывается
+    assert b"405" in webserver.dispatch(get_relay)[0]
+    assert b"404" in webserver.dispatch(sub)[0]
+    assert calls == []
@@ -0,0 +1,79 @@
+# tests/test_modbus_relay.py
+# Очередь реле на модели платы Modbus: импульс не блокирует вызывающего,
+# молчащее реле отмечается отказом за один таймаут ответа, групповая
+# команда не теряет отложенное ВЫКЛ импульса, ответ-исключение не повторяется.
+import pytest
+from modbus_relay import RelayDriver, RELAY_ID, BAUDRATE, RESPONSE_TIMEOUT_MS, RETRIES
+from modbus_rtu import RtuMaster, Transaction, FAILED, FC_WRITE_COIL
+from sim import machine
+from conftest import clock
+
+UART_ID = 7  # своя линия — не общая с modbus_relay.relay
+
+@pytest.fixture
+def board(monkeypatch):
+    board = machine.RelayBoard(RELAY_ID)
+    monkeypatch.setattr(machine, "UART_DEVICES", {UART_ID: board})
+    return board
+
+@pytest.fixture
+def driver(board):
+    bus = RtuMaster(machine.UART(UART_ID), BAUDRATE, RESPONSE_TIMEOUT_MS, RETRIES)
+    return RelayDriver(bus)
+
+def _run(driver, ms, until=None):
+    """Шаги очереди и шины по 1 мс; время (мс) до until() или None."""
+    for t in range(ms):
+        driver.poll()
+        driver.bus.poll()
+        if until is not None and until():
+            return t
+        clock.advance_us(1000)
+    return None
+
+def test_pulse_does_not_block(board, driver):
+    t0 = clock.us
+    assert driver.pulse(3, 500)
+    assert clock.us == t0                        # только постановка в очередь
+    on_ms = _run(driver, 100, lambda: board.coils[2])
+    assert on_ms is not None and on_ms < 50
+    off_ms = _run(driver, 600, lambda: not board.coils[2])
+    assert off_ms is not None and abs(on_ms + off_ms - 500) < 50
+    _run(driver, 50)
+    assert driver.state[2] is False and not driver.faults[2]
+
+def test_silent_relay_is_detected_within_one_timeout(board, driver):
+    board.offline = True
+    driver.set(1, True)
+    fault_ms = _run(driver, 1000, lambda: driver.faults[0])
+    # Запрос 8 байт при 9600 бод — ~9 мс, затем таймаут ответа
+    assert fault_ms is not None and fault_ms <= RESPONSE_TIMEOUT_MS + 30
+    assert driver.state[0] is None
+
+def test_set_all_keeps_pending_pulse_off(board, driver):
+    driver.pulse(2, 300)
+    _run(driver, 50, lambda: board.coils[1])
+    driver.set_all(0b0011)                       # каналы 1 и 2 включить
+    _run(driver, 400)
+    assert board.coils[0] is True
+    assert board.coils[1] is False               # импульс всё равно закончился
+
+def test_set_all_off_drops_queue(board, driver):
+    driver.pulse(2, 300)
+    driver.set(4, True, 200)
+    _run(driver, 50, lambda: board.coils[1])
+    driver.set_all(0)
+    _run(driver, 400)
+    assert board.coils == [False] * 4
+    assert not driver._queue
+
+def test_exception_response_is_not_retried(board, driver):
+    bus = driver.bus
+    txn = bus.submit(Transaction(RELAY_ID, FC_WRITE_COIL, 9, value=0xFF00))  # нет такого реле
+    for _ in range(200):
+        bus.poll()
+        if txn.status == FAILED:
+            break
+        clock.advance_us(1000)
+    assert txn.status == FAILED and txn.exception == 2   # ILLEGAL DATA ADDRESS
+    assert board.frames == 1 and bus.exceptions == 1 and bus.crc_errors == 0
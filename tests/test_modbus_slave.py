@@ -0,0 +1,127 @@
+# tests/test_modbus_slave.py
+# Регистры Modbus против модели котла с поставляемым config.json: каждая
+# величина и поля контура после деления на масштаб возвращают калиброванные
+# значения, без насыщения на ±32767. Проверка масштабов в /api/config.
+# Соединение, приславшее заголовок без PDU, закрывается по таймауту простоя.
+import asyncio
+import json
+import os
+import pytest
+from sim import plant
+from sim.harness import Simulation
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config.json")
+
+def _config():
+    with open(CONFIG) as f:
+        return json.load(f)
+
+@pytest.fixture(scope="module")
+def sim():
+    cfg = _config()
+    sim = Simulation(cfg, plant.profile("step", cfg, 3600, None, 1))
+    sim.run(420)   # после ступени газа: давление ~750, расход ~39500
+    return sim
+
+def _read_input(addr, count):
+    import modbus_slave
+    rx = bytearray(modbus_slave.MBAP + 5)
+    rx[4], rx[5], rx[6] = 0, 6, 1
+    rx[7:12] = bytes((0x04, addr >> 8, addr & 0xFF, count >> 8, count & 0xFF))
+    tx = bytearray(modbus_slave.MBAP + 2 + 2 * count)
+    n = modbus_slave.tcp_process(rx, 5, tx)
+    assert n == len(tx) and tx[7] == 0x04, bytes(tx[:n])
+    regs = []
+    for i in range(count):
+        v = (tx[9 + 2 * i] << 8) | tx[10 + 2 * i]
+        regs.append(v - 0x10000 if v & 0x8000 else v)
+    return regs
+
+def _decoded(raw, scale):
+    assert raw != -32768 and abs(raw) < 32767, raw   # есть значение, без насыщения
+    return raw / scale
+
+def test_quantities_decode_to_calibrated_values(sim):
+    import ads1115
+    import calibration
+    import modbus_slave
+    from config_manager import load_config
+    cfg = load_config()
+    cal = calibration.compiled(cfg)
+    expected = cal.values(ads1115.engine.filtered)
+    scales = modbus_slave.scales(cfg)
+    assert scales["gas_flow"] == 0.5 and scales["air_pressure"] == 10
+    regs = _read_input(0, len(cal.quantities))
+    assert _read_input(modbus_slave.IR_QUANTITIES, 1) == [len(cal.quantities)]
+    for q, raw in zip(cal.quantities, regs):
+        value = _decoded(raw, scales[q])
+        assert abs(value - expected[q]) <= 0.5 / scales[q] + 1e-6, q
+    assert expected["gas_flow"] > 30000 and expected["air_pressure"] > 600
+
+def test_loop_block_decodes_to_results(sim):
+    import air_pressure_controller
+    import modbus_slave
+    from config_manager import load_config
+    cfg = load_config()
+    spec = cfg["loops"][0]
+    result = air_pressure_controller.results[spec["name"]]
+    scales = modbus_slave.scales(cfg)
+    regs = _read_input(modbus_slave.LOOP_BASE, 11)
+    assert regs[0] == modbus_slave.ST_PID
+    assert regs[1] == modbus_slave.ACTIONS[result["action"]]
+    for (field, quantity), raw in zip(modbus_slave.LOOP_FIELDS, regs[2:9]):
+        scale = scales[spec[quantity]]
+        # Результат контура округлён до сотых, регистр — до 1/scale
+        assert abs(_decoded(raw, scale) - result[field]) <= 0.5 / scale + 0.01, field
+
+def _patch(cfg, patch):
+    import webserver
+    webserver.apply_config_patch(cfg, patch)
+
+def test_scale_must_fit_channel_range():
+    cfg = _config()
+    with pytest.raises(ValueError, match="overflows"):
+        _patch(cfg, {"modbus": {"scale": {"gas_flow": 1}}})      # 50000 × 1
+    with pytest.raises(ValueError, match="overflows"):
+        _patch(cfg, {"modbus": {"scale": {"o2_avg": 10000}}})    # вычисляемая: по источникам
+    with pytest.raises(ValueError, match="unknown quantity"):
+        _patch(cfg, {"modbus": {"scale": {"gas": 0.5}}})
+    # Расширение диапазона канала под существующий масштаб тоже проверяется
+    with pytest.raises(ValueError, match="air_pressure"):
+        _patch(cfg, {"ch3": {"y_max": 5000.0}})
+    assert cfg["modbus"]["scale"] == {"gas_flow": 0.5, "air_pressure": 10}
+    _patch(cfg, {"modbus": {"scale": {"gas_flow": 0.6, "o2_1": 1000}}})
+    assert cfg["modbus"]["scale"] == {"gas_flow": 0.6, "o2_1": 1000}
+
+def test_default_scale():
+    import modbus_slave
+    assert modbus_slave.default_scale(25.0) == 100
+    assert modbus_slave.default_scale(1000.0) == 10
+    assert modbus_slave.default_scale(50000.0) == 0.1
+    assert 50000.0 * modbus_slave.default_scale(50000.0) <= 32767
+
+class _Writer:
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+def test_tcp_header_without_pdu_times_out(sim, monkeypatch):
+    import runtime
+    monkeypatch.setattr(runtime, "MODBUS_IDLE_TIMEOUT", 0.05)
+    free = len(runtime._modbus_buffers)
+
+    async def session():
+        reader = asyncio.StreamReader()
+        reader.feed_data(bytes((0, 1, 0, 0, 0, 6, 1)))   # MBAP обещает 5 байт PDU, их нет
+        await asyncio.wait_for(runtime.serve_modbus(reader, _Writer()), 1)
+
+    asyncio.run(session())
+    assert len(runtime._modbus_buffers) == free          # буферы вернулись в пул
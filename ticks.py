@@ -0,0 +1,32 @@
+# ticks.py
+# Монотонные тики в стиле MicroPython. На устройстве берутся из time,
+# на хосте (CPython) эмулируются с тем же периодом переполнения 2**30.
+# Модули вызывают ticks.ticks_ms() через модуль, а не через from-import,
+# чтобы симулятор мог подменить часы.
+import time
+
+try:
+    ticks_ms = time.ticks_ms
+    ticks_us = time.ticks_us
+    ticks_add = time.ticks_add
+    ticks_diff = time.ticks_diff
+    sleep_ms = time.sleep_ms
+except AttributeError:
+    TICKS_PERIOD = 1 << 30
+    _MASK = TICKS_PERIOD - 1
+    _HALF = TICKS_PERIOD // 2
+
+    def ticks_ms():
+        return (time.monotonic_ns() // 1000000) & _MASK
+
+    def ticks_us():
+        return (time.monotonic_ns() // 1000) & _MASK
+
+    def ticks_add(t, delta):
+        return (t + delta) & _MASK
+
+    def ticks_diff(a, b):
+        return ((a - b + _HALF) & _MASK) - _HALF
+
+    def sleep_ms(ms):
+        time.sleep(ms / 1000.0)
@@ -0,0 +1,264 @@
+# tools/alloc_check.py
+# Проверка выделений памяти в горячем пути: реле → АЦП (фильтры) →
+# калибровка → регулятор → очередь реле.
+#   Хост:       python tools/alloc_check.py
+#               1) измерение: прошивка на модели котла (sim.harness) после
+#               прогрева идёт HOST_SECONDS модельного времени под tracemalloc;
+#               блоки, оставшиеся в куче от модулей прошивки (вместе со всеми
+#               вызываемыми функциями), в пересчёте на цикл регулятора не
+#               должны превышать HOST_LIMIT — так ловятся утечки и растущие
+#               буферы. Кратковременные выделения CPython не видны (float и
+#               int в куче всё равно дают шум), их ищет
+#               2) проверка байт-кода функций HOT_PATH (только их, без
+#               вызываемых): конструкции, которые в MicroPython создают объект
+#               в куче (списки, словари, кортежи, срезы, форматирование строк,
+#               генераторы, замыкания, экземпляры классов). Исключения COLD —
+#               по тексту строки, новое выделение в той же функции не пройдёт.
+#   Устройство: mpremote run tools/alloc_check.py
+#               gc.mem_alloc() до и после каждой задачи при выключенной
+#               сборке — точное число байт за цикл, затем micropython.mem_info().
+# Арифметика float в MicroPython выделяет объект на каждый результат — это
+# не устранить без перехода на целые, поэтому на устройстве порог не ноль.
+# Код возврата 1 — найдены выделения или превышен порог.
+import os
+import sys
+
+MICROPYTHON = sys.implementation.name == "micropython"
+DEVICE_LIMIT = 256         # байт за цикл задачи в среднем (float-результаты)
+HOST_WARMUP_S = 120        # прогрев модели: первый отсчёт, фильтры, калибровка, очередь реле
+HOST_SECONDS = 600         # модельного времени под tracemalloc
+HOST_LIMIT = 0.05          # удержанных блоков прошивки на цикл регулятора
+
+# (модуль, имя функции или Класс.метод) — всё, что выполняется каждый цикл
+HOT_PATH = (
+    ("ads1115", "Acquisition.poll"), ("ads1115", "Acquisition._ready"),
+    ("ads1115", "Acquisition._read"), ("ads1115", "Acquisition._start"),
+    ("ads1115", "Acquisition._write_reg"), ("ads1115", "Acquisition.age_ms"),
+    ("ads1115", "read_all_channels"),
+    ("filters", "FilterBank.__call__"), ("filters", "Pipeline.__call__"),
+    ("filters", "Pipeline._median_of"), ("filters", "Pipeline._mean_of"),
+    ("calibration", "Calibration.values_into"), ("calibration", "Curve.__call__"),
+    ("calibration", "compiled"),
+    ("air_pressure_controller", "run_automatic_control"), ("air_pressure_controller", "Loop.step"),
+    ("air_pressure_controller", "_sync"), ("air_pressure_controller", "_sample"),
+    ("air_pressure_controller", "ControlTimer.due"), ("air_pressure_controller", "PID.update"),
+    ("air_pressure_controller", "PID.hold"), ("air_pressure_controller", "PID._derivative"),
+    ("air_pressure_controller", "Actuator.busy"), ("air_pressure_controller", "Actuator.pulse_time"),
+    ("air_pressure_controller", "Actuator.move"),
+    ("modbus_relay", "poll"), ("modbus_relay", "RelayDriver.poll"), ("modbus_relay", "RelayDriver.set"),
+    ("modbus_relay", "RelayDriver.pulse"), ("modbus_relay", "RelayDriver.pending"),
+    ("modbus_relay", "RelayDriver.next_due"), ("modbus_relay", "RelayDriver._drop"),
+    ("modbus_relay", "RelayDriver._push"), ("modbus_relay", "RelayDriver._on_write"),
+    ("modbus_rtu", "RtuMaster.poll"), ("modbus_rtu", "RtuMaster.submit"), ("modbus_rtu", "RtuMaster._send"),
+    ("modbus_rtu", "RtuMaster._poll_response"), ("modbus_rtu", "RtuMaster._tx_view"),
+    ("modbus_rtu", "RtuMaster._check_crc"),
+    ("modbus_rtu", "RtuMaster._finish"), ("modbus_rtu", "Transaction.rearm"), ("modbus_rtu", "crc16"),
+    ("modbus_rtu", "response_length"),
+    ("modbus_slave", "RtuSlave.poll"), ("modbus_slave", "RtuSlave._tx_view"),
+    ("runtime", "adc_step"), ("runtime", "control_step"), ("runtime", "request_pulse"),
+    ("runtime", "history_step"), ("runtime", "datalog_step"), ("runtime", "_quiet_ms"),
+    ("runtime", "Scheduler._run_due"), ("runtime", "Scheduler.next_wait"), ("runtime", "Collector.__call__"),
+    ("instrument", "Histogram.record"), ("events", "Hub.publish"),
+)
+
+# === Хост: разбор байт-кода ===
+ALLOCATING_OPS = {
+    "BUILD_LIST": "list", "BUILD_MAP": "dict", "BUILD_CONST_KEY_MAP": "dict", "BUILD_SET": "set",
+    "BUILD_TUPLE": "tuple", "BUILD_SLICE": "slice", "BINARY_SLICE": "slice", "STORE_SLICE": "slice",
+    "FORMAT_VALUE": "f-string", "BUILD_STRING": "f-string", "MAKE_FUNCTION": "closure/generator",
+    "CALL_FUNCTION_EX": "*args", "LIST_EXTEND": "list", "DICT_MERGE": "dict",
+}
+ALLOCATING_BUILTINS = ("list", "dict", "tuple", "set", "bytes", "bytearray", "memoryview", "str",
+                       "enumerate", "zip", "sorted", "reversed", "map", "filter", "array")
+# Ошибочные ветви (печать, исключения) в счёт не идут
+ERROR_PATH = ("print(", "raise ", ".abort(")
+# Выделения не в каждом цикле: (функция, текст строки) → когда
+COLD = {
+    ("compiled", "_compiled = Calibration(cfg)"): "пересборка при изменении конфигурации",
+    ("_sync", "new = {}"): "пересборка контуров при изменении конфигурации",
+    ("_sync", "loop = Loop(spec)"): "пересборка контуров при изменении конфигурации",
+    ("_sync", "for name in list(results):"): "пересборка контуров при изменении конфигурации",
+    ("_sync", "_order = list(new.values())"): "пересборка контуров при изменении конфигурации",
+    ("_sample", "_voltages = [0.0] * len(cal.layout)"): "смена карты каналов",
+    ("Acquisition.poll", "self.values = [0.0] * len(pending)"): "первый отсчёт по новой карте каналов",
+    ("Acquisition.poll", "self.filtered = [0.0] * len(pending)"): "первый отсчёт по новой карте каналов",
+    ("read_all_channels", "return list(engine.filtered)"): "вызов без буфера out (веб-интерфейс)",
+    ("RelayDriver._push", "c = self._free.pop() if self._free else [0, 0, False]"):
+        "только если пул записей очереди исчерпан",
+    ("RtuMaster._tx_view", "view = self._tx_views[n] = memoryview(self._tx)[:n]"): "первый кадр каждой длины",
+    ("RtuSlave._tx_view", "view = self._tx_views[n] = memoryview(self._tx)[:n]"): "первый ответ каждой длины",
+}
+
+def _resolve(module, name):
+    obj = module
+    for part in name.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+def scan(fn):
+    """Места выделений в fn: [(строка, что, текст строки)]."""
+    import dis
+    import inspect
+    code = fn.__code__
+    lines, first = inspect.getsourcelines(fn)
+    found = []
+    prev = []
+    for ins in dis.get_instructions(code):
+        line = ins.positions.lineno if ins.positions else None
+        what = ALLOCATING_OPS.get(ins.opname)
+        if ins.opname == "LOAD_GLOBAL":
+            name = ins.argval
+            value = fn.__globals__.get(name)
+            if name in ALLOCATING_BUILTINS or (isinstance(value, type) and not issubclass(value, BaseException)):
+                what = name + "()"
+        elif ins.opname == "BINARY_OP" and ins.argrepr == "%" and len(prev) >= 2 \
+                and prev[-2].opname == "LOAD_CONST" and isinstance(prev[-2].argval, str):
+            what = "% format"
+        prev.append(ins)
+        if what is None or line is None:
+            continue
+        text = lines[line - first].strip() if 0 <= line - first < len(lines) else ""
+        if any(marker in text for marker in ERROR_PATH):
+            continue
+        found.append((line, what, text))
+    return found
+
+def _root():
+    return os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+def measure(seconds=HOST_SECONDS, warmup_s=HOST_WARMUP_S):
+    """
+    Прогон прошивки на модели котла с конфигурацией config.json: после
+    прогрева warmup_s — seconds под tracemalloc. Возвращает (циклов
+    регулятора, удержанных блоков прошивки, места [(блоков, строки стека)]).
+    """
+    import gc
+    import json
+    import tracemalloc
+    from sim import plant
+    from sim.harness import Simulation
+    root = _root()
+    with open(os.path.join(root, "config.json")) as f:
+        cfg = json.load(f)
+    sim = Simulation(cfg, plant.profile("step", cfg, warmup_s + seconds, None, 1))
+    sim.run(warmup_s)
+    control = [j for j in sim.scheduler.jobs if j.name == "control"][0]
+    # Только модули прошивки в корне проекта: модель котла и метрики sim не в счёт.
+    # Имя файла — как при импорте (tracemalloc сверяет co_filename без нормализации)
+    firmware = [tracemalloc.Filter(True, m.__file__) for m in list(sys.modules.values())
+                if getattr(m, "__file__", None) and os.path.dirname(os.path.abspath(m.__file__)) == root]
+    tracemalloc.start(8)
+    try:
+        gc.collect()
+        runs = control.runs
+        before = tracemalloc.take_snapshot().filter_traces(firmware)
+        sim.run(seconds)
+        gc.collect()
+        after = tracemalloc.take_snapshot().filter_traces(firmware)
+    finally:
+        tracemalloc.stop()
+    cycles = control.runs - runs
+    blocks = 0
+    sites = []
+    for stat in after.compare_to(before, "traceback"):
+        blocks += stat.count_diff
+        if stat.count_diff > 0:
+            sites.append((stat.count_diff, stat.traceback.format()))
+    sites.sort(key=lambda s: -s[0])
+    return cycles, blocks, sites
+
+def lint():
+    """Проверка байт-кода HOT_PATH; возвращает число мест выделений."""
+    import importlib
+    total = 0
+    for module_name, name in HOT_PATH:
+        fn = _resolve(importlib.import_module(module_name), name)
+        for line, what, text in scan(fn):
+            if (name, text) in COLD:
+                continue
+            print("{}.py:{} {}: {} — {}".format(module_name, line, name, what, text))
+            total += 1
+    print("host lint: {} functions scanned, {} allocation sites".format(len(HOT_PATH), total))
+    return total
+
+def host_main():
+    sys.path.insert(0, _root())
+    from sim import install
+    install()  # заменители machine/network вместо оборудования
+    cycles, blocks, sites = measure()
+    per_cycle = blocks / cycles if cycles else 0.0
+    print("host: {} control cycles, {} firmware blocks retained, {:.4f} per cycle (limit {})".format(
+        cycles, blocks, per_cycle, HOST_LIMIT))
+    if per_cycle > HOST_LIMIT:
+        for count, lines in sites[:5]:
+            print("{} blocks:".format(count))
+            print("\n".join(lines[-6:]))
+    return lint() == 0 and per_cycle <= HOST_LIMIT
+
+# === Устройство: gc.mem_alloc при выключенной сборке ===
+class Probe:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.alloc_calls = 0   # вызовов, которые что-то выделили
+        self.total = 0
+        self.peak = 0
+
+    def add(self, used):
+        self.calls += 1
+        if used > 0:
+            self.alloc_calls += 1
+        if used > self.peak:
+            self.peak = used
+        self.total += used
+
+def device_main(seconds=10):
+    import gc
+    import micropython
+    import ticks
+    import modbus_relay
+    import runtime
+    from config_manager import load_config
+    load_config()
+    jobs = (("relay", modbus_relay.poll), ("adc", runtime.adc_step), ("control", runtime.control_step))
+    probes = [Probe(name) for name, _ in jobs]
+    t0 = ticks.ticks_ms()
+    try:
+        # Прогрев вне измерений: первый отсчёт, сборка фильтров и калибровки
+        while ticks.ticks_diff(ticks.ticks_ms(), t0) < 2000:
+            for _, fn in jobs:
+                fn()
+            ticks.sleep_ms(2)
+        gc.collect()
+        gc.disable()
+        t0 = ticks.ticks_ms()
+        while ticks.ticks_diff(ticks.ticks_ms(), t0) < seconds * 1000:
+            for i in range(len(jobs)):
+                before = gc.mem_alloc()
+                jobs[i][1]()
+                probes[i].add(gc.mem_alloc() - before)
+            if gc.mem_free() < 8192:
+                gc.collect()  # куча почти заполнена — сборка вне измеряемых вызовов
+            ticks.sleep_ms(2)
+    finally:
+        gc.enable()
+        modbus_relay.all_off()
+    print("device: {} s, gc.mem_alloc delta per call (gc disabled)".format(seconds))
+    print("{:<10} {:>8} {:>10} {:>8} {:>10}".format("job", "calls", "allocating", "max, B", "B/call"))
+    ok = True
+    for p in probes:
+        per_call = p.total / p.calls if p.calls else 0.0
+        print("{:<10} {:>8} {:>10} {:>8} {:>10.1f}".format(p.name, p.calls, p.alloc_calls, p.peak, per_call))
+        if per_call > DEVICE_LIMIT:
+            ok = False
+    micropython.mem_info()
+    return ok
+
+def main():
+    ok = device_main() if MICROPYTHON else host_main()
+    print("OK" if ok else "FAIL: allocations in the hot path")
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# tools/bench_render.py
+# Хост-бенчмарк главной страницы: прежняя сборка строкой (html += ...)
+# против потокового рендера webpage.render_page.
+# Запуск из корня проекта: python tools/bench_render.py [повторов]
+import os
+import sys
+import time
+import json
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import webpage
+
+# === Прежняя реализация (webserver.build_web_page до потокового рендера) ===
+def legacy_voltage_to_value(v, ch_cfg):
+    vmin = ch_cfg["v_min"]
+    vmax = ch_cfg["v_max"]
+    ymin = ch_cfg["y_min"]
+    ymax = ch_cfg["y_max"]
+    if vmax == vmin:
+        return ymin
+    return (ymax - ymin) / (vmax - vmin) * (v - vmin) + ymin
+
+def legacy_build_web_page(voltages, cfg):
+    html = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>ADS1115 + Регулятор</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <style>
+        body { font-family: Arial, sans-serif; margin: 10px; background: #f9f9f9; }
+        h1, h2 { color: #2c3e50; }
+        .channel, .relay, .table, .pid { background: white; padding: 14px; margin: 12px 0; border-radius: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.1); }
+        input, button, select { padding: 6px; margin: 4px; }
+        .num { width: 70px; }
+        .unit { width: 50px; }
+        .name { width: 120px; }
+        button { background: #27ae60; color: white; border: none; border-radius: 4px; cursor: pointer; }
+        button.off { background: #e74c3c; }
+        .result { font-weight: bold; color: #e74c3c; font-size: 1.2em; }
+        table { width: 100%; border-collapse: collapse; margin: 8px 0; }
+        th, td { border: 1px solid #ccc; padding: 6px; text-align: center; }
+        th { background: #f0f0f0; }
+    </style>
+</head>
+<body>
+    <h1>🎛️ Калибровка и управление</h1>
+"""
+    # === Каналы датчиков ===
+    for i, (v, key) in enumerate(zip(voltages, ["ch0", "ch1", "ch2", "ch3"])):
+        c = cfg[key]
+        value = legacy_voltage_to_value(v, c)
+        html += f"""
+    <div class="channel">
+        <strong>{c['name']}</strong><br>
+        Напряжение: <code>{v:+.4f} В</code> → <span class="result">{value:.2f} {c['unit']}</span><br>
+        <form action="/" method="POST">
+            <input type="hidden" name="ch" value="{key}">
+            Название: <input type="text" name="name" class="name" value="{c['name']}">
+            Напряжение: 
+            <input type="number" step="any" class="num" name="v_min" value="{c['v_min']}"> – 
+            <input type="number" step="any" class="num" name="v_max" value="{c['v_max']}"> В<br>
+            Значение: 
+            <input type="number" step="any" class="num" name="y_min" value="{c['y_min']}"> – 
+            <input type="number" step="any" class="num" name="y_max" value="{c['y_max']}">
+            <input type="text" name="unit" class="unit" value="{c['unit']}">
+            <button type="submit">💾 Сохранить</button>
+        </form>
+    </div>
+"""
+
+    # === Таблица газ/воздух ===
+    table = cfg.get("air_fuel_table", [])
+    # Убедимся, что 5 точек
+    while len(table) < 5:
+        table.append({"gas": 0.0, "air_target": 0.0})
+    if len(table) > 5:
+        table = table[:5]
+
+    html += '<h2>📊 Базовое соотношение газ/воздух</h2>\n<div class="table">\n'
+    html += '<form action="/table" method="POST">\n'
+    html += '<table>\n<tr><th>Расход газа (м³/ч)</th><th>Целевое давление (кПа)</th></tr>\n'
+    for i, point in enumerate(table):
+        html += f'<tr><td><input type="number" step="0.1" class="num" name="gas_{i}" value="{point["gas"]}"</td>'
+        html += f'<td><input type="number" step="0.1" class="num" name="air_{i}" value="{point["air_target"]}"</td></tr>\n'
+    html += '</table>\n<button type="submit">💾 Сохранить таблицу</button>\n</form>\n</div>'
+
+    # === ПИД-регулятор ===
+    pid = cfg.get("pid_control", {})
+    enabled = "checked" if pid.get("enabled", True) else ""
+    html += f'''
+    <h2>⚙️ ПИД-коррекция по O₂</h2>
+    <div class="pid">
+        <form action="/pid" method="POST">
+            <label><input type="checkbox" name="enabled" value="on" {enabled}> Включить ПИД</label><br><br>
+
+            Уставка O₂ (%): 
+            <input type="number" step="0.1" class="num" name="o2_setpoint" value="{pid.get("o2_setpoint", 3.5)}"> ±
+            <input type="number" step="0.1" class="num" name="deadband" value="{pid.get("deadband", 0.1)}"> %
+            <br><br>
+
+            ПИД-коэффициенты:<br>
+            Kp: <input type="number" step="0.01" class="num" name="Kp" value="{pid.get("Kp", 0.8)}">
+            Ki: <input type="number" step="0.001" class="num" name="Ki" value="{pid.get("Ki", 0.02)}">
+            Kd: <input type="number" step="0.01" class="num" name="Kd" value="{pid.get("Kd", 0.1)}">
+            <br><br>
+
+            Макс. коррекция (кПа): 
+            <input type="number" step="0.1" class="num" name="max_correction" value="{pid.get("max_correction", 0.8)}"><br>
+            Интервал (сек): 
+            <input type="number" step="1" class="num" name="control_interval" value="{pid.get("control_interval", 10)}">
+            Импульс (сек): 
+            <input type="number" step="0.1" class="num" name="impulse_duration" value="{pid.get("impulse_duration", 1.5)}">
+            <br><br>
+
+            Безопасные пределы давления:<br>
+            <input type="number" step="0.1" class="num" name="pressure_min_safe" value="{pid.get("pressure_min_safe", 0.5)}"> — 
+            <input type="number" step="0.1" class="num" name="pressure_max_safe" value="{pid.get("pressure_max_safe", 9.0)}">
+            <br><br>
+
+            <button type="submit">💾 Сохранить ПИД</button>
+        </form>
+    </div>
+'''
+
+    # === Ручное управление реле ===
+    html += '<h2>🔌 Ручное управление реле</h2>'
+    for ch in range(1, 5):
+        html += f'''
+    <div class="relay">
+        <strong>Реле {ch}</strong>
+        <form action="/relay" method="POST" style="display:inline;">
+            <input type="hidden" name="relay" value="{ch}">
+            <input type="hidden" name="action" value="on">
+            <button type="submit">🟢 ВКЛ</button>
+        </form>
+        <form action="/relay" method="POST" style="display:inline;">
+            <input type="hidden" name="relay" value="{ch}">
+            <input type="hidden" name="action" value="off">
+            <button type="submit" class="off">🔴 ВЫКЛ</button>
+        </form>
+    </div>
+'''
+    html += "</body></html>"
+    return html
+
+# === Замеры ===
+class NullConn:
+    """Приёмник, который принимает данные кусками, как lwIP."""
+
+    def __init__(self, max_send=1460):
+        self.max_send = max_send
+        self.total = 0
+
+    def send(self, data):
+        n = min(len(data), self.max_send)
+        self.total += n
+        return n
+
+def send_all(conn, data):
+    mv = memoryview(data)
+    sent = 0
+    while sent < len(mv):
+        sent += conn.send(mv[sent:])
+
+def run_legacy(voltages, cfg, conn):
+    html = legacy_build_web_page(voltages, cfg)
+    send_all(conn, ("HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n" + html).encode())
+
+def run_streaming(voltages, cfg, conn):
+    send_all(conn, b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n")
+    for chunk in webpage.render_page(voltages, cfg):
+        send_all(conn, chunk)
+
+def measure(fn, voltages, cfg, repeat):
+    conn = NullConn()
+    fn(voltages, cfg, conn)  # прогрев
+    tracemalloc.start()
+    fn(voltages, cfg, conn)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(voltages, cfg, conn)
+    dt = (time.perf_counter() - t0) / repeat
+    return peak, dt, conn.total // (repeat + 2)
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    with open(os.path.join(root, "config.json")) as f:
+        cfg = json.load(f)
+    voltages = [0.5123, 0.4987, 1.2345, 0.8765]
+    print("{:<10} {:>12} {:>12} {:>10}".format("render", "peak heap, B", "time, us", "bytes"))
+    for name, fn in (("legacy", run_legacy), ("streaming", run_streaming)):
+        peak, dt, size = measure(fn, voltages, cfg, repeat)
+        print("{:<10} {:>12} {:>12.1f} {:>10}".format(name, peak, dt * 1e6, size))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+# tools/build_www.py
+# Сжимает статический интерфейс www/*.html|js|css в .gz для записи на flash.
+# Запускать после каждой правки www/: python tools/build_www.py
+import gzip
+import os
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "www")
+
+def main():
+    for name in sorted(os.listdir(ROOT)):
+        if not name.endswith((".html", ".js", ".css")):
+            continue
+        src = os.path.join(ROOT, name)
+        with open(src, "rb") as f:
+            data = f.read()
+        # mtime=0 — одинаковый вход даёт одинаковый .gz (и ETag)
+        packed = gzip.compress(data, compresslevel=9, mtime=0)
+        with open(src + ".gz", "wb") as f:
+            f.write(packed)
+        print("{:<20} {:>7} -> {:>6} B".format(name, len(data), len(packed)))
+
+if __name__ == "__main__":
+    main()
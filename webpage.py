@@ -0,0 +1,230 @@
+# webpage.py
+# Потоковая генерация главной страницы. Неизменная разметка хранится
+# готовыми байтовыми константами, подставляются только значения полей;
+# куски собираются в один переиспользуемый буфер и отдаются по мере заполнения.
+from calibration import compiled, IDENTITY
+
+CHUNK_SIZE = 1024
+
+
+def _template(text):
+    """Разбивает шаблон по {} на байтовые куски (один раз при импорте)."""
+    return tuple(part.encode() for part in text.split("{}"))
+
+def _fill(tpl, values):
+    yield tpl[0]
+    for i in range(len(values)):
+        yield values[i]
+        yield tpl[i + 1]
+
+HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>ADS1115 + Регулятор</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <style>
+        body { font-family: Arial, sans-serif; margin: 10px; background: #f9f9f9; }
+        h1, h2 { color: #2c3e50; }
+        .channel, .relay, .table, .pid { background: white; padding: 14px; margin: 12px 0; border-radius: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.1); }
+        input, button, select { padding: 6px; margin: 4px; }
+        .num { width: 70px; }
+        .unit { width: 50px; }
+        .name { width: 120px; }
+        button { background: #27ae60; color: white; border: none; border-radius: 4px; cursor: pointer; }
+        button.off { background: #e74c3c; }
+        .result { font-weight: bold; color: #e74c3c; font-size: 1.2em; }
+        table { width: 100%; border-collapse: collapse; margin: 8px 0; }
+        th, td { border: 1px solid #ccc; padding: 6px; text-align: center; }
+        th { background: #f0f0f0; }
+    </style>
+</head>
+<body>
+    <h1>🎛️ Калибровка и управление</h1>
+""".encode()
+
+_CHANNEL = _template("""
+    <div class="channel">
+        <strong>{}</strong><br>
+        Напряжение: <code>{} В</code> → <span class="result">{} {}</span><br>
+        <form action="/" method="POST">
+            <input type="hidden" name="ch" value="{}">
+            Название: <input type="text" name="name" class="name" value="{}">
+            Напряжение: 
+            <input type="number" step="any" class="num" name="v_min" value="{}"> – 
+            <input type="number" step="any" class="num" name="v_max" value="{}"> В<br>
+            Значение: 
+            <input type="number" step="any" class="num" name="y_min" value="{}"> – 
+            <input type="number" step="any" class="num" name="y_max" value="{}">
+            <input type="text" name="unit" class="unit" value="{}">
+            <button type="submit">💾 Сохранить</button>
+        </form>
+    </div>
+""")
+
+_TABLE_HEAD = _template('<h2>📊 Базовое соотношение газ/воздух{}</h2>\n<div class="table">\n'
+                       '<form action="/table" method="POST">\n'
+                       '<input type="hidden" name="section" value="{}">\n'
+                       '<table>\n<tr><th>Расход газа (м³/ч)</th><th>Целевое давление (кПа)</th></tr>\n')
+_TABLE_ROW = _template('<tr><td><input type="number" step="0.1" class="num" name="gas_{}" value="{}"></td>'
+                       '<td><input type="number" step="0.1" class="num" name="air_{}" value="{}"></td></tr>\n')
+TABLE_TAIL = '</table>\n<button type="submit">💾 Сохранить таблицу</button>\n</form>\n</div>'.encode()
+
+_PID = _template("""
+    <h2>⚙️ ПИД-коррекция по O₂{}</h2>
+    <div class="pid">
+        <form action="/pid" method="POST">
+            <input type="hidden" name="section" value="{}">
+            <label><input type="checkbox" name="enabled" value="on" {}> Включить ПИД</label><br><br>
+
+            Уставка O₂ (%): 
+            <input type="number" step="0.1" class="num" name="o2_setpoint" value="{}"> ±
+            <input type="number" step="0.1" class="num" name="deadband" value="{}"> %
+            <br><br>
+
+            ПИД-коэффициенты:<br>
+            Kp: <input type="number" step="0.01" class="num" name="Kp" value="{}">
+            Ki: <input type="number" step="0.001" class="num" name="Ki" value="{}">
+            Kd: <input type="number" step="0.01" class="num" name="Kd" value="{}">
+            Фильтр D (сек): <input type="number" step="0.1" class="num" name="d_filter" value="{}">
+            <br><br>
+
+            Макс. коррекция (кПа): 
+            <input type="number" step="0.1" class="num" name="max_correction" value="{}"><br>
+            Интервал (сек): 
+            <input type="number" step="1" class="num" name="control_interval" value="{}">
+            <br><br>
+
+            Контур давления — интервал (сек): 
+            <input type="number" step="0.1" class="num" name="pressure_interval" value="{}">
+            зона: <input type="number" step="0.1" class="num" name="pressure_deadband" value="{}"><br>
+            Полный ход (сек): <input type="number" step="1" class="num" name="full_stroke" value="{}">
+            усиление: <input type="number" step="0.1" class="num" name="pulse_gain" value="{}"><br>
+            Импульс (сек): <input type="number" step="0.1" class="num" name="min_pulse" value="{}"> –
+            <input type="number" step="0.1" class="num" name="max_pulse" value="{}">
+            люфт: <input type="number" step="0.1" class="num" name="backlash" value="{}">
+            пауза: <input type="number" step="0.1" class="num" name="pressure_settle" value="{}">
+            <br><br>
+
+            Безопасные пределы давления:<br>
+            <input type="number" step="0.1" class="num" name="pressure_min_safe" value="{}"> — 
+            <input type="number" step="0.1" class="num" name="pressure_max_safe" value="{}">
+            <br><br>
+
+            <button type="submit">💾 Сохранить ПИД</button>
+        </form>
+    </div>
+""")
+
+RELAY_HEAD = '<h2>🔌 Ручное управление реле</h2>'.encode()
+_RELAY = _template("""
+    <div class="relay">
+        <strong>Реле {}</strong>
+        <form action="/relay" method="POST" style="display:inline;">
+            <input type="hidden" name="relay" value="{}">
+            <input type="hidden" name="action" value="on">
+            <button type="submit">🟢 ВКЛ</button>
+        </form>
+        <form action="/relay" method="POST" style="display:inline;">
+            <input type="hidden" name="relay" value="{}">
+            <input type="hidden" name="action" value="off">
+            <button type="submit" class="off">🔴 ВЫКЛ</button>
+        </form>
+    </div>
+""")
+TAIL = b"</body></html>"
+
+# (ключ, значение по умолчанию) полей ПИД в порядке шаблона
+_PID_FIELDS = (
+    ("o2_setpoint", 3.5), ("deadband", 0.1),
+    ("Kp", 0.1), ("Ki", 0.005), ("Kd", 0.0), ("d_filter", 2.0),
+    ("max_correction", 0.8), ("control_interval", 5),
+    ("pressure_interval", 2.0), ("pressure_deadband", 0.1), ("full_stroke", 30.0), ("pulse_gain", 1.0),
+    ("min_pulse", 0.2), ("max_pulse", 5.0), ("backlash", 0.0), ("pressure_settle", 1.0),
+    ("pressure_min_safe", 0.5), ("pressure_max_safe", 9.0),
+)
+
+def page_parts(voltages, cfg):
+    """Куски страницы по порядку: байтовые константы и строки со значениями."""
+    yield HEAD
+
+    # === Каналы датчиков (по карте каналов) ===
+    cal = compiled(cfg)
+    for i, key in enumerate(cal.keys):
+        c = cfg.get(key) or IDENTITY
+        v = voltages[i] if i < len(voltages) else 0.0
+        if v is None:  # микросхема канала не отвечает
+            volts = value = "—"
+        else:
+            volts, value = "{:+.4f}".format(v), "{:.2f}".format(cal.value(i, v))
+        name, unit = c["name"] or key, c["unit"]
+        yield from _fill(_CHANNEL, (
+            name, volts, value, unit,
+            key, name, str(c["v_min"]), str(c["v_max"]), str(c["y_min"]), str(c["y_max"]), unit))
+
+    # === Таблицы и ПИД контуров (секция, общая для нескольких контуров, — один раз) ===
+    loops = cfg.get("loops", ())
+    tables, pids = [], []
+    for loop in loops:
+        title = " — " + loop["name"] if len(loops) > 1 else ""
+        section = loop["table"]
+        if section not in tables:
+            tables.append(section)
+            yield from _table_parts(cfg.get(section, []), title, section)
+        section = loop["pid"]
+        if section not in pids:
+            pids.append(section)
+            pid = cfg.get(section, {})
+            values = [title, section, "checked" if pid.get("enabled", True) else ""]
+            for key, default in _PID_FIELDS:
+                values.append(str(pid.get(key, default)))
+            yield from _fill(_PID, values)
+
+    # === Ручное управление реле ===
+    yield RELAY_HEAD
+    for ch in range(1, 5):
+        n = str(ch)
+        yield from _fill(_RELAY, (n, n, n))
+    yield TAIL
+
+def _table_parts(table, title, section):
+    """Таблица газ/воздух (ровно 5 точек)."""
+    yield from _fill(_TABLE_HEAD, (title, section))
+    for i in range(5):
+        if i < len(table):
+            gas, air = str(table[i]["gas"]), str(table[i]["air_target"])
+        else:
+            gas = air = "0.0"
+        idx = str(i)
+        yield from _fill(_TABLE_ROW, (idx, gas, idx, air))
+    yield TABLE_TAIL
+
+_buf = bytearray(CHUNK_SIZE)
+
+def render_chunks(parts, buf=_buf):
+    """
+    Собирает куски в буфер buf и отдаёт memoryview на заполненную часть.
+    Буфер переиспользуется: кусок нужно отправить до запроса следующего.
+    Константы больше буфера отдаются как есть, без копирования.
+    """
+    mv = memoryview(buf)
+    size = len(buf)
+    n = 0
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        ln = len(part)
+        if ln > size - n:
+            if n:
+                yield mv[:n]
+                n = 0
+            if ln > size:
+                yield part
+                continue
+        buf[n:n + ln] = part
+        n += ln
+    if n:
+        yield mv[:n]
+
+def render_page(voltages, cfg):
+    return render_chunks(page_parts(voltages, cfg))
@@ -1,264 +1,605 @@
-# webserver.py
-import socket
-from ads1115 import read_all_channels
-from modbus_relay import set_relay
-from config_manager import load_config, save_config
-from url_decode import url_decode
-
-def voltage_to_value(v, ch_cfg):
-    vmin = ch_cfg["v_min"]
-    vmax = ch_cfg["v_max"]
-    ymin = ch_cfg["y_min"]
-    ymax = ch_cfg["y_max"]
-    if vmax == vmin:
-        return ymin
-    return (ymax - ymin) / (vmax - vmin) * (v - vmin) + ymin
-
-def parse_post_data(data):
-    try:
-        if b'\r\n\r\n' in data:
-            body = data.split(b'\r\n\r\n', 1)[1]
-            body_str = body.decode('utf-8')
-            params = {}
-            for pair in body_str.split('&'):
-                if '=' in pair:
-                    k, v = pair.split('=', 1)
-                    k = url_decode(k)
-                    v = url_decode(v)
-                    params[k] = v
-            return params
-    except Exception as e:
-        print("POST parse error:", e)
-    return {}
-
-def handle_relay_request(params):
-    try:
-        ch = int(params.get("relay", "0"))
-        action = params.get("action", "")
-        if 1 <= ch <= 4 and action in ("on", "off"):
-            set_relay(ch, action == "on")
-    except Exception as e:
-        print("Relay error:", e)
-
-def build_web_page(voltages, cfg):
-    html = """<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>ADS1115 + Регулятор</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <style>
-        body { font-family: Arial, sans-serif; margin: 10px; background: #f9f9f9; }
-        h1, h2 { color: #2c3e50; }
-        .channel, .relay, .table, .pid { background: white; padding: 14px; margin: 12px 0; border-radius: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.1); }
-        input, button, select { padding: 6px; margin: 4px; }
-        .num { width: 70px; }
-        .unit { width: 50px; }
-        .name { width: 120px; }
-        button { background: #27ae60; color: white; border: none; border-radius: 4px; cursor: pointer; }
-        button.off { background: #e74c3c; }
-        .result { font-weight: bold; color: #e74c3c; font-size: 1.2em; }
-        table { width: 100%; border-collapse: collapse; margin: 8px 0; }
-        th, td { border: 1px solid #ccc; padding: 6px; text-align: center; }
-        th { background: #f0f0f0; }
-    </style>
-</head>
-<body>
-    <h1>🎛️ Калибровка и управление</h1>
-"""
-    # === Каналы датчиков ===
-    for i, (v, key) in enumerate(zip(voltages, ["ch0", "ch1", "ch2", "ch3"])):
-        c = cfg[key]
-        value = voltage_to_value(v, c)
-        html += f"""
-    <div class="channel">
-        <strong>{c['name']}</strong><br>
-        Напряжение: <code>{v:+.4f} В</code> → <span class="result">{value:.2f} {c['unit']}</span><br>
-        <form action="/" method="POST">
-            <input type="hidden" name="ch" value="{key}">
-            Название: <input type="text" name="name" class="name" value="{c['name']}">
-            Напряжение: 
-            <input type="number" step="any" class="num" name="v_min" value="{c['v_min']}"> – 
-            <input type="number" step="any" class="num" name="v_max" value="{c['v_max']}"> В<br>
-            Значение: 
-            <input type="number" step="any" class="num" name="y_min" value="{c['y_min']}"> – 
-            <input type="number" step="any" class="num" name="y_max" value="{c['y_max']}">
-            <input type="text" name="unit" class="unit" value="{c['unit']}">
-            <button type="submit">💾 Сохранить</button>
-        </form>
-    </div>
-"""
-
-    # === Таблица газ/воздух ===
-    table = cfg.get("air_fuel_table", [])
-    # Убедимся, что 5 точек
-    while len(table) < 5:
-        table.append({"gas": 0.0, "air_target": 0.0})
-    if len(table) > 5:
-        table = table[:5]
-
-    html += '<h2>📊 Базовое соотношение газ/воздух</h2>\n<div class="table">\n'
-    html += '<form action="/table" method="POST">\n'
-    html += '<table>\n<tr><th>Расход газа (м³/ч)</th><th>Целевое давление (кПа)</th></tr>\n'
-    for i, point in enumerate(table):
-        html += f'<tr><td><input type="number" step="0.1" class="num" name="gas_{i}" value="{point["gas"]}"</td>'
-        html += f'<td><input type="number" step="0.1" class="num" name="air_{i}" value="{point["air_target"]}"</td></tr>\n'
-    html += '</table>\n<button type="submit">💾 Сохранить таблицу</button>\n</form>\n</div>'
-
-    # === ПИД-регулятор ===
-    pid = cfg.get("pid_control", {})
-    enabled = "checked" if pid.get("enabled", True) else ""
-    html += f'''
-    <h2>⚙️ ПИД-коррекция по O₂</h2>
-    <div class="pid">
-        <form action="/pid" method="POST">
-            <label><input type="checkbox" name="enabled" value="on" {enabled}> Включить ПИД</label><br><br>
-
-            Уставка O₂ (%): 
-            <input type="number" step="0.1" class="num" name="o2_setpoint" value="{pid.get("o2_setpoint", 3.5)}"> ±
-            <input type="number" step="0.1" class="num" name="deadband" value="{pid.get("deadband", 0.1)}"> %
-            <br><br>
-
-            ПИД-коэффициенты:<br>
-            Kp: <input type="number" step="0.01" class="num" name="Kp" value="{pid.get("Kp", 0.8)}">
-            Ki: <input type="number" step="0.001" class="num" name="Ki" value="{pid.get("Ki", 0.02)}">
-            Kd: <input type="number" step="0.01" class="num" name="Kd" value="{pid.get("Kd", 0.1)}">
-            <br><br>
-
-            Макс. коррекция (кПа): 
-            <input type="number" step="0.1" class="num" name="max_correction" value="{pid.get("max_correction", 0.8)}"><br>
-            Интервал (сек): 
-            <input type="number" step="1" class="num" name="control_interval" value="{pid.get("control_interval", 10)}">
-            Импульс (сек): 
-            <input type="number" step="0.1" class="num" name="impulse_duration" value="{pid.get("impulse_duration", 1.5)}">
-            <br><br>
-
-            Безопасные пределы давления:<br>
-            <input type="number" step="0.1" class="num" name="pressure_min_safe" value="{pid.get("pressure_min_safe", 0.5)}"> — 
-            <input type="number" step="0.1" class="num" name="pressure_max_safe" value="{pid.get("pressure_max_safe", 9.0)}">
-            <br><br>
-
-            <button type="submit">💾 Сохранить ПИД</button>
-        </form>
-    </div>
-'''
-
-    # === Ручное управление реле ===
-    html += '<h2>🔌 Ручное управление реле</h2>'
-    for ch in range(1, 5):
-        html += f'''
-    <div class="relay">
-        <strong>Реле {ch}</strong>
-        <form action="/relay" method="POST" style="display:inline;">
-            <input type="hidden" name="relay" value="{ch}">
-            <input type="hidden" name="action" value="on">
-            <button type="submit">🟢 ВКЛ</button>
-        </form>
-        <form action="/relay" method="POST" style="display:inline;">
-            <input type="hidden" name="relay" value="{ch}">
-            <input type="hidden" name="action" value="off">
-            <button type="submit" class="off">🔴 ВЫКЛ</button>
-        </form>
-    </div>
-'''
-    html += "</body></html>"
-    return html
-
-# === Вспомогательные функции парсинга ===
-def safe_float(s, default):
-    try:
-        return float(s.strip().replace(',', '.')) if s and s.strip() else default
-    except:
-        return default
-
-def safe_int(s, default):
-    try:
-        return int(float(s.strip())) if s and s.strip() else default
-    except:
-        return default
-
-# === Обработка POST-запросов ===
-def handle_request(conn):
-    try:
-        request = conn.recv(1024)
-        cfg = load_config()
-
-        # === Обработка реле ===
-        if b"POST /relay" in request:
-            params = parse_post_data(request)
-            handle_relay_request(params)
-            conn.send(b"HTTP/1.1 303 See Other\r\nLocation: /\r\n\r\n")
-
-        # === Обработка таблицы газ/воздух ===
-        elif b"POST /table" in request:
-            params = parse_post_data(request)
-            table = []
-            for i in range(5):
-                gas = safe_float(params.get(f"gas_{i}"), 0.0)
-                air = safe_float(params.get(f"air_{i}"), 0.0)
-                table.append({"gas": gas, "air_target": air})
-            cfg["air_fuel_table"] = table
-            save_config(cfg)
-            conn.send(b"HTTP/1.1 303 See Other\r\nLocation: /\r\n\r\n")
-
-        # === Обработка ПИД ===
-        elif b"POST /pid" in request:
-            params = parse_post_data(request)
-            pid = cfg.get("pid_control", {})
-
-            pid["enabled"] = params.get("enabled") == "on"
-            pid["o2_setpoint"] = safe_float(params.get("o2_setpoint"), pid.get("o2_setpoint", 3.5))
-            pid["deadband"] = safe_float(params.get("deadband"), pid.get("deadband", 0.1))
-            pid["Kp"] = safe_float(params.get("Kp"), pid.get("Kp", 0.8))
-            pid["Ki"] = safe_float(params.get("Ki"), pid.get("Ki", 0.02))
-            pid["Kd"] = safe_float(params.get("Kd"), pid.get("Kd", 0.1))
-            pid["max_correction"] = safe_float(params.get("max_correction"), pid.get("max_correction", 0.8))
-            pid["control_interval"] = safe_int(params.get("control_interval"), pid.get("control_interval", 10))
-            pid["impulse_duration"] = safe_float(params.get("impulse_duration"), pid.get("impulse_duration", 1.5))
-            pid["pressure_min_safe"] = safe_float(params.get("pressure_min_safe"), pid.get("pressure_min_safe", 0.5))
-            pid["pressure_max_safe"] = safe_float(params.get("pressure_max_safe"), pid.get("pressure_max_safe", 9.0))
-
-            cfg["pid_control"] = pid
-            save_config(cfg)
-            conn.send(b"HTTP/1.1 303 See Other\r\nLocation: /\r\n\r\n")
-
-        # === Обработка калибровки датчиков ===
-        elif b"POST" in request:
-            params = parse_post_data(request)
-            ch = params.get("ch")
-            if ch in cfg and ch.startswith("ch"):
-                old = cfg[ch].copy()
-                try:
-                    name = params.get("name", old["name"]).strip()
-                    cfg[ch]["name"] = name if name else old["name"]
-
-                    cfg[ch]["v_min"] = safe_float(params.get("v_min"), old["v_min"])
-                    cfg[ch]["v_max"] = safe_float(params.get("v_max"), old["v_max"])
-                    cfg[ch]["y_min"] = safe_float(params.get("y_min"), old["y_min"])
-                    cfg[ch]["y_max"] = safe_float(params.get("y_max"), old["y_max"])
-
-                    unit = params.get("unit", old["unit"]).strip()
-                    cfg[ch]["unit"] = unit if unit else "ед."
-
-                    if cfg[ch]["v_min"] >= cfg[ch]["v_max"]:
-                        cfg[ch]["v_max"] = cfg[ch]["v_min"] + 0.001
-
-                    save_config(cfg)
-                except Exception as e:
-                    print("Calibration error:", e)
-                    cfg[ch] = old
-            conn.send(b"HTTP/1.1 303 See Other\r\nLocation: /\r\n\r\n")
-
-        # === GET-запрос — главная страница ===
-        else:
-            voltages = read_all_channels()
-            html = build_web_page(voltages, cfg)
-            response = "HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n" + html
-            conn.send(response.encode())
-    except Exception as e:
-        print("Request error:", e)
-    finally:
-        try:
-            conn.close()
-        except:
-            pass
\ No newline at end of file
+# webserver.py
+import json
+import os
+import ticks
+from ads1115 import read_all_channels, latest
+from calibration import compiled, check_map, limits, IDENTITY
+import air_pressure_controller
+from modbus_relay import relay
+from config_manager import load_config, save_config, DEFAULT_CONFIG
+from http_parser import RequestParser, HttpError, parse_query
+from webpage import render_page
+import filters
+import autotune
+import history
+import instrument
+from datalog import log as datalog
+
+def parse_post_data(body):
+    """Поля формы application/x-www-form-urlencoded из тела запроса."""
+    try:
+        return parse_query(body)
+    except Exception as e:
+        print("POST parse error:", e)
+    return {}
+
+def handle_relay_request(params):
+    try:
+        ch = int(params.get("relay", "0"))
+        action = params.get("action", "")
+        if 1 <= ch <= 4 and action in ("on", "off"):
+            relay.set(ch, action == "on")  # отправит задача relay, без ожидания
+    except Exception as e:
+        print("Relay error:", e)
+
+# === Вспомогательные функции парсинга ===
+def safe_float(s, default):
+    try:
+        return float(s.strip().replace(',', '.')) if s and s.strip() else default
+    except:
+        return default
+
+def safe_int(s, default):
+    try:
+        return int(float(s.strip())) if s and s.strip() else default
+    except:
+        return default
+
+try:
+    from binascii import crc32
+except ImportError:
+    crc32 = None
+
+REDIRECT = (b"HTTP/1.1 303 See Other\r\nLocation: /form\r\nContent-Length: 0\r\n\r\n",)
+# Длина страницы заранее неизвестна — chunked, чтобы соединение оставалось открытым
+HTML_HEADER = b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nTransfer-Encoding: chunked\r\n\r\n"
+CSV_HEADER = (b"HTTP/1.1 200 OK\r\nContent-Type: text/csv\r\nTransfer-Encoding: chunked\r\n"
+              b"Content-Disposition: attachment; filename=\"log.csv\"\r\n\r\n")
+ERROR_HEADER = b"HTTP/1.1 %d %s\r\nContent-Type: text/plain\r\nContent-Length: %d\r\n%s\r\n"
+NOT_MODIFIED = b"HTTP/1.1 304 Not Modified\r\nETag: %s\r\nCache-Control: no-cache\r\n\r\n"
+STATIC_HEADER = (b"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n"
+                 b"Content-Encoding: gzip\r\nContent-Length: %d\r\n"
+                 b"ETag: %s\r\nCache-Control: no-cache\r\n\r\n")
+JSON_HEADER = (b"HTTP/1.1 %s\r\nContent-Type: application/json\r\n"
+               b"Content-Length: %d\r\nCache-Control: no-store\r\n\r\n")
+METRICS_HEADER = (b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                  b"Content-Length: %d\r\nCache-Control: no-store\r\n\r\n")
+BINARY_HEADER = (b"HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\n"
+                 b"Content-Length: %d\r\nCache-Control: no-store\r\n\r\n")
+
+# Статический интерфейс: заранее сжатый файл на flash (см. tools/build_www.py)
+STATIC_INDEX = "www/index.html.gz"
+
+_file_buf = bytearray(1024)
+_file_mv = memoryview(_file_buf)
+_etags = {}
+
+# === Статические файлы ===
+def _file_etag(path):
+    """ETag по CRC содержимого; считается один раз на файл."""
+    etag = _etags.get(path)
+    if etag is None:
+        if crc32 is not None:
+            crc = 0
+            with open(path, "rb") as f:
+                while True:
+                    n = f.readinto(_file_buf)
+                    if not n:
+                        break
+                    crc = crc32(_file_mv[:n], crc)
+        else:
+            crc = os.stat(path)[6]
+        etag = b'"%08x"' % (crc & 0xFFFFFFFF)
+        _etags[path] = etag
+    return etag
+
+def _file_chunks(path, header):
+    yield header
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(_file_buf)
+            if not n:
+                break
+            yield _file_mv[:n]
+
+def static_response(path, req):
+    etag = _file_etag(path)
+    if etag in req.header(b"if-none-match"):
+        return (NOT_MODIFIED % etag,)
+    return _file_chunks(path, STATIC_HEADER % (os.stat(path)[6], etag))
+
+# === JSON API ===
+def json_response(obj, status=b"200 OK"):
+    body = json.dumps(obj, separators=(",", ":")).encode()
+    return (JSON_HEADER % (status, len(body)), body)
+
+def _round(x, nd=3):
+    return round(x, nd) if isinstance(x, float) else x
+
+def api_sample():
+    """Последний отсчёт АЦП и физические значения."""
+    voltages, filtered, stamp, seq = latest()
+    cal = compiled()
+    return {
+        "seq": seq,
+        "t": stamp,
+        "raw": [_round(v, 4) for v in voltages],
+        "filtered": [_round(v, 4) for v in filtered],
+        "values": {k: _round(v) for k, v in cal.values(filtered).items()},
+        "raw_values": {k: _round(v) for k, v in cal.values(voltages).items()},
+    }
+
+def api_values():
+    """Отсчёт и последние решения регулятора (control — первого контура, loops — всех)."""
+    data = api_sample()
+    data["control"] = air_pressure_controller.last_result
+    data["loops"] = air_pressure_controller.results
+    return data
+
+# Допустимые поля /api/config и их типы
+_CH_FIELDS = {"name": str, "unit": str, "v_min": float, "v_max": float, "y_min": float, "y_max": float}
+_PID_TYPES = {
+    "enabled": bool, "o2_setpoint": float, "deadband": float,
+    "Kp": float, "Ki": float, "Kd": float, "d_filter": float, "max_correction": float,
+    "control_interval": int, "pressure_interval": float, "pressure_deadband": float,
+    "full_stroke": float, "pulse_gain": float, "min_pulse": float, "max_pulse": float,
+    "backlash": float, "pressure_settle": float,
+    "pressure_min_safe": float, "pressure_max_safe": float,
+}
+
+_MODBUS_TYPES = {"tcp": bool, "port": int, "unit": int, "rtu": bool, "uart": int,
+                 "baudrate": int, "tx": int, "rx": int}
+
+def _check_modbus(section, cfg):
+    """Поля секции "modbus"; масштабы — по итоговой карте и калибровке cfg."""
+    if not 1 <= section["port"] <= 65535:
+        raise ValueError("modbus.port: expected 1..65535")
+    if not 1 <= section["unit"] <= 247:
+        raise ValueError("modbus.unit: expected 1..247")
+    if section["uart"] == 1:
+        raise ValueError("modbus.uart: UART 1 is used by the relay board")
+    if section["baudrate"] <= 0:
+        raise ValueError("modbus.baudrate: expected positive number")
+    scale = section["scale"]
+    if not isinstance(scale, dict):
+        raise ValueError("modbus.scale: expected object")
+    limit = limits(cfg)
+    for key, value in scale.items():
+        if key not in limit:
+            raise ValueError("modbus.scale." + key + ": unknown quantity")
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+            raise ValueError("modbus.scale." + key + ": expected positive number")
+        # Весь диапазон величины должен помещаться в знаковый 16-битный регистр
+        if limit[key] * value > 32767:
+            raise ValueError("modbus.scale." + key + ": range ±%g overflows int16, max scale %g"
+                             % (limit[key], 32767 / limit[key]))
+
+def _typed(value, kind, key):
+    if kind is bool:
+        if not isinstance(value, bool):
+            raise ValueError(key + ": expected bool")
+        return value
+    if kind is str:
+        if not isinstance(value, str):
+            raise ValueError(key + ": expected string")
+        return value.strip()
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(key + ": expected number")
+    return kind(value)
+
+# Секции карты каналов и контуров: проверяются целиком по итоговой конфигурации
+_MAP_SECTIONS = ("channels", "derived", "loops")
+
+def _refs(items, field):
+    """Имена секций, на которые ссылаются записи карты (channels.key, loops.pid, ...)."""
+    if not isinstance(items, list):
+        return []
+    return [item.get(field) for item in items if isinstance(item, dict)]
+
+def _new_channel(key):
+    ch = dict(IDENTITY)
+    ch["name"] = key
+    return ch
+
+def _new_table():
+    return [dict(point) for point in DEFAULT_CONFIG["air_fuel_table"]]
+
+def apply_config_patch(cfg, patch):
+    """
+    Проверяет частичную конфигурацию и применяет её к cfg.
+    При любой ошибке cfg не меняется (ValueError). Секции калибровки,
+    ПИД и таблиц, на которые ссылается новая карта, создаются по умолчанию.
+    """
+    if not isinstance(patch, dict):
+        raise ValueError("expected object")
+    ch_keys = _refs(patch.get("channels", cfg.get("channels")), "key")
+    specs = patch.get("loops", cfg.get("loops"))
+    pid_keys = ["pid_control"] + _refs(specs, "pid")
+    table_keys = ["air_fuel_table"] + _refs(specs, "table")
+    updates = {}
+    for key, value in patch.items():
+        if key in _MAP_SECTIONS:
+            updates[key] = value  # проверка — ниже, по итоговой конфигурации
+        elif key in ch_keys or (key.startswith("ch") and isinstance(cfg.get(key), dict)):
+            if not isinstance(value, dict):
+                raise ValueError(key + ": expected object")
+            old = cfg.get(key) or _new_channel(key)
+            ch = dict(old)
+            for f, v in value.items():
+                if f == "filter":
+                    ch[f] = filters.check_spec(v)
+                    continue
+                if f not in _CH_FIELDS:
+                    raise ValueError(key + "." + f + ": unknown field")
+                ch[f] = _typed(v, _CH_FIELDS[f], f)
+            if not ch["name"]:
+                ch["name"] = old["name"]
+            if not ch["unit"]:
+                ch["unit"] = "ед."
+            if ch["v_min"] >= ch["v_max"]:
+                ch["v_max"] = ch["v_min"] + 0.001
+            updates[key] = ch
+        elif key in table_keys:
+            if not isinstance(value, list) or not value:
+                raise ValueError(key + ": expected non-empty list")
+            table = []
+            for point in value:
+                if not isinstance(point, dict):
+                    raise ValueError(key + ": expected objects")
+                table.append({"gas": _typed(point.get("gas"), float, "gas"),
+                              "air_target": _typed(point.get("air_target"), float, "air_target")})
+            updates[key] = table
+        elif key == "modbus":
+            if not isinstance(value, dict):
+                raise ValueError(key + ": expected object")
+            section = dict(cfg.get(key) or DEFAULT_CONFIG[key])
+            for f, v in value.items():
+                if f == "scale":
+                    section[f] = v
+                    continue
+                if f not in _MODBUS_TYPES:
+                    raise ValueError(key + "." + f + ": unknown field")
+                section[f] = _typed(v, _MODBUS_TYPES[f], f)
+            updates[key] = section  # масштабы — ниже, по итоговой карте
+        elif key in pid_keys:
+            if not isinstance(value, dict):
+                raise ValueError(key + ": expected object")
+            pid = dict(cfg.get(key) or DEFAULT_CONFIG["pid_control"])
+            for f, v in value.items():
+                if f not in _PID_TYPES:
+                    raise ValueError(key + "." + f + ": unknown field")
+                pid[f] = _typed(v, _PID_TYPES[f], f)
+            updates[key] = pid
+        else:
+            raise ValueError(key + ": unknown section")
+    if any(key in updates for key in _MAP_SECTIONS):
+        merged = dict(cfg)
+        merged.update(updates)
+        for keys, make in ((ch_keys, _new_channel), (pid_keys, lambda key: dict(DEFAULT_CONFIG["pid_control"])),
+                           (table_keys, lambda key: _new_table())):
+            for key in keys:
+                if isinstance(key, str) and key and key not in merged:
+                    updates[key] = merged[key] = make(key)
+        quantities = check_map(merged)
+        air_pressure_controller.check_loops(merged, quantities)
+    if "modbus" in updates or (updates and "modbus" in cfg):
+        # Масштабы Modbus зависят и от карты, и от диапазонов калибровки каналов
+        merged = dict(cfg)
+        merged.update(updates)
+        _check_modbus(merged["modbus"], merged)
+    for key, value in updates.items():
+        cfg[key] = value
+
+def _json_body(req):
+    try:
+        return json.loads(req.body)
+    except ValueError:
+        raise ValueError("invalid JSON")
+
+def get_api_values(req):
+    return json_response(api_values())
+
+def _int_param(params, key, default):
+    value = params.get(key, "")
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(key + ": expected integer")
+
+def _finite(arr, nd=3):
+    return [round(v, nd) if v == v else None for v in arr]
+
+def get_api_history(req):
+    """
+    /api/history?from=&to=&points=&format=bin — тренд с прореживанием min/max.
+    from/to — мс от запуска контроллера, отрицательные — относительно последней записи.
+    """
+    params = req.params()
+    trend = history.trend
+    t, cols = trend.query(_int_param(params, "from", None), _int_param(params, "to", None),
+                          _int_param(params, "points", history.MAX_POINTS))
+    if params.get("format") == "bin":
+        body = trend.pack(t, cols)
+        return (BINARY_HEADER % len(body), body)
+    data = {"period_ms": history.PERIOD_MS, "now": trend.uptime, "t": list(t), "columns": list(trend.columns)}
+    for name, (mins, maxs) in cols.items():
+        data[name] = {"min": _finite(mins), "max": _finite(maxs)}
+    return json_response(data)
+
+def _chunked(header, chunks):
+    yield header
+    for chunk in chunks:
+        yield b"%x\r\n" % len(chunk)
+        yield chunk
+        yield b"\r\n"
+    yield b"0\r\n\r\n"
+
+def get_api_log_csv(req):
+    """Журнал с flash в CSV: сегменты читаются и преобразуются по кускам."""
+    return _chunked(CSV_HEADER, datalog.csv_chunks())
+
+def get_metrics(req):
+    """/metrics — формат Prometheus, /metrics?format=json — JSON."""
+    if req.params().get("format") == "json":
+        return json_response(instrument.snapshot())
+    body = instrument.prometheus().encode()
+    return (METRICS_HEADER % len(body), body)
+
+def get_api_config(req):
+    return json_response(load_config())
+
+def post_api_config(req):
+    cfg = load_config()
+    apply_config_patch(cfg, _json_body(req))
+    save_config(cfg)
+    return json_response(cfg)
+
+def post_api_relay(req):
+    cmd = _json_body(req)
+    ch = cmd.get("relay") if isinstance(cmd, dict) else None
+    if not isinstance(ch, int) or not relay.set(ch, bool(cmd.get("state"))):
+        raise ValueError("relay: expected channel 1..4")
+    return json_response({"relay": ch, "state": bool(cmd.get("state"))})
+
+# Параметры запуска автонастройки: имя → тип
+_AUTOTUNE_TYPES = {"amplitude": float, "hysteresis": float, "cycles": int, "rule": str,
+                   "apply": bool, "max_deviation": float, "timeout_s": float}
+
+def get_api_autotune(req):
+    return json_response(autotune.tuner.status())
+
+def post_api_autotune(req):
+    """{"action": "start", ...параметры} | {"action": "stop"} | {"action": "apply"}"""
+    cmd = _json_body(req)
+    if not isinstance(cmd, dict):
+        raise ValueError("expected object")
+    action = cmd.get("action")
+    tuner = autotune.tuner
+    if action == "start":
+        kwargs = {}
+        name = cmd.get("loop")
+        for key, value in cmd.items():
+            if key == "action" or key == "loop":
+                continue
+            if key not in _AUTOTUNE_TYPES:
+                raise ValueError(key + ": unknown field")
+            kwargs[key] = _typed(value, _AUTOTUNE_TYPES[key], key)
+        loop = air_pressure_controller.loop(name)
+        if loop is None:
+            raise ValueError("loop: unknown loop")
+        # Релейный опыт начинается от текущей поправки ПИД контура
+        tuner.start(load_config().get(loop.section, {}), loop.pid.output,
+                    loop=loop.name, section=loop.section, **kwargs)
+    elif action == "stop":
+        tuner.abort("stopped by user")
+    elif action == "apply":
+        tuner.apply_gains()
+    else:
+        raise ValueError("action: expected start, stop or apply")
+    return json_response(tuner.status())
+
+# === Страница с формами (без JavaScript) ===
+def post_relay(req):
+    handle_relay_request(parse_post_data(req.body))
+    return REDIRECT
+
+def _loop_section(cfg, params, field, default):
+    """Секция ПИД или таблицы из скрытого поля формы — только из секции "loops"."""
+    section = params.get("section") or default
+    if section != default and section not in _refs(cfg.get("loops"), field):
+        raise ValueError("section: unknown " + field + " section")
+    return section
+
+def post_table(req):
+    cfg = load_config()
+    params = parse_post_data(req.body)
+    section = _loop_section(cfg, params, "table", "air_fuel_table")
+    table = []
+    for i in range(5):
+        gas = safe_float(params.get(f"gas_{i}"), 0.0)
+        air = safe_float(params.get(f"air_{i}"), 0.0)
+        table.append({"gas": gas, "air_target": air})
+    cfg[section] = table
+    save_config(cfg)
+    return REDIRECT
+
+def post_pid(req):
+    cfg = load_config()
+    params = parse_post_data(req.body)
+    section = _loop_section(cfg, params, "pid", "pid_control")
+    pid = cfg.get(section, {})
+
+    pid["enabled"] = params.get("enabled") == "on"
+    pid["o2_setpoint"] = safe_float(params.get("o2_setpoint"), pid.get("o2_setpoint", 3.5))
+    pid["deadband"] = safe_float(params.get("deadband"), pid.get("deadband", 0.1))
+    pid["Kp"] = safe_float(params.get("Kp"), pid.get("Kp", 0.1))
+    pid["Ki"] = safe_float(params.get("Ki"), pid.get("Ki", 0.005))
+    pid["Kd"] = safe_float(params.get("Kd"), pid.get("Kd", 0.0))
+    pid["d_filter"] = safe_float(params.get("d_filter"), pid.get("d_filter", 2.0))
+    pid["max_correction"] = safe_float(params.get("max_correction"), pid.get("max_correction", 0.8))
+    pid["control_interval"] = safe_int(params.get("control_interval"), pid.get("control_interval", 5))
+    for key, default in (("pressure_interval", 2.0), ("pressure_deadband", 0.1), ("full_stroke", 30.0),
+                         ("pulse_gain", 1.0), ("min_pulse", 0.2), ("max_pulse", 5.0),
+                         ("backlash", 0.0), ("pressure_settle", 1.0)):
+        pid[key] = safe_float(params.get(key), pid.get(key, default))
+    pid["pressure_min_safe"] = safe_float(params.get("pressure_min_safe"), pid.get("pressure_min_safe", 0.5))
+    pid["pressure_max_safe"] = safe_float(params.get("pressure_max_safe"), pid.get("pressure_max_safe", 9.0))
+
+    cfg[section] = pid
+    save_config(cfg)
+    return REDIRECT
+
+def post_calibration(req):
+    cfg = load_config()
+    params = parse_post_data(req.body)
+    ch = params.get("ch")
+    if ch in compiled(cfg).keys and ch not in cfg:
+        cfg[ch] = _new_channel(ch)  # канал карты без своей секции калибровки
+    if ch in cfg and (ch.startswith("ch") or ch in compiled(cfg).keys):
+        old = cfg[ch].copy()
+        try:
+            name = params.get("name", old["name"]).strip()
+            cfg[ch]["name"] = name if name else old["name"]
+
+            cfg[ch]["v_min"] = safe_float(params.get("v_min"), old["v_min"])
+            cfg[ch]["v_max"] = safe_float(params.get("v_max"), old["v_max"])
+            cfg[ch]["y_min"] = safe_float(params.get("y_min"), old["y_min"])
+            cfg[ch]["y_max"] = safe_float(params.get("y_max"), old["y_max"])
+
+            unit = params.get("unit", old["unit"]).strip()
+            cfg[ch]["unit"] = unit if unit else "ед."
+
+            if cfg[ch]["v_min"] >= cfg[ch]["v_max"]:
+                cfg[ch]["v_max"] = cfg[ch]["v_min"] + 0.001
+
+            save_config(cfg)
+        except Exception as e:
+            print("Calibration error:", e)
+            cfg[ch] = old
+    return REDIRECT
+
+def get_form(req):
+    return _page_response(read_all_channels() or (), load_config())
+
+def get_index(req):
+    try:
+        return static_response(STATIC_INDEX, req)
+    except OSError:
+        # www/ не загружен на устройство — отдаём страницу с формами
+        return get_form(req)
+
+# === Маршруты: (метод, путь) → обработчик(req) → куски ответа ===
+ROUTES = {
+    (b"GET", b"/"): get_index,
+    (b"GET", b"/form"): get_form,
+    (b"POST", b"/"): post_calibration,
+    (b"POST", b"/relay"): post_relay,
+    (b"POST", b"/table"): post_table,
+    (b"POST", b"/pid"): post_pid,
+    (b"GET", b"/api/values"): get_api_values,
+    (b"GET", b"/api/config"): get_api_config,
+    (b"GET", b"/api/history"): get_api_history,
+    (b"GET", b"/api/log.csv"): get_api_log_csv,
+    (b"GET", b"/metrics"): get_metrics,
+    (b"POST", b"/api/config"): post_api_config,
+    (b"POST", b"/api/relay"): post_api_relay,
+    (b"GET", b"/api/autotune"): get_api_autotune,
+    (b"POST", b"/api/autotune"): post_api_autotune,
+}
+
+def add_route(method, path, handler):
+    ROUTES[(method, path)] = handler
+
+def route_label(req):
+    """Метка маршрута для измерений: неизвестные пути — одной меткой, без роста словаря."""
+    key = (req.method, req.path)
+    if key in ROUTES:
+        return "http " + req.method.decode() + " " + req.path.decode()
+    return "http unmatched"
+
+def error_response(status, reason, close=False):
+    body = reason.encode()
+    return (ERROR_HEADER % (status, body, len(body), b"Connection: close\r\n" if close else b""), body)
+
+def dispatch(req):
+    """
+    Находит обработчик по точному методу и пути и возвращает ответ —
+    последовательность кусков bytes/memoryview для отправки по порядку.
+    Не зависит от транспорта.
+    """
+    handler = ROUTES.get((req.method, req.path))
+    if handler is None:
+        for method, path in ROUTES:
+            if path == req.path:
+                instrument.count("http_405")
+                return error_response(405, "Method Not Allowed")
+        instrument.count("http_404")
+        return error_response(404, "Not Found")
+    try:
+        return handler(req)
+    except ValueError as e:
+        instrument.count("http_400")
+        if req.path.startswith(b"/api/"):
+            return json_response({"error": str(e)}, b"400 Bad Request")
+        return error_response(400, "Bad Request")
+
+def _page_response(voltages, cfg):
+    return _chunked(HTML_HEADER, render_page(voltages, cfg))
+
+def send_all(conn, data):
+    """conn.send() может отправить только часть данных — досылаем остаток."""
+    mv = memoryview(data)
+    sent = 0
+    while sent < len(mv):
+        try:
+            n = conn.send(mv[sent:])
+        except OSError as e:
+            if e.args[0] != 11:  # EAGAIN — буфер lwIP заполнен
+                raise
+            n = 0
+        if not n:
+            ticks.sleep_ms(1)
+            continue
+        sent += n
+
+_parser = RequestParser()
+
+def handle_request(conn):
+    """Один запрос на соединение (без планировщика): приём в буфер разборщика через recv_into."""
+    parser = _parser
+    parser.reset()
+    req = None
+    try:
+        while True:
+            try:
+                req = parser.next_request()
+            except HttpError as e:
+                instrument.count("http_%d" % e.status)
+                response = error_response(e.status, e.reason, True)
+                break
+            if req is not None:
+                if instrument.ENABLED:
+                    t0 = ticks.ticks_us()
+                response = dispatch(req)
+                break
+            space = parser.space()
+            if not len(space):
+                response = error_response(413, "Payload Too Large", True)
+                break
+            n = conn.recv_into(space)
+            if not n:
+                return
+            parser.feed(n)
+        for chunk in response:
+            send_all(conn, chunk)
+        if req is not None and instrument.ENABLED:
+            instrument.stage(route_label(req)).record(ticks.ticks_diff(ticks.ticks_us(), t0))
+    except Exception as e:
+        print("Request error:", e)
+    finally:
+        try:
+            conn.close()
+        except:
+            pass